@@ -0,0 +1,102 @@
+"""
+Environment-driven database profiles for the RMASystem project.
+
+RMA_DB_PROFILE selects the profile:
+
+    sqlite    (default) a local SQLite file tuned for concurrent bench updates:
+              WAL journal, synchronous=NORMAL, a busy timeout and mmap I/O,
+              applied to every new connection by configure_sqlite_connection.
+    postgres  PostgreSQL with persistent, health-checked connections, or
+              psycopg's connection pool when RMA_POSTGRES_POOL is set.
+              Needs psycopg (psycopg[pool] for the pool) installed.
+
+Every value can be overridden with the RMA_* variables read below.
+"""
+
+import os
+
+from django.db.backends.signals import connection_created
+
+SQLITE_PRAGMAS_ENV = {
+    'journal_mode': ('RMA_SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': ('RMA_SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': ('RMA_SQLITE_BUSY_TIMEOUT_MS', '5000'),
+    'mmap_size': ('RMA_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+}
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_bool(name, default=False):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_list(name):
+    return [value.strip() for value in os.environ.get(name, '').split(',') if value.strip()]
+
+
+def sqlite_pragmas():
+    return {pragma: os.environ.get(env_name, default) for pragma, (env_name, default) in SQLITE_PRAGMAS_ENV.items()}
+
+
+def sqlite_database(base_dir):
+    busy_timeout_ms = int(sqlite_pragmas()['busy_timeout'])
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('RMA_SQLITE_PATH', str(base_dir / 'db.sqlite3')),
+        # Reuse the connection across requests instead of opening one per request
+        'CONN_MAX_AGE': env_int('RMA_DB_CONN_MAX_AGE', 60),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Python's sqlite3 busy handler, in seconds, matching PRAGMA busy_timeout
+            'timeout': busy_timeout_ms / 1000,
+            # Take the write lock when the transaction starts, so concurrent writers wait on the
+            # busy timeout instead of failing with "database is locked" on lock upgrade
+            'transaction_mode': os.environ.get('RMA_SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+        },
+    }
+
+
+def postgres_database():
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('RMA_POSTGRES_NAME', 'rmasystem'),
+        'USER': os.environ.get('RMA_POSTGRES_USER', 'rmasystem'),
+        'PASSWORD': os.environ.get('RMA_POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('RMA_POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('RMA_POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': env_int('RMA_DB_CONN_MAX_AGE', 600),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if env_bool('RMA_POSTGRES_POOL'):
+        # psycopg's pool manages the connections itself, Django requires CONN_MAX_AGE = 0 with it
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': env_int('RMA_POSTGRES_POOL_MIN_SIZE', 2),
+            'max_size': env_int('RMA_POSTGRES_POOL_MAX_SIZE', 10),
+            'timeout': env_int('RMA_POSTGRES_POOL_TIMEOUT', 10),
+        }
+    return database
+
+
+def database_settings(base_dir):
+    profile = os.environ.get('RMA_DB_PROFILE', 'sqlite').lower()
+    if profile == 'sqlite':
+        return {'default': sqlite_database(base_dir)}
+    if profile == 'postgres':
+        return {'default': postgres_database()}
+    raise ValueError(f'Unknown RMA_DB_PROFILE {profile!r}, expected "sqlite" or "postgres"')
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in sqlite_pragmas().items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+connection_created.connect(configure_sqlite_connection, dispatch_uid='rmasystem_configure_sqlite_connection')
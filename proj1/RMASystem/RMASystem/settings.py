@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .db_profiles import database_settings, env_bool, env_int, env_list
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -53,6 +56,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Opt-in per-request SQL and timing instrumentation, see product_management/middleware.py
+RMA_REQUEST_INSTRUMENTATION = env_bool('RMA_REQUEST_INSTRUMENTATION')
+RMA_SERVER_TIMING = env_bool('RMA_SERVER_TIMING')
+if RMA_REQUEST_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, 'product_management.middleware.RequestInstrumentationMiddleware')
+
+# Tokens of the scripts and bench terminals that call the JSON write endpoints (intake, transitions, archive, the work
+# queue, locations and task templates), comma-separated. They send "Authorization: Token <token>" instead of a CSRF
+# token, see ApiView in product_management/views.py. With no tokens set those endpoints answer 401
+RMA_API_TOKENS = env_list('RMA_API_TOKENS')
+
 ROOT_URLCONF = 'RMASystem.urls'
 
 TEMPLATES = [
@@ -76,12 +90,35 @@ WSGI_APPLICATION = 'RMASystem.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# The profile (tuned SQLite by default, or PostgreSQL) is chosen with RMA_DB_PROFILE, see RMASystem/db_profiles.py
+
+DATABASES = database_settings(BASE_DIR)
+
 
-DATABASES = {
+# Caches
+# product_snapshots holds the per-product read cache of product_management/snapshots.py: entries expire after
+# RMA_SNAPSHOT_CACHE_TTL seconds and the cache culls itself beyond RMA_SNAPSHOT_CACHE_MAX_ENTRIES entries.
+# status_graph holds the version key of the in-memory workflow graph (product_management/status_graph.py) and must be
+# shared by every worker process, so that an edit in one reaches the others, e.g.
+# RMA_SHARED_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache RMA_SHARED_CACHE_LOCATION=redis://127.0.0.1:6379
+# The LocMemCache default only fits a single process (runserver, tests), check --deploy warns about it
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'product_snapshots': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'product-snapshots',
+        'TIMEOUT': env_int('RMA_SNAPSHOT_CACHE_TTL', 300),
+        'OPTIONS': {
+            'MAX_ENTRIES': env_int('RMA_SNAPSHOT_CACHE_MAX_ENTRIES', 5000),
+        },
+    },
+    'status_graph': {
+        'BACKEND': os.environ.get('RMA_SHARED_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('RMA_SHARED_CACHE_LOCATION', 'status-graph'),
+    },
 }
 
 
@@ -127,3 +164,21 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # One JSON line per request when RMA_REQUEST_INSTRUMENTATION is on
+        'product_management.requests': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -1,5 +1,56 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList, ERROR_FLAG, IGNORED_PARAMS, PAGE_VAR, SEARCH_VAR
+from django.db import router
 from .models import Category, Location, Status, Task, StatusTask, Product, ProductTask, ProductStatus
+from .search import is_sn_prefix, sn_prefix_q, match_documents
+from .pagination import EstimatedCountPaginator, estimated_count
+from .admin_filters import AutocompleteFilter, autocomplete_filter_media
+from .counters import counted_total
+
+#the admin shows at most this many full-text matches
+ADMIN_SEARCH_LIMIT = 1000
+#query parameters of the changelist that do not narrow down its rows
+UNFILTERED_PARAMS = {*IGNORED_PARAMS, PAGE_VAR, ERROR_FLAG} - {SEARCH_VAR}
+
+
+#adds the media of the AutocompleteFilters in list_filter to the changelist
+class AutocompleteFilterAdmin(admin.ModelAdmin):
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, tuple) and issubclass(list_filter[1], AutocompleteFilter):
+                media += autocomplete_filter_media(self, list_filter[0])
+        return media
+
+
+#the changelist of a LargeTableAdmin loads only the fields in list_only, the change form still loads whole rows
+class ProjectedChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        return queryset.only(*self.model_admin.list_only) if self.model_admin.list_only else queryset
+
+
+#changelists of the large tables: rows come with their related objects in the same query (list_select_related),
+#projected to list_only, pages are counted by EstimatedCountPaginator, which uses count_hint() for the unfiltered
+#changelist, and the "N total" next to a filtered count, a second count of the whole table, is left out. Foreign
+#keys to large tables are filtered with AutocompleteFilter, so the queries of a page do not depend on its size
+class LargeTableAdmin(AutocompleteFilterAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_only = ()
+
+    def count_hint(self):
+        return estimated_count(self.model, router.db_for_read(self.model))
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        filtered = request.GET.get(SEARCH_VAR) or any(param not in UNFILTERED_PARAMS for param in request.GET)
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page, count_hint=None if filtered else self.count_hint
+        )
+
+    def get_changelist(self, request, **kwargs):
+        return ProjectedChangeList
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -11,6 +62,7 @@ class LocationAdmin(admin.ModelAdmin):
     list_display = ('rack_name', 'layer_number', 'space_number')
     search_fields = ('rack_name', 'layer_number', 'space_number')
     list_filter = ('rack_name', 'layer_number', 'space_number')
+    ordering = ('rack_name', 'layer_number', 'space_number')
 
 @admin.register(Status)
 class StatusAdmin(admin.ModelAdmin):
@@ -20,29 +72,82 @@ class StatusAdmin(admin.ModelAdmin):
 
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
-    list_display = ('action', 'description', 'result', 'note')
-    search_fields = ('action', 'description', 'result', 'note')
+    list_display = ('action', 'description')
+    search_fields = ('action', 'description')
 
 @admin.register(StatusTask)
-class StatusTaskAdmin(admin.ModelAdmin):
+class StatusTaskAdmin(AutocompleteFilterAdmin):
     list_display = ('status', 'task', 'is_predefined', 'order')
+    list_select_related = ('status', 'task')
     search_fields = ('status__name', 'task__action')
-    list_filter = ('status', 'task', 'is_predefined')
+    list_filter = ('status', ('task', AutocompleteFilter), 'is_predefined')
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ('SN', 'category', 'priority_level', 'description', 'current_status', 'current_task', 'location', 'created', 'modified')
-    search_fields = ('SN', 'category__name', 'description', 'current_status__name', 'current_task__action', 'location__rack_name')
-    list_filter = ('category', 'priority_level', 'current_status', 'location')
+    #no only() projection here, the FieldTracker of Product cannot load deferred fields
+    list_select_related = ('category', 'current_status', 'current_task', 'location')
+    search_fields = ('SN', 'description')
+    search_help_text = 'SN prefix, or words of the description and of task results and notes'
+    list_filter = ('category', 'priority_level', 'current_status', ('location', AutocompleteFilter))
+    autocomplete_fields = ('location', 'current_task')
+
+    #__str__ shows the status and task, this also serves the autocomplete of the product fields of the other admins.
+    #the changelist leaves out list_select_related once the queryset has a select_related, so it is repeated here
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
+    #the dashboard counters already know how many products there are
+    def count_hint(self):
+        return counted_total()
+
+    #answered from the SN range and the full-text index instead of LIKE scans over the joined tables
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if is_sn_prefix(search_term):
+            return queryset.filter(sn_prefix_q(search_term)), False
+        sns = {product_id for product_id, product_task_id in match_documents(search_term, ADMIN_SEARCH_LIMIT)}
+        return queryset.filter(SN__in=sns), False
+
+#the SN is the product's primary key, shown from the row itself instead of loading the product and its __str__
+@admin.display(description='product', ordering='product_id')
+def product_sn(obj):
+    return obj.product_id
 
 @admin.register(ProductTask)
-class ProductTaskAdmin(admin.ModelAdmin):
-    list_display = ('product', 'task', 'is_completed', 'is_skipped', 'is_predefined', 'created', 'modified')
-    search_fields = ('product__SN', 'task__action')
+class ProductTaskAdmin(LargeTableAdmin):
+    list_display = (product_sn, 'task', 'is_completed', 'is_skipped', 'is_predefined', 'created', 'modified')
+    list_select_related = ('task',)
+    #the columns, and __str__ for the action checkbox
+    list_only = (
+        'product', 'task__action', 'task__description', 'unique_id', 'is_completed', 'is_skipped', 'is_predefined',
+        'created', 'modified'
+    )
+    autocomplete_fields = ('product', 'task')
+    search_fields = ('product__SN', 'result', 'note')
+    search_help_text = 'SN prefix, or words of the task result and note'
     list_filter = ('is_completed', 'is_skipped', 'is_predefined')
 
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if is_sn_prefix(search_term):
+            return queryset.filter(sn_prefix_q(search_term, 'product_id')), False
+        ids = [
+            product_task_id
+            for product_id, product_task_id in match_documents(search_term, ADMIN_SEARCH_LIMIT, tasks_only=True)
+        ]
+        return queryset.filter(pk__in=ids), False
+
+
 @admin.register(ProductStatus)
-class ProductStatusAdmin(admin.ModelAdmin):
-    list_display = ('product', 'status', 'changed_at')
+class ProductStatusAdmin(LargeTableAdmin):
+    list_display = (product_sn, 'status', 'changed_at')
+    list_select_related = ('status',)
     search_fields = ('product__SN', 'status__name')
+    list_only = ('product', 'status__name', 'changed_at')
+    autocomplete_fields = ('product',)
     list_filter = ('status', 'changed_at')
@@ -0,0 +1,41 @@
+from django import forms
+from django.contrib.admin import RelatedFieldListFilter
+from django.contrib.admin.widgets import AutocompleteSelect
+
+
+#a list_filter for foreign keys to large tables: RelatedFieldListFilter loads every row of the related table to
+#list it in the sidebar, this one renders the admin's select2 autocomplete instead (the related model's admin needs
+#search_fields) and loads only the chosen row. admin_autocomplete_filter.js applies the choice, the ModelAdmin adds
+#the media of the widget, see autocomplete_filter_media
+class AutocompleteFilter(RelatedFieldListFilter):
+    template = 'admin/product_management/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.admin_site = model_admin.admin_site
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    #no rows are listed, only "All" and the empty choice are left
+    def field_choices(self, field, request, model_admin):
+        return []
+
+    def has_output(self):
+        return True
+
+    def widget_html(self):
+        form_field = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            to_field_name=self.field.target_field.name,
+            required=False,
+            widget=AutocompleteSelect(self.field, self.admin_site, attrs={
+                'data-filter-parameter': self.lookup_kwarg,
+                'data-filter-clear': self.lookup_kwarg_isnull,
+            }),
+        )
+        value = self.lookup_val[-1] if self.lookup_val else None
+        return form_field.widget.render(self.lookup_kwarg, value)
+
+
+def autocomplete_filter_media(model_admin, field_name):
+    field = model_admin.model._meta.get_field(field_name)
+    widget = AutocompleteSelect(field, model_admin.admin_site)
+    return widget.media + forms.Media(js=['product_management/admin_autocomplete_filter.js'])
@@ -0,0 +1,98 @@
+from django.db import transaction
+from .models import Location
+
+
+#hands out warehouse slots. Location.is_free is the free-slot index: a partial index over the free slots in
+#(rack_name, layer_number, space_number) order, so the nearest free slot is found with a few index seeks however
+#full the racks are. A slot is reserved with a conditional UPDATE that only succeeds while it is still free, so two
+#benches asking at the same time never get the same slot. Slots are taken and freed as products move: Product.save
+#through the post_save/post_delete signals, bulk_intake and bulk_transition directly.
+
+RESERVE_ATTEMPTS = 5
+
+
+def free_slots():
+    return Location.objects.filter(is_free=True)
+
+
+#nearest to near: the closest space on its layer, else the closest layer of its rack, the lowest space first.
+#without near, or when the rack of near is full, the first free slot of rack_name, or of any rack when rack_name
+#is None
+def find_free_location(rack_name=None, near=None, exclude=()):
+    slots = free_slots().exclude(pk__in=exclude)
+    if near is not None:
+        rack_slots = slots.filter(rack_name=near.rack_name)
+        layer_slots = rack_slots.filter(layer_number=near.layer_number)
+        candidates = [
+            layer_slots.filter(space_number__gte=near.space_number).order_by('space_number').first(),
+            layer_slots.filter(space_number__lt=near.space_number).order_by('-space_number').first(),
+        ]
+        candidates = [slot for slot in candidates if slot is not None]
+        if candidates:
+            return min(candidates, key=lambda slot: abs(slot.space_number - near.space_number))
+        candidates = [
+            rack_slots.filter(layer_number__gt=near.layer_number).order_by('layer_number', 'space_number').first(),
+            rack_slots.filter(layer_number__lt=near.layer_number).order_by('-layer_number', 'space_number').first(),
+        ]
+        candidates = [slot for slot in candidates if slot is not None]
+        if candidates:
+            return min(candidates, key=lambda slot: abs(slot.layer_number - near.layer_number))
+    if rack_name is not None:
+        slots = slots.filter(rack_name=rack_name)
+    return slots.order_by('rack_name', 'layer_number', 'space_number').first()
+
+
+#finds and reserves the nearest free slot, returns None when there is none left
+def reserve_location(rack_name=None, near=None):
+    taken = []
+    #another bench can reserve the slot between the read and the UPDATE, then the next nearest one is tried
+    for attempt in range(RESERVE_ATTEMPTS):
+        slot = find_free_location(rack_name, near, exclude=taken)
+        if slot is None:
+            return None
+        if Location.objects.filter(pk=slot.pk, is_free=True).update(is_free=False):
+            slot.is_free = False
+            return slot
+        taken.append(slot.pk)
+    return None
+
+
+#moves the product to the nearest free slot, the slot it had is freed when the product is saved
+@transaction.atomic
+def assign_location(product, rack_name=None, near=None):
+    slot = reserve_location(rack_name, near)
+    if slot is not None:
+        product.location = slot
+        product.save(update_fields=['location', 'modified'])
+    return slot
+
+
+#a product leaving the floor (a closed status) gives its slot back when it is saved
+def release_location(product):
+    product.location = None
+
+
+def occupy_locations(location_ids):
+    location_ids = [location_id for location_id in location_ids if location_id is not None]
+    if location_ids:
+        Location.objects.filter(pk__in=location_ids, is_free=True).update(is_free=False)
+
+
+def free_locations(location_ids):
+    location_ids = [location_id for location_id in location_ids if location_id is not None]
+    if location_ids:
+        Location.objects.filter(pk__in=location_ids, is_free=False).update(is_free=True)
+
+
+#keeps is_free in step with Product.location however the product was saved, the form and the admin included
+def product_location_saved(product, created):
+    if created:
+        occupy_locations([product.location_id])
+    elif product.tracker.has_changed('location'):
+        free_locations([product.tracker.previous('location')])
+        occupy_locations([product.location_id])
+
+
+#a soft-removed product keeps its slot, only deleting it for good frees the slot
+def product_location_deleted(product):
+    free_locations([product.location_id])
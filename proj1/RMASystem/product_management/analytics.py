@@ -0,0 +1,271 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from django.core.exceptions import ValidationError
+from django.db import NotSupportedError, connections, transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import Category, Product, ProductStatus, StatusDailyRollup
+from .status_graph import get_status_graph
+from .utilhelpers import PRIORITY_LEVEL_CHOICES
+
+
+#time-in-status analytics: every ProductStatus row starts an interval of its product in that status, ended by the
+#next row of the product (LEAD over the product's history). The intervals are aggregated by the database into
+#StatusDailyRollup rows, per UTC day, status, category and priority level, so the history is never loaded into
+#Python. Visits are grouped by the category and priority level the product had when it entered the status, kept on
+#its ProductStatus row, so a visit stays in one group from start to end and a refresh gives the rows of a rebuild.
+#Percentiles of days cannot be combined, those of a date range are computed from the intervals, see range_report.
+#A refresh recomputes the days from the last stored one on, from the history of the products that changed status
+#since then (productstatus_changed_idx), an interval that started before that is only counted where it ended
+
+ROLLUP_BATCH_SIZE = 1000
+REPORT_DAYS = 14
+DWELL_PERCENTILES = (('dwell_p50', 0.5), ('dwell_p90', 0.9), ('dwell_p95', 0.95))
+
+
+#the SQL expressions of the day of a timestamp and of the seconds between two, per database
+def vendor_expressions(connection):
+    if connection.vendor == 'postgresql':
+        return (
+            lambda column: f"({column} AT TIME ZONE 'UTC')::date",
+            lambda start, end: f'EXTRACT(EPOCH FROM ({end} - {start}))::float',
+        )
+    if connection.vendor == 'sqlite':
+        return (
+            lambda column: f'date({column})',
+            #julianday() is a float, rounded to the millisecond
+            lambda start, end: f'ROUND((julianday({end}) - julianday({start})) * 86400.0, 3)',
+        )
+    raise NotSupportedError(f'Status analytics are not supported on {connection.vendor}')
+
+
+def as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+#the intervals of the products with history since since (and before until): status, category, priority level,
+#start and end (NULL while the product is still in the status). History written before the groups were kept on it
+#falls back to the product's
+def intervals_cte(connection, until=False):
+    history = connection.ops.quote_name(ProductStatus._meta.db_table)
+    product = connection.ops.quote_name(Product._meta.db_table)
+    sn = connection.ops.quote_name(Product._meta.pk.column)
+    return (
+        f'WITH intervals AS ('
+        f'SELECT h.status_id, COALESCE(h.category_id, p.category_id) AS category_id, '
+        f"COALESCE(NULLIF(h.priority_level, ''), p.priority_level) AS priority_level, h.changed_at AS started, "
+        f'LEAD(h.changed_at) OVER (PARTITION BY h.product_id ORDER BY h.changed_at, h.id) AS ended '
+        f'FROM {history} h JOIN {product} p ON p.{sn} = h.product_id '
+        f'WHERE h.product_id IN (SELECT product_id FROM {history} WHERE changed_at >= %s'
+        f'{" AND changed_at < %s" if until else ""}))'
+    )
+
+
+#{(day, status_id, category_id, priority_level): count} of the intervals started since since
+def entered_counts(connection, since):
+    day = vendor_expressions(connection)[0]
+    sql = (
+        f'{intervals_cte(connection)} '
+        f'SELECT {day("started")} AS day, status_id, category_id, priority_level, COUNT(*) FROM intervals '
+        f'WHERE started >= %s GROUP BY 1, 2, 3, 4'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [since, since])
+        return {(as_date(row[0]),) + tuple(row[1:4]): row[4] for row in cursor.fetchall()}
+
+
+#{(day, status_id, category_id, priority_level): (count, avg, p50, p90, p95, max)} of the intervals ended since
+#since (and before until), without the day when by_day is false. The percentiles are nearest-rank: the smallest
+#duration with a rank of at least p * count
+def exit_stats(connection, since, until=None, by_day=True):
+    day, seconds = vendor_expressions(connection)
+    group = 'day, status_id, category_id, priority_level' if by_day else 'status_id, category_id, priority_level'
+    percentiles = ', '.join(
+        f'MIN(CASE WHEN rn >= {fraction} * total THEN seconds END)' for field, fraction in DWELL_PERCENTILES
+    )
+    bounds = [since] if until is None else [since, until]
+    sql = (
+        f'{intervals_cte(connection, until=until is not None)}, '
+        f'exits AS (SELECT {day("ended")} AS day, status_id, category_id, priority_level, '
+        f'{seconds("started", "ended")} AS seconds FROM intervals '
+        f'WHERE ended >= %s{"" if until is None else " AND ended < %s"}), '
+        f'ranked AS (SELECT {group}, seconds, '
+        f'ROW_NUMBER() OVER (PARTITION BY {group} ORDER BY seconds) AS rn, '
+        f'COUNT(*) OVER (PARTITION BY {group}) AS total FROM exits) '
+        f'SELECT {group}, COUNT(*), AVG(seconds), {percentiles}, MAX(seconds) FROM ranked GROUP BY {group}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, bounds + bounds)
+        if not by_day:
+            return {tuple(row[:3]): tuple(row[3:]) for row in cursor.fetchall()}
+        return {(as_date(row[0]),) + tuple(row[1:4]): tuple(row[4:]) for row in cursor.fetchall()}
+
+
+def start_of_day(day, connection):
+    return connection.ops.adapt_datetimefield_value(datetime.combine(day, time.min, tzinfo=dt_timezone.utc))
+
+
+#recomputes the rollups of the days from since (default: the last stored day) to today and returns the number of
+#rollup rows written. The units in a status at the end of a day carry over from the rollups of the day before since,
+#so since can go back but not skip stored days. full, or a since before the first stored day, rebuilds every day
+#from the first day of history
+def refresh_rollups(since=None, full=False, using='default'):
+    connection = connections[using]
+    today = timezone.now().astimezone(dt_timezone.utc).date()
+    rollups = StatusDailyRollup.objects.using(using)
+    stored = rollups.aggregate(first_day=Min('day'), last_day=Max('day'))
+    if stored['last_day'] is None or (since is not None and since < stored['first_day']):
+        full = True
+    if full:
+        first_change = ProductStatus.objects.using(using).aggregate(first_change=Min('changed_at'))['first_change']
+        since = first_change.astimezone(dt_timezone.utc).date() if first_change else today
+    elif since is None or since > stored['last_day']:
+        since = stored['last_day']
+
+    start = start_of_day(since, connection)
+    status_graph = get_status_graph()
+    with transaction.atomic(using=using):
+        entered = entered_counts(connection, start)
+        exited = exit_stats(connection, start)
+        #(status_id, category_id, priority_level) -> units in the status, closed statuses are not counted
+        wip = defaultdict(int)
+        if not full:
+            wip.update(
+                ((status_id, category_id, priority_level), count)
+                for status_id, category_id, priority_level, count in rollups.filter(
+                    day=since - timedelta(days=1), wip__gt=0
+                ).values_list('status_id', 'category_id', 'priority_level', 'wip')
+            )
+        (rollups.all() if full else rollups.filter(day__gte=since)).delete()
+
+        activity = defaultdict(set)
+        for key in [*entered, *exited]:
+            activity[key[0]].add(key[1:])
+
+        rows = []
+        day = since
+        while day <= today:
+            for group in set(wip) | activity.pop(day, set()):
+                count = entered.get((day,) + group, 0)
+                exits = exited.get((day,) + group)
+                status = status_graph.get_status(group[0])
+                if status is not None and not status.is_closed:
+                    wip[group] += count - (exits[0] if exits else 0)
+                in_status = wip[group] if wip.get(group, 0) > 0 else 0
+                if not in_status:
+                    wip.pop(group, None)
+                row = StatusDailyRollup(
+                    day=day, status_id=group[0], category_id=group[1], priority_level=group[2],
+                    entered=count, exited=exits[0] if exits else 0, wip=in_status
+                )
+                if exits:
+                    row.dwell_avg, row.dwell_p50, row.dwell_p90, row.dwell_p95, row.dwell_max = exits[1:]
+                if count or exits or in_status:
+                    rows.append(row)
+            day += timedelta(days=1)
+        rollups.bulk_create(rows, batch_size=ROLLUP_BATCH_SIZE)
+    return len(rows)
+
+
+#filters of the report come as strings (query parameters), returns the keyword arguments of rollup_report. The
+#report covers the last REPORT_DAYS days unless start and end are given, both inclusive
+def parse_report_filters(params):
+    filters = {}
+    errors = {}
+    for name in ('status', 'category'):
+        if params.get(name):
+            filters[name] = params[name]
+    if params.get('priority'):
+        if params['priority'] in PRIORITY_LEVEL_CHOICES:
+            filters['priority_level'] = params['priority']
+        else:
+            errors['priority'] = [f'Unknown priority level {params["priority"]}']
+    for name in ('start', 'end'):
+        if params.get(name):
+            try:
+                filters[name] = parse_date(params[name])
+            except ValueError:
+                filters[name] = None
+            if filters[name] is None:
+                errors[name] = [f'{params[name]} is not a date (YYYY-MM-DD)']
+    if errors:
+        raise ValidationError(errors)
+    filters.setdefault('end', timezone.now().astimezone(dt_timezone.utc).date())
+    filters.setdefault('start', filters['end'] - timedelta(days=REPORT_DAYS - 1))
+    return filters
+
+
+#the stored rollups of the days from start to end, newest first, status and category are names
+def rollup_report(start, end, status=None, category=None, priority_level=None):
+    rollups = StatusDailyRollup.objects.filter(day__gte=start, day__lte=end).select_related('status', 'category')
+    if status:
+        rollups = rollups.filter(status__name=status)
+    if category:
+        rollups = rollups.filter(category__name=category)
+    if priority_level:
+        rollups = rollups.filter(priority_level=priority_level)
+    return rollups.order_by('-day', 'status__name', 'category__name', 'priority_level')
+
+
+#the days from start to end as a whole, per status, category and priority level: the units that entered and left
+#(from the rollups) and the time in status of those that left, with percentiles over the whole range computed from
+#the intervals of the products that changed status in it
+def range_report(start, end, status=None, category=None, priority_level=None, using='default'):
+    connection = connections[using]
+    stats = exit_stats(
+        connection, start_of_day(start, connection), start_of_day(end + timedelta(days=1), connection), by_day=False
+    )
+    rollups = StatusDailyRollup.objects.using(using).filter(day__gte=start, day__lte=end)
+    entered = {
+        (row['status_id'], row['category_id'], row['priority_level']): row['entered']
+        for row in rollups.values('status_id', 'category_id', 'priority_level').annotate(entered=Sum('entered')).order_by()
+    }
+
+    status_graph = get_status_graph()
+    categories = Category.objects.using(using).in_bulk()
+    rows = []
+    for group in entered.keys() | stats.keys():
+        status_id, category_id, level = group
+        row_status = status_graph.get_status(status_id)
+        row_category = categories.get(category_id)
+        if row_status is None or row_category is None:
+            continue
+        if (status and row_status.name != status) or (category and row_category.name != category) or (
+            priority_level and level != priority_level
+        ):
+            continue
+        exits = stats.get(group)
+        rows.append({
+            'status': row_status.name,
+            'category': row_category.name,
+            'priority_level': PRIORITY_LEVEL_CHOICES[level] if level in PRIORITY_LEVEL_CHOICES else level,
+            'entered': entered.get(group, 0),
+            'exited': exits[0] if exits else 0,
+            'dwell_hours': dwell_summary(exits[1:] if exits else (None,) * 5),
+        })
+    return sorted(rows, key=lambda row: (row['status'], row['category'], row['priority_level']))
+
+
+def dwell_hours(seconds):
+    return None if seconds is None else round(seconds / 3600, 1)
+
+
+#(avg, p50, p90, p95, max) in seconds, as hours
+def dwell_summary(dwell):
+    return dict(zip(('avg', 'p50', 'p90', 'p95', 'max'), (dwell_hours(seconds) for seconds in dwell)))
+
+
+def rollup_data(rollup):
+    return {
+        'day': rollup.day,
+        'status': rollup.status.name,
+        'category': rollup.category.name,
+        'priority_level': rollup.get_priority_level_display(),
+        'entered': rollup.entered,
+        'exited': rollup.exited,
+        'wip': rollup.wip,
+        'dwell_hours': dwell_summary(
+            (rollup.dwell_avg, rollup.dwell_p50, rollup.dwell_p90, rollup.dwell_p95, rollup.dwell_max)
+        ),
+    }
@@ -0,0 +1,164 @@
+import hashlib
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from .models import Product, Status, Task
+from .snapshots import aget_product_snapshot, current_task_snapshot
+from .status_graph import get_status_graph
+
+
+#async read-only JSON API polled by the bench terminals, served by asgi.py. Every handler first works out the
+#timestamps its answer depends on (TimeStampedModel.modified) and answers 304 Not Modified when the terminal's
+#If-None-Match / If-Modified-Since still match, so polling an unchanged unit serializes nothing.
+
+QUEUE_MAX_COUNT = 50
+
+
+#the ETag is a digest of everything the answer depends on, Last-Modified the newest timestamp among them
+def validators(*parts, last_modified=None):
+    etag = quote_etag(hashlib.md5('-'.join(str(part) for part in parts).encode(), usedforsecurity=False).hexdigest())
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    #terminals must revalidate every poll, the validators keep it cheap
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+#snapshots come from the per-product cache (snapshots.py), a poll of a cached unit runs no query at all
+async def product_snapshot(sn):
+    snapshot = await aget_product_snapshot(sn)
+    if snapshot is None:
+        raise Http404(f'No product with SN {sn}')
+    return snapshot
+
+
+class BenchApiView(View):
+    http_method_names = ['get', 'head', 'options']
+
+    #returns the 304 response when the terminal's copy is still current, else None
+    def not_modified(self, etag, last_modified):
+        return get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+
+
+class BenchProductView(BenchApiView):
+    async def get(self, request, sn):
+        snapshot = await product_snapshot(sn)
+        modified = snapshot['modified']
+        etag, last_modified = validators('product', sn, modified.timestamp(), last_modified=modified)
+        if response := self.not_modified(etag, last_modified):
+            return response
+
+        return with_validators(JsonResponse({
+            'SN': snapshot['SN'],
+            'category': snapshot['category']['name'],
+            'priority_level': snapshot['priority_level'],
+            'description': snapshot['description'],
+            'current_status': snapshot['current_status']['name'] if snapshot['current_status'] else None,
+            'current_task': snapshot['current_task']['action'] if snapshot['current_task'] else None,
+            'location': snapshot['location'],
+            'claimed_by': snapshot['claimed_by'],
+            'claimed_until': snapshot['claimed_until'],
+            'modified': modified,
+        }), etag, last_modified)
+
+
+class BenchCurrentTaskView(BenchApiView):
+    async def get(self, request, sn):
+        snapshot = await product_snapshot(sn)
+        #the result and note change on the task row without touching the product
+        product_task = current_task_snapshot(snapshot)
+        modified = max(snapshot['modified'], product_task['modified']) if product_task else snapshot['modified']
+        etag, last_modified = validators(
+            'current-task', sn, snapshot['modified'].timestamp(),
+            product_task['id'] if product_task else 'none', modified.timestamp(),
+            last_modified=modified
+        )
+        if response := self.not_modified(etag, last_modified):
+            return response
+
+        current_task = None
+        if product_task is not None:
+            current_task = {key: value for key, value in product_task.items() if key not in ('task_id', 'modified')}
+        return with_validators(JsonResponse({'SN': sn, 'current_task': current_task}), etag, last_modified)
+
+
+class BenchNextStatusesView(BenchApiView):
+    async def get(self, request, sn):
+        snapshot = await product_snapshot(sn)
+        #the workflow graph is cached in memory, its version token changes with every Status/StatusTransition edit
+        status_graph = await sync_to_async(get_status_graph)()
+        etag, last_modified = validators(
+            'next-statuses', sn, snapshot['modified'].timestamp(), status_graph.version,
+            last_modified=snapshot['modified']
+        )
+        if response := self.not_modified(etag, last_modified):
+            return response
+
+        current_status_id = snapshot['current_status']['id'] if snapshot['current_status'] else None
+        next_statuses = status_graph.get_possible_next_statuses(current_status_id)
+        return with_validators(JsonResponse({
+            'SN': sn,
+            'next_statuses': [
+                {'id': status.pk, 'name': status.name, 'is_closed': status.is_closed} for status in next_statuses
+            ],
+        }), etag, last_modified)
+
+
+class BenchQueueView(BenchApiView):
+    #the next unclaimed units of the work queue, ?status=<name>&task=<id>&count=<n>, read only: claiming
+    #stays with the queue/claim/ endpoint
+    async def get(self, request):
+        try:
+            count = int(request.GET.get('count', 10))
+        except ValueError:
+            count = 0
+        if not 1 <= count <= QUEUE_MAX_COUNT:
+            return JsonResponse({'errors': {'count': [f'count must be between 1 and {QUEUE_MAX_COUNT}']}}, status=400)
+
+        status = task = None
+        if request.GET.get('status'):
+            status = await Status.objects.filter(name=request.GET['status']).afirst()
+            if status is None:
+                return JsonResponse({'errors': {'status': [f'Unknown status {request.GET["status"]}']}}, status=400)
+        if request.GET.get('task'):
+            task = await Task.objects.filter(pk=request.GET['task']).afirst() if request.GET['task'].isdigit() else None
+            if task is None:
+                return JsonResponse({'errors': {'task': [f'Unknown task {request.GET["task"]}']}}, status=400)
+
+        now = timezone.now()
+        queue = Product.objects.work_queue(status, task).filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+        ).values(
+            'SN', 'priority_level', 'current_status__name', 'current_task__action', 'created', 'modified'
+        )[:count]
+        units = [unit async for unit in queue]
+        #the queue changes when a unit enters, leaves or is modified, the SNs and timestamps cover all three
+        etag, last_modified = validators(
+            'queue', status.pk if status else '', task.pk if task else '',
+            *(f'{unit["SN"]}:{unit["modified"].timestamp()}' for unit in units),
+            last_modified=max((unit['modified'] for unit in units), default=None)
+        )
+        if response := self.not_modified(etag, last_modified):
+            return response
+
+        return with_validators(JsonResponse({
+            'units': [
+                {
+                    'SN': unit['SN'],
+                    'priority_level': unit['priority_level'],
+                    'current_status': unit['current_status__name'],
+                    'current_task': unit['current_task__action'],
+                    'created': unit['created'],
+                }
+                for unit in units
+            ],
+        }), etag, last_modified)
@@ -0,0 +1,254 @@
+import asyncio
+import random
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .models import Category, Status, StatusTransition, Task, StatusTask, Product, ProductTask
+from .status_graph import get_status_graph
+from .middleware import percentile
+
+
+#query-count and latency benchmarks of the product lifecycle, run by the run_benchmarks command on a test database.
+#every scenario reports the average number of queries and seconds per operation, so results of runs with the same
+#config can be compared with a stored baseline
+
+DEFAULT_CONFIG = {
+    'categories': 5,
+    'statuses': 8,
+    'transitions_per_status': 2,
+    'tasks_per_status': 4,
+    'products': 500,
+    'history_depth': 4,
+    'intake_batch': 200,
+    'repeat': 10,
+    'seed': 0,
+}
+
+
+BATCH_TRANSITION_SIZE = 10
+#idle products used by every repetition: one each by task_complete, task_skip and status_transition and a batch by
+#batch_transition. Half of the products walk down the chain, the other half are idle
+IDLE_PRODUCTS_PER_REPEAT = 3 + BATCH_TRANSITION_SIZE
+
+
+def generate_dataset(config):
+    rng = random.Random(config['seed'])
+    categories = Category.objects.bulk_create(
+        [Category(name=f'Category {i}') for i in range(config['categories'])]
+    )
+
+    #a chain of statuses from RMA Sorting to a closed status, plus random extra transitions between them
+    statuses = [Status.objects.get_or_create(name='RMA Sorting')[0]]
+    for i in range(1, config['statuses']):
+        is_closed = i == config['statuses'] - 1
+        statuses.append(Status.objects.create(name=f'Status {i}', is_closed=is_closed))
+    for i, from_status in enumerate(statuses[:-1]):
+        to_statuses = {statuses[i + 1]}
+        while len(to_statuses) < min(config['transitions_per_status'], len(statuses) - 1):
+            to_statuses.add(rng.choice(statuses[1:]))
+        for to_status in sorted(to_statuses - {from_status}, key=lambda status: status.pk):
+            StatusTransition.objects.create(from_status=from_status, to_status=to_status)
+
+    for status in statuses[:-1]:
+        for j in range(config['tasks_per_status']):
+            task = Task.objects.create(action=f'{status.name} task {j}')
+            StatusTask.objects.create(status=status, task=task)
+
+    sns = [str(1000000000000 + i) for i in range(config['products'])]
+    Product.objects.bulk_intake([
+        {
+            'SN': sn,
+            'category': rng.choice(categories),
+            'priority_level': rng.choice(['normal', 'normal', 'hot', 'zfa']),
+        }
+        for sn in sns
+    ])
+
+    #half of the products walk down the chain to build up status history
+    walking_sns = sns[:len(sns) // 2]
+    for to_status in statuses[1:config['history_depth'] + 1]:
+        if to_status.is_closed:
+            break
+        Product.objects.bulk_transition(walking_sns, to_status)
+    return {'categories': categories, 'statuses': statuses, 'sns': sns, 'walking_sns': walking_sns}
+
+
+def measure(operation, repeat):
+    #operation(i) runs the i-th repetition and returns a callable for the part to be measured
+    queries = 0
+    seconds = 0.0
+    for i in range(repeat):
+        measured = operation(i)
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            measured()
+            seconds += time.perf_counter() - start
+        queries += len(context.captured_queries)
+    return {'queries': queries / repeat, 'seconds': seconds / repeat}
+
+
+def run_benchmarks(config):
+    config = {**DEFAULT_CONFIG, **config}
+    idle_needed = config['repeat'] * IDLE_PRODUCTS_PER_REPEAT
+    if config['products'] - config['products'] // 2 < idle_needed:
+        raise ValueError(f'products must be at least {idle_needed * 2 - 1} for {config["repeat"]} repetitions')
+    dataset = generate_dataset(config)
+    repeat = config['repeat']
+    statuses = dataset['statuses']
+    fresh_sns = iter(str(2000000000000 + i) for i in range(10 ** 6))
+    #products still in RMA Sorting with their predefined tasks, each scenario works on its own slice
+    idle_sns = iter(dataset['sns'][len(dataset['walking_sns']):])
+
+    def active_current_task(sn):
+        product = Product.objects.get(SN=sn)
+        return ProductTask.objects.get(product=product, task_id=product.current_task_id, is_completed=False, is_skipped=False)
+
+    def intake_bulk(i):
+        rows = [{'SN': next(fresh_sns), 'category': dataset['categories'][0]} for j in range(config['intake_batch'])]
+        return lambda: Product.objects.bulk_intake(rows)
+
+    def intake_save(i):
+        product = Product(SN=next(fresh_sns), category=dataset['categories'][0])
+        return product.save
+
+    def task_complete(i):
+        product_task = active_current_task(next(idle_sns))
+        return lambda: product_task.update_task(is_now_completed=True, result='Benchmark result')
+
+    def task_skip(i):
+        product_task = active_current_task(next(idle_sns))
+        return product_task.skip_task
+
+    def status_transition(i):
+        product = Product.objects.get(SN=next(idle_sns))
+        product.current_status = get_status_graph().get_possible_next_statuses(product.current_status_id)[0]
+        return product.save
+
+    def batch_transition(i):
+        sns = [next(idle_sns) for j in range(BATCH_TRANSITION_SIZE)]
+        return lambda: Product.objects.bulk_transition(sns, statuses[1])
+
+    def history_render(i):
+        product = Product.objects.get(SN=dataset['walking_sns'][i])
+        return product.list_status_result_history
+
+    client = Client()
+    user = get_user_model().objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+    client.force_login(user)
+
+    def get_page(url):
+        def request():
+            response = client.get(url)
+            assert response.status_code == 200, f'{url} returned {response.status_code}'
+        return request
+
+    scenarios = {
+        'intake_bulk': intake_bulk,
+        'intake_save': intake_save,
+        'task_complete': task_complete,
+        'task_skip': task_skip,
+        'status_transition': status_transition,
+        'batch_transition': batch_transition,
+        'history_render': history_render,
+        'detail_view': lambda i: get_page(reverse('product_detail', kwargs={'sn': dataset['walking_sns'][i]})),
+        #the same pages again, now answered from the product snapshot cache
+        'detail_view_cached': lambda i: get_page(reverse('product_detail', kwargs={'sn': dataset['walking_sns'][i]})),
+        'list_view': lambda i: get_page(reverse('products')),
+        'admin_changelist': lambda i: get_page(reverse('admin:product_management_product_changelist')),
+        'admin_task_changelist': lambda i: get_page(reverse('admin:product_management_producttask_changelist')),
+        'admin_status_changelist': lambda i: get_page(reverse('admin:product_management_productstatus_changelist')),
+    }
+    results = {name: measure(operation, repeat) for name, operation in scenarios.items()}
+    return {'config': config, 'results': results}
+
+
+#returns the list of regressions of results against baseline: more queries than the baseline plus query_tolerance,
+#or slower than the baseline times time_ratio (skipped when time_ratio is None)
+def compare_with_baseline(results, baseline, query_tolerance=0, time_ratio=None):
+    regressions = []
+    if results['config'] != baseline['config']:
+        regressions.append('config differs from the baseline, results are not comparable')
+        return regressions
+    for name, expected in baseline['results'].items():
+        actual = results['results'].get(name)
+        if actual is None:
+            regressions.append(f'{name}: missing from the results')
+            continue
+        if actual['queries'] > expected['queries'] + query_tolerance:
+            regressions.append(f'{name}: {actual["queries"]:g} queries, baseline {expected["queries"]:g}')
+        if time_ratio is not None and actual['seconds'] > expected['seconds'] * time_ratio:
+            regressions.append(f'{name}: {actual["seconds"]:.4f}s, baseline {expected["seconds"]:.4f}s')
+    return regressions
+
+
+#concurrent polling of the async bench terminal API (api.py): every client polls random units of sns and sends back
+#the ETag it got for a URL, like a terminal would, so the mix of 200 and 304 answers is realistic.
+#fetch(path, etag) is a coroutine returning (status code, ETag)
+BENCH_API_URL_NAMES = ('bench_product', 'bench_current_task', 'bench_next_statuses', 'bench_queue')
+
+
+async def poll_bench_api(fetch, sns, clients, requests_per_client, seed=0):
+    latencies = []
+    status_codes = Counter()
+
+    async def terminal(i):
+        rng = random.Random(seed + i)
+        etags = {}
+        for j in range(requests_per_client):
+            url_name = rng.choice(BENCH_API_URL_NAMES)
+            path = reverse(url_name) if url_name == 'bench_queue' else reverse(url_name, kwargs={'sn': rng.choice(sns)})
+            start = time.perf_counter()
+            status_code, etag = await fetch(path, etags.get(path))
+            latencies.append((time.perf_counter() - start) * 1000)
+            status_codes[status_code] += 1
+            if etag:
+                etags[path] = etag
+
+    start = time.perf_counter()
+    await asyncio.gather(*(terminal(i) for i in range(clients)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'clients': clients,
+        'requests': len(latencies),
+        'seconds': seconds,
+        'requests_per_second': len(latencies) / seconds,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'max': latencies[-1],
+        },
+        'status_codes': {str(status_code): count for status_code, count in sorted(status_codes.items())},
+    }
+
+
+#in-process stand-in for an ASGI server: requests go through Django's ASGI handler like under uvicorn or daphne
+def asgi_fetcher():
+    client = AsyncClient()
+
+    async def fetch(path, etag):
+        response = await client.get(path, headers={'If-None-Match': etag} if etag else {})
+        return response.status_code, response.get('ETag')
+    return fetch
+
+
+#a running server, e.g. uvicorn RMASystem.asgi:application, each request in a worker thread
+def http_fetcher(base_url):
+    def get(path, etag):
+        request = urllib.request.Request(base_url.rstrip('/') + path, headers={'If-None-Match': etag} if etag else {})
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status, response.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('ETag')
+
+    async def fetch(path, etag):
+        return await asyncio.to_thread(get, path, etag)
+    return fetch
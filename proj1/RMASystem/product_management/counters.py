@@ -0,0 +1,175 @@
+from collections import Counter
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from .models import Location, Product, ProductCounter
+from .utilhelpers import PRIORITY_LEVEL_CHOICES
+
+
+#the dashboard counters of ProductCounter, one row per (status, priority level, rack). Every path that moves a live
+#product between keys applies a +1/-1 delta: Product.save and soft-delete through the post_save/post_delete signals,
+#bulk_intake, bulk_transition, bulk_archive and bulk_restore directly. Writes that skip both, like QuerySet.update()
+#or the soft-delete of a whole queryset, leave the counters behind until the reconcile_dashboard_counters command
+#rebuilds them.
+
+NO_RACK = ''
+#the fields of Product that decide its counter key
+COUNTED_FIELDS = {'current_status', 'priority_level', 'location', 'is_removed'}
+
+
+def rack_names(location_ids):
+    location_ids = {location_id for location_id in location_ids if location_id is not None}
+    if not location_ids:
+        return {}
+    return dict(Location.objects.filter(pk__in=location_ids).values_list('pk', 'rack_name'))
+
+
+#location_deltas maps (status_id, priority_level, location_id) to a change of the count, the locations are resolved
+#to their racks with one query, and keys whose changes cancel out are not written
+def apply_location_deltas(location_deltas, known_racks=None):
+    racks = dict(known_racks or {})
+    racks.update(rack_names(key[2] for key in location_deltas if key[2] not in racks))
+    deltas = Counter()
+    for (status_id, priority_level, location_id), delta in location_deltas.items():
+        deltas[(status_id, priority_level, racks.get(location_id, NO_RACK))] += delta
+    apply_deltas(deltas)
+
+
+def apply_deltas(deltas):
+    for (status_id, priority_level, rack_name), delta in deltas.items():
+        if not delta or status_id is None:
+            continue
+        counter = ProductCounter.objects.filter(status_id=status_id, priority_level=priority_level, rack_name=rack_name)
+        if not counter.update(count=F('count') + delta):
+            #first product of this key, another writer may be creating the row at the same time
+            ProductCounter.objects.bulk_create(
+                [ProductCounter(status_id=status_id, priority_level=priority_level, rack_name=rack_name)],
+                ignore_conflicts=True
+            )
+            counter.update(count=F('count') + delta)
+
+
+def counter_key(product):
+    return (product.current_status_id, product.priority_level, product.location_id)
+
+
+#for products inserted with bulk_create
+def products_added(products):
+    apply_location_deltas(Counter(counter_key(product) for product in products if not product.is_removed))
+
+
+#for products archived with bulk_update, products_added counts them back when they are restored
+def products_removed(products):
+    location_deltas = Counter()
+    location_deltas.subtract(counter_key(product) for product in products)
+    apply_location_deltas(location_deltas)
+
+
+#for products updated with bulk_update, old_keys are their counter_key() from before the change
+def products_moved(old_keys, products):
+    location_deltas = Counter(counter_key(product) for product in products)
+    location_deltas.subtract(old_keys)
+    apply_location_deltas(location_deltas)
+
+
+def product_saved(product, created):
+    changed = product.tracker.changed()
+    if not created and not changed.keys() & COUNTED_FIELDS:
+        return
+    location_deltas = Counter()
+    if not created and not changed.get('is_removed', product.is_removed):
+        old_key = (
+            changed.get('current_status', product.current_status_id),
+            changed.get('priority_level', product.priority_level),
+            changed.get('location', product.location_id),
+        )
+        location_deltas[old_key] -= 1
+    if not product.is_removed:
+        location_deltas[counter_key(product)] += 1
+    apply_location_deltas(location_deltas, known_racks=cached_rack(product))
+
+
+def product_deleted(product):
+    #a soft-removed product was already taken off when it was removed
+    if not product.is_removed:
+        apply_location_deltas(
+            Counter({counter_key(product): -1}),
+            known_racks=cached_rack(product)
+        )
+
+
+#a location loaded with the product saves the rack lookup
+def cached_rack(product):
+    if product.location_id is not None and Product.location.is_cached(product):
+        return {product.location_id: product.location.rack_name}
+    return {}
+
+
+#the counts of the products, from scratch, as {(status_id, priority_level, rack_name): count}
+def count_products():
+    rows = Product.objects.filter(current_status__isnull=False).values_list(
+        'current_status', 'priority_level', 'location__rack_name'
+    ).annotate(count=Count('SN')).order_by()
+    counts = Counter()
+    for status_id, priority_level, rack_name, count in rows:
+        counts[(status_id, priority_level, rack_name or NO_RACK)] += count
+    return counts
+
+
+def stored_counts():
+    return Counter({
+        (status_id, priority_level, rack_name): count
+        for status_id, priority_level, rack_name, count in ProductCounter.objects.values_list(
+            'status_id', 'priority_level', 'rack_name', 'count'
+        )
+        if count
+    })
+
+
+#the keys whose stored count is off, as {key: (stored, actual)}
+def counter_drift(actual=None):
+    actual = count_products() if actual is None else actual
+    stored = stored_counts()
+    return {key: (stored[key], actual[key]) for key in stored.keys() | actual.keys() if stored[key] != actual[key]}
+
+
+#rebuilds the counters from the products, returns the drift that was fixed
+@transaction.atomic
+def reconcile_counters(batch_size=500):
+    #lock the counters first, so deltas of concurrent writers wait for the rebuild
+    list(ProductCounter.objects.select_for_update().values_list('pk'))
+    actual = count_products()
+    drift = counter_drift(actual)
+    ProductCounter.objects.all().delete()
+    ProductCounter.objects.bulk_create(
+        [
+            ProductCounter(status_id=status_id, priority_level=priority_level, rack_name=rack_name, count=count)
+            for (status_id, priority_level, rack_name), count in actual.items()
+        ],
+        batch_size=batch_size
+    )
+    return drift
+
+
+#the number of live products with a status, read from the counter rows only
+def counted_total():
+    return ProductCounter.objects.aggregate(total=Sum('count'))['total'] or 0
+
+
+#the dashboard totals, read from the counter rows only
+def dashboard_counts():
+    by_status = {}
+    by_priority = Counter()
+    by_rack = Counter()
+    total = 0
+    for counter in ProductCounter.objects.select_related('status').filter(count__gt=0).order_by('status__name'):
+        by_status.setdefault(counter.status, 0)
+        by_status[counter.status] += counter.count
+        by_priority[counter.priority_level] += counter.count
+        by_rack[counter.rack_name] += counter.count
+        total += counter.count
+    return {
+        'total': total,
+        'by_status': list(by_status.items()),
+        'by_priority': [(label, by_priority[level]) for level, label in PRIORITY_LEVEL_CHOICES if by_priority[level]],
+        'by_rack': sorted(by_rack.items()),
+    }
@@ -0,0 +1,147 @@
+from datetime import timedelta
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import ProductEvent
+from .status_graph import get_status_graph
+from .utilhelpers import EVENT_KIND_CHOICES
+
+
+#the product event log behind the change feed (events/?after=<sequence>): status changes, location changes,
+#archiving and restoring and task outcomes are appended in the transaction of the change itself, by Product.save,
+#ProductTask.update_task and skip_task, and by bulk_intake, bulk_transition, bulk_archive and bulk_restore, so an
+#event exists exactly when its change was committed.
+#Consumers keep the sequence of the last event they read and ask for the events after it.
+#The sequence is the auto-incremented id, which concurrent transactions can commit out of order: the feed stops at
+#a missing id for FEED_SETTLE_SECONDS, the transaction that holds it may still commit, older gaps are events that
+#were rolled back or compacted away.
+
+FEED_BATCH_SIZE = 500
+FEED_MAX_BATCH_SIZE = 5000
+FEED_SETTLE_SECONDS = 10
+COMPACT_BATCH_SIZE = 1000
+
+
+def status_reference(status_id):
+    if status_id is None:
+        return None
+    status = get_status_graph().get_status(status_id)
+    return {'id': status_id, 'name': status.name if status else None}
+
+
+def status_changed(product, from_status_id):
+    return ProductEvent(
+        product_sn=product.SN,
+        kind=EVENT_KIND_CHOICES.status_changed,
+        payload={
+            'from_status': status_reference(from_status_id),
+            'to_status': status_reference(product.current_status_id),
+            'current_task': product.current_task_id,
+            'location': product.location_id,
+        },
+    )
+
+
+def location_changed(product, from_location_id):
+    return ProductEvent(
+        product_sn=product.SN,
+        kind=EVENT_KIND_CHOICES.location_changed,
+        payload={'from_location': from_location_id, 'to_location': product.location_id},
+    )
+
+
+def task_changed(product_task):
+    if product_task.is_completed:
+        kind = EVENT_KIND_CHOICES.task_completed
+    elif product_task.is_skipped:
+        kind = EVENT_KIND_CHOICES.task_skipped
+    else:
+        kind = EVENT_KIND_CHOICES.task_updated
+    return ProductEvent(
+        product_sn=product_task.product_id,
+        kind=kind,
+        payload={
+            'product_task': product_task.pk,
+            'task': product_task.task_id,
+            'status': product_task.status_id,
+            'result': product_task.result,
+            'note': product_task.note,
+        },
+    )
+
+
+def removal_changed(product):
+    return ProductEvent(
+        product_sn=product.SN,
+        kind=EVENT_KIND_CHOICES.archived if product.is_removed else EVENT_KIND_CHOICES.restored,
+        payload={'current_status': status_reference(product.current_status_id), 'location': product.location_id},
+    )
+
+
+#the events of one save of product, from the tracker, which still holds the values loaded from the database
+def product_saved_events(product, is_new):
+    events = []
+    if is_new or product.tracker.has_changed('current_status'):
+        events.append(status_changed(product, None if is_new else product.tracker.previous('current_status')))
+    if (is_new and product.location_id) or (not is_new and product.tracker.has_changed('location')):
+        events.append(location_changed(product, None if is_new else product.tracker.previous('location')))
+    if not is_new and product.tracker.has_changed('is_removed'):
+        events.append(removal_changed(product))
+    return events
+
+
+def record_events(events, batch_size=500):
+    if events:
+        ProductEvent.objects.bulk_create(events, batch_size=batch_size)
+
+
+def event_data(event):
+    return {
+        'sequence': event.pk,
+        'SN': event.product_sn,
+        'kind': event.kind,
+        'payload': event.payload,
+        'created': event.created,
+    }
+
+
+#returns (events, cursor, has_more): at most limit events after the sequence after, in order, and the sequence to
+#ask for next time
+def read_feed(after=0, limit=FEED_BATCH_SIZE):
+    events = list(ProductEvent.objects.filter(pk__gt=after).order_by('pk')[:limit + 1])
+    settled = timezone.now() - timedelta(seconds=FEED_SETTLE_SECONDS)
+    feed = []
+    cursor = after
+    for event in events[:limit]:
+        if event.pk != cursor + 1 and event.created > settled:
+            break
+        feed.append(event)
+        cursor = event.pk
+    return feed, cursor, len(feed) < len(events)
+
+
+#of the events created before before, deletes those with a later event of the same product and kind: a consumer
+#that reads the feed from the start still ends with the current state of every product. Events of the last
+#FEED_SETTLE_SECONDS always stay, a gap among them would hold up read_feed like a transaction still committing.
+#Runs in batches of batch_size events in sequence order, each deleted on its own, and returns the number of events
+#deleted
+def compact_events(before, batch_size=COMPACT_BATCH_SIZE):
+    before = min(before, timezone.now() - timedelta(seconds=FEED_SETTLE_SECONDS))
+    #the newest event old enough to compact, the batches stop at it
+    last = ProductEvent.objects.filter(created__lt=before).order_by('-pk').values_list('pk', flat=True).first()
+    if last is None:
+        return 0
+    superseded = Exists(ProductEvent.objects.filter(
+        product_sn=OuterRef('product_sn'), kind=OuterRef('kind'), pk__gt=OuterRef('pk')
+    ))
+    deleted = 0
+    after = 0
+    while True:
+        pks = list(
+            ProductEvent.objects.filter(pk__gt=after, pk__lte=last).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return deleted
+        #a lower sequence than last does not make an event old, a late commit can have one
+        count, per_model = ProductEvent.objects.filter(pk__in=pks, created__lt=before).filter(superseded).delete()
+        deleted += count
+        after = pks[-1]
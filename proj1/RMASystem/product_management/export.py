@@ -0,0 +1,148 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .history import ProductHistory
+from .models import Product, ProductStatus, ProductTask
+from .utilhelpers import PRIORITY_LEVEL_CHOICES
+
+
+#exports of products with their full status history and task results. Products are read with
+#iterator(chunk_size), which runs the prefetches of ProductStatus and ProductTask once per chunk, and every product
+#is written out before the next chunk is fetched, so memory use stays the same however many products are exported.
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FORMATS = ('csv', 'ndjson')
+CSV_HEADER = [
+    'SN', 'category', 'priority_level', 'current_status', 'current_task', 'location', 'description', 'created',
+    'visit_status', 'visit_changed_at', 'task', 'task_completed', 'task_skipped', 'task_result', 'task_note',
+]
+
+
+#filters come as strings (query parameters or command options), returns the keyword arguments of export_products
+def parse_export_filters(params):
+    filters = {}
+    errors = {}
+    for name in ('status', 'category'):
+        if params.get(name):
+            filters[name] = params[name]
+    if params.get('priority'):
+        if params['priority'] in PRIORITY_LEVEL_CHOICES:
+            filters['priority_level'] = params['priority']
+        else:
+            errors['priority'] = [f'Unknown priority level {params["priority"]}']
+    for name in ('created_from', 'created_to'):
+        if params.get(name):
+            try:
+                filters[name] = parse_date(params[name])
+            except ValueError:
+                filters[name] = None
+            if filters[name] is None:
+                errors[name] = [f'{params[name]} is not a date (YYYY-MM-DD)']
+    if errors:
+        raise ValidationError(errors)
+    return filters
+
+
+def start_of_day(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+#created_from and created_to are dates and both inclusive, compared as a range so the created column can be used
+def export_products(status=None, category=None, priority_level=None, created_from=None, created_to=None):
+    products = Product.objects.select_related('category', 'current_status', 'current_task', 'location')
+    if status is not None:
+        products = products.filter(current_status__name=status)
+    if category is not None:
+        products = products.filter(category__name=category)
+    if priority_level is not None:
+        products = products.filter(priority_level=priority_level)
+    if created_from is not None:
+        products = products.filter(created__gte=start_of_day(created_from))
+    if created_to is not None:
+        products = products.filter(created__lt=start_of_day(created_to + timedelta(days=1)))
+    return products.order_by('SN').prefetch_related(
+        Prefetch(
+            'status_history_of_product',
+            queryset=ProductStatus.objects.select_related('status').order_by('changed_at', 'pk')
+        ),
+        Prefetch(
+            'tasks_of_product',
+            queryset=ProductTask.objects.select_related('task').order_by('sequence', 'created')
+        ),
+    )
+
+
+#yields (product, ProductHistory) one chunk of products at a time
+def iter_product_histories(products, chunk_size=EXPORT_CHUNK_SIZE):
+    for product in products.iterator(chunk_size=chunk_size):
+        history = ProductHistory.from_rows(
+            product.SN, product.status_history_of_product.all(), product.tasks_of_product.all()
+        )
+        yield product, history
+
+
+def product_fields(product):
+    return {
+        'SN': product.SN,
+        'category': product.category.name,
+        'priority_level': product.priority_level,
+        'current_status': product.current_status.name if product.current_status else None,
+        'current_task': product.current_task.action if product.current_task else None,
+        'location': str(product.location) if product.location else None,
+        'description': product.description,
+        'created': product.created.isoformat(),
+    }
+
+
+def task_fields(product_task):
+    return {
+        'task': product_task.task.action,
+        'task_completed': product_task.is_completed,
+        'task_skipped': product_task.is_skipped,
+        'task_result': product_task.result,
+        'task_note': product_task.note,
+    }
+
+
+#csv.writer writes to a file, this one hands the formatted line back instead
+class Echo:
+    def write(self, value):
+        return value
+
+
+#one row per task of every status visit, visits without tasks and products without history get one row of their own
+def csv_lines(products, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for product, history in iter_product_histories(products, chunk_size):
+        fields = product_fields(product)
+        rows = []
+        for visit in history.visits:
+            visit_fields = {'visit_status': visit.status.name, 'visit_changed_at': visit.changed_at.isoformat()}
+            rows.extend({**fields, **visit_fields, **task_fields(task)} for task in visit.tasks)
+            if not visit.tasks:
+                rows.append({**fields, **visit_fields})
+        for row in rows or [fields]:
+            yield writer.writerow([row.get(column, '') for column in CSV_HEADER])
+
+
+#one JSON object per product, with its visits and their tasks nested
+def ndjson_lines(products, chunk_size=EXPORT_CHUNK_SIZE):
+    for product, history in iter_product_histories(products, chunk_size):
+        record = product_fields(product)
+        record['history'] = [
+            {
+                'status': visit.status.name,
+                'changed_at': visit.changed_at.isoformat(),
+                'tasks': [task_fields(task) for task in visit.tasks],
+            }
+            for visit in history.visits
+        ]
+        yield json.dumps(record) + '\n'
+
+
+EXPORT_WRITERS = {'csv': csv_lines, 'ndjson': ndjson_lines}
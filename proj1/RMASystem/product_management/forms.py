@@ -1,6 +1,8 @@
 from django import forms
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit
+from django.db.models import Q
+from .widgets import AutocompleteSelect
 from .models import Product, Category, Status, Task, ProductTask, StatusTask, Location, StatusTransition, ProductStatus
 
 class CategoryForm(forms.ModelForm):
@@ -31,6 +33,10 @@ class StatusTransitionForm(forms.ModelForm):
     class Meta:
         model = StatusTransition
         fields = ['from_status', 'to_status']
+        widgets = {
+            'from_status': AutocompleteSelect('status_autocomplete'),
+            'to_status': AutocompleteSelect('status_autocomplete'),
+        }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -67,6 +73,10 @@ class ProductTaskForm(forms.ModelForm):
     class Meta:
         model = ProductTask
         fields = ['product', 'task', 'result', 'note','is_completed', 'is_skipped', 'is_predefined']
+        widgets = {
+            'product': AutocompleteSelect('product_autocomplete'),
+            'task': AutocompleteSelect('task_autocomplete'),
+        }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -86,14 +96,24 @@ class StatusTaskForm(forms.ModelForm):
         self.helper.add_input(Submit('submit', 'Submit'))
 
 class ProductForm(forms.ModelForm):
-    location = forms.ModelChoiceField(queryset=Location.objects.all(), required=False)
+    location = forms.ModelChoiceField(
+        queryset=Location.objects.all(), required=False, widget=AutocompleteSelect('location_autocomplete')
+    )
 
     class Meta:
         model = Product
         fields = ['SN', 'category', 'priority_level', 'description', 'current_status', 'current_task', 'location']
+        widgets = {
+            'current_status': AutocompleteSelect('status_autocomplete'),
+            'current_task': AutocompleteSelect('task_autocomplete'),
+        }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        #only slots that are free, or already this product's, can be chosen
+        self.fields['location'].queryset = Location.objects.filter(
+            Q(is_free=True) | Q(pk=self.instance.location_id)
+        ).order_by('rack_name', 'layer_number', 'space_number')
         self.helper = FormHelper()
         self.helper.form_method = 'post'
         self.helper.add_input(Submit('submit', 'Submit'))
@@ -118,6 +138,8 @@ class ProductForm(forms.ModelForm):
             self.save_m2m()
         return product
 
+#either one slot (rack, layer and space), or with both counts a whole rack provisioned like the provision_racks
+#command: the slots of the rack that already exist are skipped, so the layer and space are not needed then
 class LocationForm(forms.ModelForm):
     num_layers = forms.IntegerField(required=False, min_value=1, label="Number of Layers")
     num_spaces_per_layer = forms.IntegerField(required=False, min_value=1, label="Number of Spaces per Layer")
@@ -128,18 +150,42 @@ class LocationForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.fields['layer_number'].required = False
+        self.fields['space_number'].required = False
         self.helper = FormHelper()
         self.helper.form_method = 'post'
         self.helper.add_input(Submit('submit', 'Submit'))
 
+    def is_provisioning(self):
+        return bool(self.cleaned_data.get('num_layers') and self.cleaned_data.get('num_spaces_per_layer'))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if bool(cleaned_data.get('num_layers')) != bool(cleaned_data.get('num_spaces_per_layer')):
+            raise forms.ValidationError("Give both the number of layers and of spaces per layer to provision a rack.")
+        if self.is_provisioning():
+            #the typed slot is not saved, so it is neither built nor checked against the existing slots
+            cleaned_data.pop('layer_number', None)
+            cleaned_data.pop('space_number', None)
+        else:
+            for name in ('layer_number', 'space_number'):
+                if cleaned_data.get(name) is None and name not in self.errors:
+                    self.add_error(name, "This field is required unless a whole rack is provisioned.")
+        return cleaned_data
+
+    def validate_unique(self):
+        if not self.is_provisioning():
+            super().validate_unique()
+
     def save(self, commit=True):
-        location = super().save(commit=commit)
-        if commit:
-            num_layers = self.cleaned_data.get('num_layers')
-            num_spaces_per_layer = self.cleaned_data.get('num_spaces_per_layer')
-            if num_layers and num_spaces_per_layer:
-                Location.create_rack_with_layers_and_spaces(location.rack_name, num_layers, num_spaces_per_layer)
-        return location
+        if commit and self.is_provisioning():
+            rack_name = self.cleaned_data['rack_name']
+            results = Location.provision_racks(
+                [(rack_name, self.cleaned_data['num_layers'], self.cleaned_data['num_spaces_per_layer'])]
+            )
+            self.created_count, self.skipped_count = results[rack_name]
+            return Location.objects.filter(rack_name=rack_name).order_by('layer_number', 'space_number').first()
+        return super().save(commit=commit)
 
 class ProductStatusForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,72 @@
+from bisect import bisect_right
+from .models import ProductStatus, ProductTask
+
+
+#status history report of products: every ProductStatus row (a visit of the product to a status) together with
+#the product tasks done during that visit. The rows of any number of products are fetched with two queries and
+#grouped in memory, a task belongs to the latest visit of its status that began before the task was created.
+
+class StatusVisit:
+    def __init__(self, product_status):
+        self.product_status = product_status
+        self.status = product_status.status
+        self.changed_at = product_status.changed_at
+        self.tasks = []
+
+    def result_text(self):
+        result = f'{self.status.name}: '
+        for task in self.tasks:
+            result += f'{task.task.action} - {task.result}'
+            if task.note:
+                result += f' - Note: {task.note}'
+            result += ' | '
+        return result
+
+
+class ProductHistory:
+    def __init__(self, sn):
+        self.sn = sn
+        self.visits = []
+
+    def as_text(self):
+        history = [f'Product SN: {self.sn}']
+        for visit in self.visits:
+            history.append(f'{visit.result_text()} at {visit.changed_at}')
+        return "\n".join(history)
+
+    #product_statuses in time order and product_tasks in plan order, all of this product
+    @classmethod
+    def from_rows(cls, sn, product_statuses, product_tasks):
+        history = cls(sn)
+        #visits of the same status, in time order, to place the tasks
+        visits_by_status = {}
+        for product_status in product_statuses:
+            visit = StatusVisit(product_status)
+            history.visits.append(visit)
+            visits_by_status.setdefault(product_status.status_id, []).append(visit)
+
+        visit_starts = {status_id: [visit.changed_at for visit in visits] for status_id, visits in visits_by_status.items()}
+        for product_task in product_tasks:
+            if product_task.status_id not in visits_by_status:
+                continue
+            #tasks from before the first recorded visit are counted to it
+            position = bisect_right(visit_starts[product_task.status_id], product_task.created)
+            visits_by_status[product_task.status_id][max(position - 1, 0)].tasks.append(product_task)
+        return history
+
+
+#products can be Product instances or SNs, returns a dict of SN -> ProductHistory with the visits in time order
+def build_status_histories(products):
+    sns = [getattr(product, 'SN', product) for product in products]
+    product_statuses = {sn: [] for sn in sns}
+    product_tasks = {sn: [] for sn in sns}
+
+    for product_status in ProductStatus.objects.filter(product_id__in=sns).select_related('status').order_by(
+        'product_id', 'changed_at', 'pk'
+    ):
+        product_statuses[product_status.product_id].append(product_status)
+    for product_task in ProductTask.objects.filter(product_id__in=sns).select_related('task').order_by(
+        'product_id', 'sequence', 'created'
+    ):
+        product_tasks[product_task.product_id].append(product_task)
+    return {sn: ProductHistory.from_rows(sn, product_statuses[sn], product_tasks[sn]) for sn in sns}
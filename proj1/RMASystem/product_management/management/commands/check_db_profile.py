@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from RMASystem.db_profiles import sqlite_pragmas
+
+
+class Command(BaseCommand):
+    help = (
+        'Connect with the active database profile (RMA_DB_PROFILE) and check that its connection settings are in '
+        'effect: the PRAGMAs on SQLite, the server and pool on PostgreSQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to check')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        settings_dict = connection.settings_dict
+        self.stdout.write(f'Vendor: {connection.vendor}')
+        self.stdout.write(f'Name: {settings_dict["NAME"]}')
+        self.stdout.write(f'CONN_MAX_AGE: {settings_dict["CONN_MAX_AGE"]}')
+        self.stdout.write(f'CONN_HEALTH_CHECKS: {settings_dict["CONN_HEALTH_CHECKS"]}')
+
+        if connection.vendor == 'sqlite':
+            self.check_sqlite(connection)
+        elif connection.vendor == 'postgresql':
+            self.check_postgres(connection)
+        self.stdout.write(self.style.SUCCESS('Database profile OK'))
+
+    def check_sqlite(self, connection):
+        mismatches = []
+        with connection.cursor() as cursor:
+            for pragma, expected in sqlite_pragmas().items():
+                cursor.execute(f'PRAGMA {pragma}')
+                actual = cursor.fetchone()[0]
+                self.stdout.write(f'PRAGMA {pragma}: {actual}')
+                if not self.pragma_matches(pragma, expected, actual, connection.is_in_memory_db()):
+                    mismatches.append(f'{pragma} is {actual}, expected {expected}')
+        if mismatches:
+            raise CommandError('SQLite connection is not tuned: ' + '; '.join(mismatches))
+
+    def pragma_matches(self, pragma, expected, actual, is_in_memory_db):
+        if pragma == 'journal_mode':
+            # in-memory databases cannot use WAL and always report "memory"
+            return is_in_memory_db or str(actual).lower() == expected.lower()
+        if pragma == 'synchronous':
+            levels = {'off': 0, 'normal': 1, 'full': 2, 'extra': 3}
+            #the setting is a level name or its number
+            expected = str(expected).lower()
+            return int(actual) == levels.get(expected, int(expected) if expected.isdigit() else None)
+        if pragma == 'mmap_size' and is_in_memory_db:
+            return True
+        return str(actual) == str(expected)
+
+    def check_postgres(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT version()')
+            self.stdout.write(f'Server: {cursor.fetchone()[0]}')
+        pool = connection.settings_dict['OPTIONS'].get('pool')
+        self.stdout.write(f'Connection pool: {pool or "disabled, persistent connections"}')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from product_management.query_plans import check_query_plans
+
+
+class Command(BaseCommand):
+    help = (
+        'Run EXPLAIN on every hot query of the app (product_management/query_plans.py) and check that each one is '
+        'answered from its index, so a schema change that loses an index fails here. The test suite runs it on the '
+        'migrated test database (QueryPlanTests).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plan of every query')
+
+    def handle(self, *args, **options):
+        failures = []
+        for name, index, plan, uses_index in check_query_plans():
+            self.stdout.write(f'{name}: {index} {"used" if uses_index else "NOT USED"}')
+            if options['verbose_plans'] or not uses_index:
+                self.stdout.write(plan)
+            if not uses_index:
+                failures.append(f'{name} does not use {index}')
+        if failures:
+            raise CommandError('Query plans changed: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Every hot query uses its index'))
@@ -0,0 +1,23 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from product_management.events import COMPACT_BATCH_SIZE, compact_events
+
+
+class Command(BaseCommand):
+    help = (
+        'Compact the product event log: of the events older than --days, keep only the latest of every product '
+        'and kind. Meant to run in the background, e.g. nightly from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Compact events older than this many days')
+        parser.add_argument('--batch-size', type=int, default=COMPACT_BATCH_SIZE, help='Number of events per DELETE')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--days must be 0 or more and --batch-size at least 1')
+
+        before = timezone.now() - timedelta(days=options['days'])
+        deleted = compact_events(before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Compacted the events before {before:%Y-%m-%d %H:%M}, {deleted} deleted'))
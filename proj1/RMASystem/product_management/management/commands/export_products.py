@@ -0,0 +1,35 @@
+import sys
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from product_management.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, EXPORT_WRITERS, export_products, parse_export_filters
+
+
+class Command(BaseCommand):
+    help = (
+        'Export products with their full status history and task results as CSV (one row per task) or NDJSON '
+        '(one product per line). Products are streamed in chunks, so memory use does not grow with the export.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help='Export format')
+        parser.add_argument('--output', help='File to write to, standard output when omitted')
+        parser.add_argument('--status', help='Only products currently in the status with this name')
+        parser.add_argument('--category', help='Only products of the category with this name')
+        parser.add_argument('--priority', help='Only products of this priority level')
+        parser.add_argument('--created-from', help='Only products created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--created-to', help='Only products created on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Number of products per fetch')
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_export_filters(options)
+        except ValidationError as e:
+            raise CommandError('; '.join(f'{name}: {" ".join(messages)}' for name, messages in e.message_dict.items()))
+
+        lines = EXPORT_WRITERS[options['format']](export_products(**filters), chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f'Exported to {options["output"]}'))
+        else:
+            sys.stdout.writelines(lines)
@@ -0,0 +1,49 @@
+import csv
+import json
+from django.core.management.base import BaseCommand, CommandError
+from product_management.models import Location
+
+
+class Command(BaseCommand):
+    help = (
+        'Provision warehouse racks from a spec file. The file is either a JSON list of objects or a CSV, '
+        'both with the keys rack_name, num_layers and num_spaces_per_layer. All racks are provisioned in one '
+        'transaction and slots that already exist are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('spec_file', help='Path to the JSON or CSV rack spec file')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of slots per INSERT')
+
+    def handle(self, *args, **options):
+        rack_specs = self.read_specs(options['spec_file'])
+        results = Location.provision_racks(rack_specs, batch_size=options['batch_size'])
+
+        for rack_name, (created_count, skipped_count) in results.items():
+            self.stdout.write(f'{rack_name}: created {created_count} slots, skipped {skipped_count} existing slots')
+        total_created = sum(created_count for created_count, skipped_count in results.values())
+        total_skipped = sum(skipped_count for created_count, skipped_count in results.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Provisioned {len(results)} racks: {total_created} slots created, {total_skipped} skipped'
+        ))
+
+    def read_specs(self, spec_file):
+        try:
+            with open(spec_file, newline='', encoding='utf-8') as f:
+                if spec_file.lower().endswith('.csv'):
+                    records = list(csv.DictReader(f))
+                else:
+                    records = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read rack spec file {spec_file}: {e}')
+
+        rack_specs = []
+        for line_number, record in enumerate(records, start=1):
+            try:
+                rack_spec = (record['rack_name'], int(record['num_layers']), int(record['num_spaces_per_layer']))
+            except (KeyError, TypeError, ValueError) as e:
+                raise CommandError(f'Invalid rack spec #{line_number}: {record} ({e})')
+            if rack_spec[1] < 1 or rack_spec[2] < 1:
+                raise CommandError(f'Invalid rack spec #{line_number}: layers and spaces must be at least 1')
+            rack_specs.append(rack_spec)
+        return rack_specs
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from product_management.counters import counter_drift, reconcile_counters
+from product_management.models import Status
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the dashboard counters (products per status, priority level and rack) from the products, '
+        'and report the counts that had drifted. With --check only report, and fail when anything drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only compare the counters with the products')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of counter rows per INSERT')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = counter_drift()
+        else:
+            drift = reconcile_counters(batch_size=options['batch_size'])
+
+        status_names = dict(Status.objects.filter(pk__in={key[0] for key in drift}).values_list('pk', 'name'))
+        for (status_id, priority_level, rack_name), (stored, actual) in sorted(drift.items()):
+            self.stdout.write(
+                f'{status_names.get(status_id, status_id)} / {priority_level} / {rack_name or "No rack"}: '
+                f'counted {stored}, actual {actual}'
+            )
+
+        if options['check']:
+            if drift:
+                raise CommandError(f'{len(drift)} dashboard counters have drifted')
+            self.stdout.write(self.style.SUCCESS('Dashboard counters are up to date'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Dashboard counters rebuilt, {len(drift)} had drifted'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from product_management.analytics import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresh the daily time-in-status rollups of the status analytics report from the product status history. '
+        'Without options only the days since the last refresh are recomputed, meant to run e.g. hourly from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Recompute the days from this date on (YYYY-MM-DD)')
+        parser.add_argument('--full', action='store_true', help='Rebuild every day from the first status change')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_date(options['since'])
+            except ValueError:
+                since = None
+            if since is None:
+                raise CommandError(f'{options["since"]} is not a date (YYYY-MM-DD)')
+
+        written = refresh_rollups(since=since, full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Refreshed the status rollups, {written} rows written'))
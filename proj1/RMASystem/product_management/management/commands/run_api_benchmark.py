@@ -0,0 +1,57 @@
+import asyncio
+import json
+import random
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from product_management.benchmarks import DEFAULT_CONFIG, asgi_fetcher, generate_dataset, http_fetcher, poll_bench_api
+from product_management.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the async bench terminal API with many concurrent polling clients. By default the requests go '
+        "through Django's ASGI handler in-process, on a fresh test database with synthetic data. With --base-url "
+        'they go over HTTP to a running server (e.g. uvicorn RMASystem.asgi:application) and poll the units of '
+        'the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help='Number of concurrent terminals')
+        parser.add_argument('--requests', type=int, default=40, help='Requests per terminal')
+        parser.add_argument('--units', type=int, default=50, help='Number of units the terminals poll')
+        parser.add_argument('--products', type=int, default=DEFAULT_CONFIG['products'], help='Synthetic products (in-process only)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--base-url', help='Base URL of a running server, e.g. http://127.0.0.1:8000')
+
+    def handle(self, *args, **options):
+        if options['base_url']:
+            sns = self.sample_sns(options)
+            results = asyncio.run(self.poll(http_fetcher(options['base_url']), sns, options))
+        else:
+            setup_test_environment()
+            runner = DiscoverRunner(verbosity=0, interactive=False)
+            old_config = runner.setup_databases()
+            try:
+                generate_dataset({**DEFAULT_CONFIG, 'products': options['products'], 'seed': options['seed']})
+                sns = self.sample_sns(options)
+                results = asyncio.run(self.poll(asgi_fetcher(), sns, options))
+            finally:
+                runner.teardown_databases(old_config)
+                teardown_test_environment()
+
+        self.stdout.write(json.dumps(results, indent=2))
+        self.stderr.write(
+            f'{results["requests"]} requests from {results["clients"]} clients: '
+            f'{results["requests_per_second"]:.0f} req/s, p50 {results["latency_ms"]["p50"]:.2f} ms, '
+            f'p95 {results["latency_ms"]["p95"]:.2f} ms, status codes {results["status_codes"]}'
+        )
+
+    def sample_sns(self, options):
+        sns = list(Product.objects.order_by('SN').values_list('SN', flat=True)[:options['units'] * 10])
+        if not sns:
+            raise CommandError('There are no products to poll')
+        return random.Random(options['seed']).sample(sns, min(options['units'], len(sns)))
+
+    async def poll(self, fetch, sns, options):
+        return await poll_bench_api(fetch, sns, options['clients'], options['requests'], options['seed'])
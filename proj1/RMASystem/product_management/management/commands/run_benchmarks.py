@@ -0,0 +1,55 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from product_management.benchmarks import DEFAULT_CONFIG, run_benchmarks, compare_with_baseline
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the product lifecycle benchmarks (query counts and wall time) on a fresh test database with synthetic '
+        'data, write the results as JSON and optionally fail when they regress against a stored baseline.'
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_CONFIG.items():
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=default, dest=name)
+        parser.add_argument('--output', help='Write the results JSON to this file instead of stdout')
+        parser.add_argument('--baseline', help='Baseline results JSON to compare with')
+        parser.add_argument('--query-tolerance', type=float, default=0, help='Allowed extra queries per operation')
+        parser.add_argument(
+            '--time-ratio', type=float, default=None,
+            help='Fail when an operation is slower than the baseline times this ratio (timings are not checked by default)'
+        )
+
+    def handle(self, *args, **options):
+        config = {name: options[name] for name in DEFAULT_CONFIG}
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            results = run_benchmarks(config)
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        for name, result in results['results'].items():
+            self.stderr.write(f'{name}: {result["queries"]:g} queries, {result["seconds"] * 1000:.2f} ms')
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare_with_baseline(results, baseline, options['query_tolerance'], options['time_ratio'])
+            if regressions:
+                raise CommandError('Benchmark regressions:\n' + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS('No regressions against the baseline'))
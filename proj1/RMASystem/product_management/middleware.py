@@ -0,0 +1,150 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('product_management.requests')
+
+#IN lists of any length and literal numbers collapse to one shape, so repeated lookups with different ids count together
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+#requests that match no URL pattern (404s, scanners) share one key, so the stats stay bounded
+UNRESOLVED_URL_NAME = '<unresolved>'
+
+
+def query_shape(sql):
+    return NUMBER_RE.sub('N', IN_LIST_RE.sub('IN (...)', sql))
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+
+#rolling latency and query samples per URL name, read by the staff-only request stats view
+class RequestStats:
+    def __init__(self, max_samples):
+        self.max_samples = max_samples
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    #template_render_ms is None for responses that are not a TemplateResponse, see RequestInstrumentationMiddleware
+    def add(self, url_name, total_ms, query_count, db_ms, template_render_ms=None):
+        with self.lock:
+            samples = self.samples.setdefault(url_name, deque(maxlen=self.max_samples))
+            samples.append((total_ms, query_count, db_ms, template_render_ms))
+
+    def summary(self):
+        with self.lock:
+            snapshot = {url_name: list(samples) for url_name, samples in self.samples.items()}
+        return {url_name: summarize(samples) for url_name, samples in snapshot.items()}
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def summarize(samples):
+    latencies = sorted(total_ms for total_ms, query_count, db_ms, template_render_ms in samples)
+    queries = sorted(query_count for total_ms, query_count, db_ms, template_render_ms in samples)
+    template_renders = [
+        template_render_ms for total_ms, query_count, db_ms, template_render_ms in samples
+        if template_render_ms is not None
+    ]
+    return {
+        'requests': len(samples),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.5), 2),
+            'p95': round(percentile(latencies, 0.95), 2),
+            'max': round(latencies[-1], 2),
+            #latency histogram with power-of-two millisecond buckets
+            'histogram': dict(Counter(f'<{2 ** max(int(latency), 1).bit_length()}' for latency in latencies)),
+        },
+        'queries': {'p50': percentile(queries, 0.5), 'max': queries[-1]},
+        'db_ms_avg': round(sum(db_ms for total_ms, query_count, db_ms, template_render_ms in samples) / len(samples), 2),
+        #only the requests answered with a TemplateResponse are timed, the others are not counted here
+        'template_responses': len(template_renders),
+        'template_render_ms_avg': round(sum(template_renders) / len(template_renders), 2) if template_renders else None,
+    }
+
+
+request_stats = RequestStats(getattr(settings, 'RMA_INSTRUMENTATION_SAMPLES', 500))
+
+
+#opt-in with RMA_REQUEST_INSTRUMENTATION: records per request the number of SQL queries, the DB time, the most repeated
+#query shapes (N+1 patterns), the template render time and the total latency. Emits one JSON log line per request on
+#the product_management.requests logger and, with RMA_SERVER_TIMING, a Server-Timing header.
+#The render time is only known for a TemplateResponse (the generic views), which renders after the view returns:
+#render() and JSON responses are built inside the view, their template_render_ms is null and their time is in total
+class RequestInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'RMA_SERVER_TIMING', False)
+        self.repeated_query_threshold = getattr(settings, 'RMA_REPEATED_QUERY_THRESHOLD', 5)
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request._instrumentation_template_render_ms = None
+        start = time.perf_counter()
+        with connections['default'].execute_wrapper(recorder):
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = recorder.seconds * 1000
+        template_render_ms = request._instrumentation_template_render_ms
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.view_name if match else None) or UNRESOLVED_URL_NAME
+        request_stats.add(url_name, total_ms, recorder.count, db_ms, template_render_ms)
+
+        repeated_queries = [
+            {'sql': shape[:300], 'count': count}
+            for shape, count in recorder.shapes.most_common(5) if count > 1
+        ]
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'url_name': url_name,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'db_ms': round(db_ms, 2),
+            'queries': recorder.count,
+            'template_render_ms': round(template_render_ms, 2) if template_render_ms is not None else None,
+            'repeated_queries': repeated_queries,
+        }
+        if repeated_queries and repeated_queries[0]['count'] >= self.repeated_query_threshold:
+            logger.warning(json.dumps({'possible_n_plus_one': True, **record}))
+        else:
+            logger.info(json.dumps(record))
+
+        if self.server_timing:
+            timings = [f'db;dur={db_ms:.2f};desc="{recorder.count} queries"']
+            if template_render_ms is not None:
+                timings.append(f'tmpl;dur={template_render_ms:.2f}')
+            timings.append(f'total;dur={total_ms:.2f}')
+            response['Server-Timing'] = ', '.join(timings)
+        return response
+
+    #template responses render after the view returns, time the render through a post-render callback
+    def process_template_response(self, request, response):
+        render_start = time.perf_counter()
+
+        def record_render_time(rendered_response):
+            request._instrumentation_template_render_ms = (time.perf_counter() - render_start) * 1000
+
+        response.add_post_render_callback(record_render_time)
+        return response
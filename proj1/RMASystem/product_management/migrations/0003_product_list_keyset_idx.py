@@ -0,0 +1,55 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0002_productstatus_statustransition_and_more"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="task",
+            name="note",
+        ),
+        migrations.RemoveField(
+            model_name="task",
+            name="result",
+        ),
+        migrations.AddField(
+            model_name="producttask",
+            name="note",
+            field=models.TextField(
+                blank=True,
+                help_text="User can write down some notes on this task of this product",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="producttask",
+            name="result",
+            field=models.TextField(
+                blank=True,
+                default="Action Not Yet Done",
+                help_text="Result of the task of the product",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["priority_level", "modified", "SN"],
+                name="product_list_keyset_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="producttask",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_completed", False), ("is_skipped", False)),
+                fields=("product", "task"),
+                name="unique_active_product_task",
+            ),
+        ),
+    ]
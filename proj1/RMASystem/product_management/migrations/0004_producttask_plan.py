@@ -0,0 +1,87 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def renumber_status_tasks(apps, schema_editor):
+    # StatusTask.order used to default to 0, so OrderedModel never appended new rows.
+    # Number the tasks of every status 0, 1, 2, ... in their existing order.
+    StatusTask = apps.get_model("product_management", "StatusTask")
+
+    status_ids = StatusTask.objects.values_list("status_id", flat=True).distinct()
+    for status_id in status_ids:
+        status_tasks = StatusTask.objects.filter(status_id=status_id).order_by(
+            "order", "id"
+        )
+        for order, status_task in enumerate(status_tasks):
+            if status_task.order != order:
+                status_task.order = order
+                status_task.save(update_fields=["order"])
+
+
+def backfill_task_plan(apps, schema_editor):
+    # Existing tasks belong to the status the product was in when they were created,
+    # and take their position from the StatusTask of that status.
+    ProductTask = apps.get_model("product_management", "ProductTask")
+    ProductStatus = apps.get_model("product_management", "ProductStatus")
+    StatusTask = apps.get_model("product_management", "StatusTask")
+
+    for product_task in ProductTask.objects.filter(status__isnull=True).iterator():
+        product_status = (
+            ProductStatus.objects.filter(
+                product_id=product_task.product_id, changed_at__lte=product_task.created
+            )
+            .order_by("-changed_at")
+            .first()
+        )
+        if product_status is None:
+            continue
+        status_task = StatusTask.objects.filter(
+            status_id=product_status.status_id, task_id=product_task.task_id
+        ).first()
+        product_task.status_id = product_status.status_id
+        product_task.sequence = status_task.order if status_task else 0
+        product_task.save(update_fields=["status", "sequence"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0003_product_list_keyset_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="producttask",
+            name="sequence",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Position of the task in the product's task plan"
+            ),
+        ),
+        migrations.AddField(
+            model_name="producttask",
+            name="status",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="product_tasks",
+                to="product_management.status",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="statustask",
+            name="order",
+            field=models.PositiveIntegerField(db_index=True, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="producttask",
+            index=models.Index(
+                fields=["product", "is_completed", "is_skipped", "sequence"],
+                name="producttask_plan_idx",
+            ),
+        ),
+        migrations.RunPython(renumber_status_tasks, migrations.RunPython.noop),
+        migrations.RunPython(backfill_task_plan, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:02
+
+from django.db import migrations, models
+
+PRIORITY_LEVEL_RANKS = {"zfa": 0, "hot": 1, "normal": 2}
+
+
+def backfill_priority_rank(apps, schema_editor):
+    Product = apps.get_model("product_management", "Product")
+    for priority_level, priority_rank in PRIORITY_LEVEL_RANKS.items():
+        Product.objects.filter(priority_level=priority_level).update(
+            priority_rank=priority_rank
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0004_producttask_plan"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="product",
+            name="product_list_keyset_idx",
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="claimed_by",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="claimed_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="priority_rank",
+            field=models.PositiveSmallIntegerField(
+                default=2,
+                editable=False,
+                help_text="Sortable priority, 0 is the most urgent",
+            ),
+        ),
+        migrations.RunPython(backfill_priority_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["priority_rank", "modified", "SN"],
+                name="product_list_keyset_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["current_status", "priority_rank", "created", "SN"],
+                name="product_status_queue_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["current_task", "priority_rank", "created", "SN"],
+                name="product_task_queue_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,144 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+DOCUMENT_TABLE = "product_management_searchdocument"
+FTS_TABLE = "product_management_searchdocument_fts"
+UNSET_TASK_RESULT = "Action Not Yet Done"
+
+SQLITE_FULLTEXT_SQL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(body, content='{DOCUMENT_TABLE}', content_rowid='id')",
+    f"""CREATE TRIGGER {DOCUMENT_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body);
+    END""",
+    f"""CREATE TRIGGER {DOCUMENT_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body);
+    END""",
+    f"""CREATE TRIGGER {DOCUMENT_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body);
+    END""",
+]
+SQLITE_DROP_FULLTEXT_SQL = [
+    f"DROP TRIGGER IF EXISTS {DOCUMENT_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {DOCUMENT_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {DOCUMENT_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+POSTGRES_FULLTEXT_SQL = [
+    f"CREATE INDEX {DOCUMENT_TABLE}_body_gin ON {DOCUMENT_TABLE} USING GIN (to_tsvector('english', body))",
+]
+POSTGRES_DROP_FULLTEXT_SQL = [f"DROP INDEX IF EXISTS {DOCUMENT_TABLE}_body_gin"]
+
+
+def sqlite_has_fts5(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+# the full-text index depends on the database, without FTS5 or on other databases search.py scans the documents
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite" and sqlite_has_fts5(schema_editor):
+        statements = SQLITE_FULLTEXT_SQL
+    elif vendor == "postgresql":
+        statements = POSTGRES_FULLTEXT_SQL
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {
+        "sqlite": SQLITE_DROP_FULLTEXT_SQL,
+        "postgresql": POSTGRES_DROP_FULLTEXT_SQL,
+    }.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+# indexes the existing descriptions, task results and notes, the triggers fill the FTS5 table
+def backfill_search_documents(apps, schema_editor):
+    Product = apps.get_model("product_management", "Product")
+    ProductTask = apps.get_model("product_management", "ProductTask")
+    SearchDocument = apps.get_model("product_management", "SearchDocument")
+    documents = [
+        SearchDocument(product_id=sn, body=description.strip())
+        for sn, description in Product.objects.exclude(description="").values_list(
+            "SN", "description"
+        )
+        if description.strip()
+    ]
+    for pk, product_id, result, note in ProductTask.objects.values_list(
+        "pk", "product_id", "result", "note"
+    ).iterator():
+        texts = [
+            text.strip()
+            for text in (result, note)
+            if text and text.strip() and text != UNSET_TASK_RESULT
+        ]
+        if texts:
+            documents.append(
+                SearchDocument(
+                    product_id=product_id, product_task_id=pk, body="\n".join(texts)
+                )
+            )
+    SearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0005_product_work_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchDocument",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("body", models.TextField(blank=True)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_documents",
+                        to="product_management.product",
+                    ),
+                ),
+                (
+                    "product_task",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_document",
+                        to="product_management.producttask",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("product_task__isnull", True)),
+                        fields=("product",),
+                        name="unique_product_search_document",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
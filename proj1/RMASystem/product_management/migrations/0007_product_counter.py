@@ -0,0 +1,82 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_product_counters(apps, schema_editor):
+    Product = apps.get_model("product_management", "Product")
+    ProductCounter = apps.get_model("product_management", "ProductCounter")
+    rows = (
+        Product.objects.filter(is_removed=False, current_status__isnull=False)
+        .values_list("current_status", "priority_level", "location__rack_name")
+        .annotate(count=Count("SN"))
+        .order_by()
+    )
+    counts = {}
+    for status_id, priority_level, rack_name, count in rows:
+        key = (status_id, priority_level, rack_name or "")
+        counts[key] = counts.get(key, 0) + count
+    ProductCounter.objects.bulk_create(
+        [
+            ProductCounter(
+                status_id=status_id,
+                priority_level=priority_level,
+                rack_name=rack_name,
+                count=count,
+            )
+            for (status_id, priority_level, rack_name), count in counts.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0006_product_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "priority_level",
+                    models.CharField(
+                        choices=[("normal", "Normal"), ("hot", "Hot"), ("zfa", "ZFA")],
+                        max_length=10,
+                    ),
+                ),
+                ("rack_name", models.CharField(blank=True, max_length=100)),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "status",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="product_counters",
+                        to="product_management.status",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("status", "priority_level", "rack_name"),
+                        name="unique_product_counter",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_product_counters, migrations.RunPython.noop),
+    ]
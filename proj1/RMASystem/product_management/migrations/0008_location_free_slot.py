@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:14
+
+from django.db import migrations, models
+
+
+def backfill_is_free(apps, schema_editor):
+    Location = apps.get_model("product_management", "Location")
+    Location.objects.filter(product__isnull=False).update(is_free=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0007_product_counter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="is_free",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name="location",
+            index=models.Index(
+                condition=models.Q(("is_free", True)),
+                fields=["rack_name", "layer_number", "space_number"],
+                name="location_free_slot_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_is_free, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0008_location_free_slot"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="task",
+            name="action",
+            field=models.CharField(
+                db_index=True,
+                default="Default Action",
+                help_text="Action to be performed in this task",
+                max_length=100,
+            ),
+        ),
+    ]
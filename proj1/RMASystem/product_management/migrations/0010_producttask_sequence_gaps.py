@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:23
+
+from django.db import migrations
+from django.db.models import F
+
+TASK_SEQUENCE_GAP = 1024
+
+
+def space_task_sequences(apps, schema_editor):
+    # Sequences were copied from StatusTask.order (0, 1, 2, ...), space them TASK_SEQUENCE_GAP
+    # apart like task_sequence() does, so tasks can be inserted between them. Order is kept.
+    ProductTask = apps.get_model("product_management", "ProductTask")
+    ProductTask.objects.update(sequence=(F("sequence") + 1) * TASK_SEQUENCE_GAP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0009_task_action_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(space_task_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0010_producttask_sequence_gaps"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("product_sn", models.CharField(max_length=13)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("status_changed", "Status changed"),
+                            ("location_changed", "Location changed"),
+                            ("task_completed", "Task completed"),
+                            ("task_skipped", "Task skipped"),
+                            ("task_updated", "Task updated"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("payload", models.JSONField(blank=True, default=dict)),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["product_sn", "kind", "id"],
+                        name="productevent_compaction_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0011_product_event"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StatusDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "priority_level",
+                    models.CharField(
+                        choices=[("normal", "Normal"), ("hot", "Hot"), ("zfa", "ZFA")],
+                        max_length=10,
+                    ),
+                ),
+                ("entered", models.PositiveIntegerField(default=0)),
+                ("exited", models.PositiveIntegerField(default=0)),
+                ("wip", models.IntegerField(default=0)),
+                ("dwell_avg", models.FloatField(blank=True, null=True)),
+                ("dwell_p50", models.FloatField(blank=True, null=True)),
+                ("dwell_p90", models.FloatField(blank=True, null=True)),
+                ("dwell_p95", models.FloatField(blank=True, null=True)),
+                ("dwell_max", models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="productstatus",
+            index=models.Index(fields=["changed_at"], name="productstatus_changed_idx"),
+        ),
+        migrations.AddField(
+            model_name="statusdailyrollup",
+            name="category",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="daily_rollups",
+                to="product_management.category",
+            ),
+        ),
+        migrations.AddField(
+            model_name="statusdailyrollup",
+            name="status",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="daily_rollups",
+                to="product_management.status",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="statusdailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("day", "status", "category", "priority_level"),
+                name="unique_status_daily_rollup",
+            ),
+        ),
+    ]
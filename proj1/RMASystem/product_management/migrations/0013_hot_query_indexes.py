@@ -0,0 +1,57 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0012_status_daily_rollup"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["current_status", "priority_level"],
+                name="product_status_priority_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productstatus",
+            index=models.Index(
+                fields=["product", "changed_at", "id"], name="productstatus_product_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="producttask",
+            index=models.Index(
+                condition=models.Q(("is_completed", False), ("is_skipped", False)),
+                fields=["product", "sequence", "created"],
+                name="producttask_active_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="statustask",
+            index=models.Index(
+                fields=["status", "is_predefined", "order"],
+                name="statustask_predefined_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="statustransition",
+            index=models.Index(
+                fields=["from_status", "created"], name="statustransition_from_idx"
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="producttask",
+            name="producttask_plan_idx",
+        ),
+        migrations.AddIndex(
+            model_name="producttask",
+            index=models.Index(
+                fields=["product", "sequence", "created"], name="producttask_plan_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0013_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="product",
+            name="unique_sn_constraint",
+        ),
+        migrations.RemoveConstraint(
+            model_name="product",
+            name="unique_product_location_constraint",
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="current_status",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="ALL_products",
+                to="product_management.status",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="current_task",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="All_products",
+                to="product_management.task",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="productstatus",
+            name="product",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="status_history_of_product",
+                to="product_management.product",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="producttask",
+            name="product",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tasks_of_product",
+                to="product_management.product",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="statustask",
+            name="status",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="status_tasks",
+                to="product_management.status",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="statustransition",
+            name="from_status",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="transitions_from",
+                to="product_management.status",
+            ),
+        ),
+    ]
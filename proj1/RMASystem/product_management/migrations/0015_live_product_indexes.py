@@ -0,0 +1,85 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0014_drop_redundant_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="product",
+            name="product_list_keyset_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="product_status_queue_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="product_task_queue_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="product_status_priority_idx",
+        ),
+        migrations.AlterField(
+            model_name="productevent",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("status_changed", "Status changed"),
+                    ("location_changed", "Location changed"),
+                    ("task_completed", "Task completed"),
+                    ("task_skipped", "Task skipped"),
+                    ("task_updated", "Task updated"),
+                    ("archived", "Archived"),
+                    ("restored", "Restored"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_removed", False)),
+                fields=["priority_rank", "modified", "SN"],
+                name="product_list_keyset_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_removed", False)),
+                fields=["current_status", "priority_rank", "created", "SN"],
+                name="product_status_queue_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_removed", False)),
+                fields=["current_task", "priority_rank", "created", "SN"],
+                name="product_task_queue_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_removed", False)),
+                fields=["current_status", "priority_level"],
+                name="product_status_priority_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_removed", True)),
+                fields=["modified"],
+                name="product_archived_idx",
+            ),
+        ),
+    ]
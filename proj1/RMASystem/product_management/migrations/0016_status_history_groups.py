@@ -0,0 +1,49 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def capture_history_groups(apps, schema_editor):
+    # The category and priority level a product had when it entered a status were not kept, the history
+    # written so far takes the current ones of its product, like the analytics grouped it until now.
+    ProductStatus = apps.get_model("product_management", "ProductStatus")
+    Product = apps.get_model("product_management", "Product")
+    product = Product.objects.filter(SN=OuterRef("product_id"))
+    ProductStatus.objects.update(
+        category_id=Subquery(product.values("category_id")[:1]),
+        priority_level=Subquery(product.values("priority_level")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product_management", "0015_live_product_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productstatus",
+            name="category",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="status_history",
+                to="product_management.category",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productstatus",
+            name="priority_level",
+            field=models.CharField(
+                blank=True,
+                choices=[("normal", "Normal"), ("hot", "Hot"), ("zfa", "ZFA")],
+                max_length=10,
+            ),
+        ),
+        migrations.RunPython(capture_history_groups, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,16 @@
-from django.db import models
+from django.db import models, transaction, connections
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from model_utils.models import TimeStampedModel, SoftDeletableModel
+from model_utils.managers import SoftDeletableManager, SoftDeletableQuerySet
+from model_utils import FieldTracker
 import uuid
-from .utilhelpers import PRIORITY_LEVEL_CHOICES
-from ordered_model.models import OrderedModel
+from datetime import timedelta
+from .utilhelpers import PRIORITY_LEVEL_CHOICES, PRIORITY_LEVEL_RANKS, WORK_QUEUE_LEASE_MINUTES, TASK_SEQUENCE_GAP
+from .utilhelpers import EVENT_KIND_CHOICES
+from .status_graph import get_status_graph
+from ordered_model.models import OrderedModel, OrderedModelManager
 from django.db.models import Q
 
 
@@ -18,18 +24,48 @@ class Location(models.Model):
     rack_name = models.CharField(max_length=100, default='None Rack')
     layer_number = models.IntegerField(default=-1)
     space_number = models.IntegerField(default=-1)
+    #free-slot index of the allocator, false while a product holds the slot, see allocator.py
+    is_free = models.BooleanField(default=True)
 
     class Meta:
         unique_together = ('rack_name', 'layer_number', 'space_number')
+        indexes = [
+            models.Index(
+                fields=['rack_name', 'layer_number', 'space_number'],
+                condition=models.Q(is_free=True),
+                name='location_free_slot_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.rack_name} - Layer {self.layer_number} - Space {self.space_number}'
 
+    #builds every slot of the rack in memory and inserts them in batches, slots that already exist are skipped
+    #on the unique_together key instead of failing halfway, returns (number of slots created, number skipped)
     @staticmethod
-    def create_rack_with_layers_and_spaces(rack_name, num_layers, num_spaces_per_layer):
-        for layer in range(1, num_layers + 1):
-            for space in range(1, num_spaces_per_layer + 1):
-                Location.objects.create(rack_name=rack_name, layer_number=layer, space_number=space)
+    @transaction.atomic
+    def create_rack_with_layers_and_spaces(rack_name, num_layers, num_spaces_per_layer, batch_size=500):
+        slots = [
+            Location(rack_name=rack_name, layer_number=layer, space_number=space)
+            for layer in range(1, num_layers + 1)
+            for space in range(1, num_spaces_per_layer + 1)
+        ]
+        rack_slots = Location.objects.filter(rack_name=rack_name)
+        existing_count = rack_slots.count()
+        Location.objects.bulk_create(slots, batch_size=batch_size, ignore_conflicts=True)
+        created_count = rack_slots.count() - existing_count
+        return created_count, len(slots) - created_count
+
+    #rack_specs is an iterable of (rack_name, num_layers, num_spaces_per_layer), all racks are provisioned or none
+    @staticmethod
+    @transaction.atomic
+    def provision_racks(rack_specs, batch_size=500):
+        results = {}
+        for rack_name, num_layers, num_spaces_per_layer in rack_specs:
+            results[rack_name] = Location.create_rack_with_layers_and_spaces(
+                rack_name, num_layers, num_spaces_per_layer, batch_size=batch_size
+            )
+        return results
 
 class Status(TimeStampedModel):
     name = models.CharField(max_length=100, unique=True)
@@ -41,13 +77,19 @@ class Status(TimeStampedModel):
         return self.name
 
     def get_possible_next_statuses(self):
-        transitions = StatusTransition.objects.filter(from_status=self).order_by('created')
-        return [transition.to_status for transition in transitions]
+        return get_status_graph().get_possible_next_statuses(self.pk)
 
 class StatusTransition(TimeStampedModel):
-    from_status = models.ForeignKey(Status, related_name='transitions_from', on_delete=models.CASCADE)
+    #no index of its own, statustransition_from_idx leads with it
+    from_status = models.ForeignKey(Status, related_name='transitions_from', on_delete=models.CASCADE, db_index=False)
     to_status = models.ForeignKey(Status, related_name='transitions_to', on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            #the next statuses of a status in the order they were added
+            models.Index(fields=['from_status', 'created'], name='statustransition_from_idx'),
+        ]
+
     def __str__(self):
         return f'{self.from_status} -> {self.to_status}'
 
@@ -55,7 +97,8 @@ class Task(TimeStampedModel):
     action = models.CharField(
         max_length=100, 
         help_text="Action to be performed in this task", 
-        default="Default Action"
+        default="Default Action",
+        db_index=True
     )
     description = models.TextField(
         help_text="Detailed description of the task", 
@@ -67,22 +110,97 @@ class Task(TimeStampedModel):
     def __str__(self):
         return f"This Task: Action: {self.action} | description: {self.description}."
 
+#the position of the order-th task of a status template in a product's plan
+def task_sequence(order):
+    return (order + 1) * TASK_SEQUENCE_GAP
+
+
+#the sequence between two neighbours of a plan (None for the start or the end), None when they leave no room
+def sequence_between(before, after):
+    if after is None:
+        return (before if before is not None else 0) + TASK_SEQUENCE_GAP
+    low = before if before is not None else -1
+    if after - low < 2:
+        return None
+    return (low + after) // 2
+
+
+class StatusTaskManager(OrderedModelManager):
+
+    #replaces the task template of status by entries, a list of (task_id, is_predefined) in their new order.
+    #OrderedModel.to() moves a row with one UPDATE of every row after it, here the whole template is renumbered
+    #with one bulk UPDATE, tasks left out are deleted and new ones inserted with one query each.
+    #products already in the status keep the plan they were given, the template is copied when a product enters it
+    @transaction.atomic
+    def apply_template(self, status, entries):
+        task_ids = [task_id for task_id, is_predefined in entries]
+        if len(set(task_ids)) != len(task_ids):
+            raise ValidationError({'tasks': ['A task can only be in the template of a status once']})
+        known_task_ids = set(Task.objects.filter(pk__in=task_ids).values_list('pk', flat=True))
+        unknown_task_ids = [task_id for task_id in task_ids if task_id not in known_task_ids]
+        if unknown_task_ids:
+            raise ValidationError({'tasks': [f'Unknown tasks {", ".join(map(str, unknown_task_ids))}']})
+
+        kept = {}
+        stale = []
+        for status_task in self.select_for_update().filter(status=status):
+            if status_task.task_id in known_task_ids and status_task.task_id not in kept:
+                kept[status_task.task_id] = status_task
+            else:
+                stale.append(status_task.pk)
+
+        if stale:
+            self.filter(pk__in=stale).delete()
+        #OrderedModel's bulk_create appends new rows at the end of the status, the renumbering puts them in place
+        added = self.bulk_create([
+            self.model(status=status, task_id=task_id, is_predefined=is_predefined)
+            for task_id, is_predefined in entries if task_id not in kept
+        ])
+        placed = {**kept, **{status_task.task_id: status_task for status_task in added}}
+
+        changed = []
+        for order, (task_id, is_predefined) in enumerate(entries):
+            status_task = placed[task_id]
+            if (status_task.order, status_task.is_predefined) != (order, is_predefined):
+                status_task.order = order
+                status_task.is_predefined = is_predefined
+                changed.append(status_task)
+        self.bulk_update(changed, ['order', 'is_predefined'])
+        return list(self.filter(status=status).select_related('task').order_by('order'))
+
+
 class StatusTask(OrderedModel):
-    status = models.ForeignKey(Status, related_name='status_tasks', on_delete=models.CASCADE)
+    #no index of its own, statustask_predefined_idx leads with it
+    status = models.ForeignKey(Status, related_name='status_tasks', on_delete=models.CASCADE, db_index=False)
     task = models.ForeignKey(Task, related_name='task_statuses', on_delete=models.CASCADE)
     is_predefined = models.BooleanField(default=True, help_text="Indicates if the task is predefined for this status")
-    order = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    #no default: OrderedModel only appends a new row to the end of its status when order is None
+    order = models.PositiveIntegerField(editable=False, db_index=True)
     
     order_with_respect_to = 'status'
 
+    objects = StatusTaskManager()
+
     class Meta(OrderedModel.Meta):
         ordering = ['order']
+        indexes = [
+            #the predefined tasks of a status in order, read by every intake and status change
+            models.Index(fields=['status', 'is_predefined', 'order'], name='statustask_predefined_idx'),
+        ]
 
     def __str__(self):
         return f'- The task {self.task.action} under - status {self.status.name} - with the order {self.order}'
     
+#a predefined task the product still has active, from an earlier status or added by hand, is not assigned a second
+#time (unique_active_product_task): the product keeps the one it has where it is in its plan. active_tasks are the
+#(sequence, created, task_id) of the product's active tasks, ProductManager.bulk_transition applies the same rule
+def unassigned_tasks(predefined_status_tasks, active_tasks):
+    active_task_ids = {task_id for sequence, created, task_id in active_tasks}
+    return [status_task for status_task in predefined_status_tasks if status_task.task_id not in active_task_ids]
+
 class ProductTask(TimeStampedModel):
-    product = models.ForeignKey('Product', related_name='tasks_of_product', on_delete=models.CASCADE)
+    #no index of its own, the plan indexes and unique_active_product_task lead with it
+    product = models.ForeignKey('Product', related_name='tasks_of_product', on_delete=models.CASCADE, db_index=False)
     task = models.ForeignKey('Task', related_name='products_of_task', on_delete=models.CASCADE)
     is_completed = models.BooleanField(default=False)
     is_skipped = models.BooleanField(default=False)
@@ -99,6 +217,14 @@ class ProductTask(TimeStampedModel):
         blank=True, 
         null=True
     )
+    #the product's own ordered plan: the status the task was assigned under and its position, derived from the
+    #StatusTask order when the task is created (task_sequence), so locating the current task does not have to join
+    #through StatusTask. Positions are TASK_SEQUENCE_GAP apart to leave room for tasks inserted into one plan
+    status = models.ForeignKey('Status', related_name='product_tasks', on_delete=models.CASCADE, null=True, blank=True)
+    sequence = models.PositiveIntegerField(default=0, help_text="Position of the task in the product's task plan")
+
+    #the search document is only rewritten when the searchable text changed
+    tracker = FieldTracker(fields=['result', 'note'])
 
     class Meta:
         constraints = [
@@ -108,11 +234,26 @@ class ProductTask(TimeStampedModel):
                 name='unique_active_product_task'
             )
         ]
+        indexes = [
+            #the whole plan of a product in order (history, export, task insertion)
+            models.Index(fields=['product', 'sequence', 'created'], name='producttask_plan_idx'),
+            #only the tasks still to do, where the current task is looked up after every task and status change
+            models.Index(
+                fields=['product', 'sequence', 'created'],
+                condition=models.Q(is_completed=False, is_skipped=False),
+                name='producttask_active_idx'
+            ),
+        ]
 
     def __str__(self):
-        return f'{self.product.SN} - {self.task.action} (UUID: {self.unique_id})'
+        #product_id is the SN, so listing tasks does not load their products
+        return f'{self.product_id} - {self.task.action} (UUID: {self.unique_id})'
     
+    #the task, the current task of the product and the event on the change feed are written in one transaction
+    @transaction.atomic
     def update_task(self, is_now_completed=False, is_now_skipped=False, result=None, note=None):
+        from .events import record_events, task_changed
+
         if not self.is_completed and not self.is_skipped:
             self.is_completed = is_now_completed
             self.is_skipped = is_now_skipped
@@ -120,7 +261,10 @@ class ProductTask(TimeStampedModel):
                 self.result = result
         if note is not None:
             self.note = note
+        is_changed = is_now_completed or is_now_skipped or bool(self.tracker.changed())
         self.save()
+        if is_changed:
+            record_events([task_changed(self)])
 
         #if update the current task as completed or skipped, then we need to locate the current task of the product
         if is_now_completed or is_now_skipped:
@@ -128,7 +272,10 @@ class ProductTask(TimeStampedModel):
 
         
 
+    @transaction.atomic
     def skip_task(self):
+        from .events import record_events, task_changed
+
         if self.is_completed or self.is_skipped:
             raise ValueError("Cannot skip a task that has already been completed or skipped.")
         
@@ -137,28 +284,330 @@ class ProductTask(TimeStampedModel):
         #append the 'Skipped' to the front of the result
         self.result = f'Skipped - {self.result}'
         self.save()
+        record_events([task_changed(self)])
 
-        if self.product.current_task == self.task:
-            self.product.current_task = self.product.locate_current_task()
-            self.product.save(update_fields=['current_task'])
+        #compare ids so neither task has to be loaded, locate_current_task saves the product itself
+        if self.product.current_task_id == self.task_id:
+            self.product.locate_current_task()
         
 class ProductStatus(TimeStampedModel):
-    product = models.ForeignKey('Product', related_name='status_history_of_product', on_delete=models.CASCADE)
+    #no index of its own, productstatus_product_idx leads with it
+    product = models.ForeignKey('Product', related_name='status_history_of_product', on_delete=models.CASCADE, db_index=False)
     status = models.ForeignKey(Status, related_name='products_under_status', on_delete=models.CASCADE)
     changed_at = models.DateTimeField(auto_now_add=True)
+    #the category and priority level of the product when it entered the status, the time-in-status analytics group
+    #by them (see analytics.py) so a later change of the product does not move its past visits. No index, the history
+    #is never looked up by category
+    category = models.ForeignKey(
+        'Category', related_name='status_history', on_delete=models.SET_NULL, null=True, blank=True, db_index=False
+    )
+    priority_level = models.CharField(max_length=10, choices=PRIORITY_LEVEL_CHOICES, blank=True)
+
+    class Meta:
+        indexes = [
+            #the status history of a product in order
+            models.Index(fields=['product', 'changed_at', 'id'], name='productstatus_product_idx'),
+            #the analytics refresh finds the products with history since its last run, see analytics.py
+            models.Index(fields=['changed_at'], name='productstatus_changed_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.product.SN} - {self.status.name} at {self.changed_at}'
+        return f'{self.product_id} - {self.status.name} at {self.changed_at}'
+
+    #the unsaved history row of product entering status
+    @classmethod
+    def entered(cls, product, status):
+        return cls(product=product, status=status, category_id=product.category_id, priority_level=product.priority_level)
     
     def get_product_status_result(self):
-        tasks = ProductTask.objects.filter(product=self.product, task__statustask__status=self.status).order_by('task__statustask__created')
-        result = f'{self.status.name}: '
-        for task in tasks:
-            result += f'{task.task.action} - {task.result}'
-            if task.note:
-                result += f' - Note: {task.note}'
-            result += ' | '
-        return result
+        from .history import build_status_histories
+
+        history = build_status_histories([self.product_id])[self.product_id]
+        return next(visit.result_text() for visit in history.visits if visit.product_status.pk == self.pk)
+
+#archiving is the soft-delete of SoftDeletableModel: an archived product keeps its row, history and tasks but leaves
+#every list, queue and count. The bulk versions give the same end state as setting is_removed and calling save() on
+#every product (counters, change feed events, snapshots) with bulk writes in one transaction, and return a dict of
+#SN -> None when the product changed, or the reason it did not
+class ProductArchiveMixin:
+
+    @transaction.atomic
+    def bulk_archive(self, sns, batch_size=500):
+        return self._set_removed(sns, True, batch_size)
+
+    @transaction.atomic
+    def bulk_restore(self, sns, batch_size=500):
+        return self._set_removed(sns, False, batch_size)
+
+    def _set_removed(self, sns, is_removed, batch_size):
+        from .counters import products_added, products_removed
+        from .events import record_events, removal_changed
+        from .snapshots import invalidate_product_snapshots
+
+        results = {sn: 'Product not found' for sn in sns}
+        products = []
+        now = timezone.now()
+        for product in self.model.all_objects.filter(SN__in=sns).select_for_update():
+            if product.is_removed == is_removed:
+                results[product.SN] = 'Product is already archived' if is_removed else 'Product is not archived'
+                continue
+            results[product.SN] = None
+            product.is_removed = is_removed
+            #an archived unit leaves the work queue, and the claim of its bench with it
+            if is_removed:
+                product.claimed_by = ''
+                product.claimed_until = None
+            product.modified = now
+            products.append(product)
+
+        self.model.all_objects.bulk_update(
+            products, ['is_removed', 'claimed_by', 'claimed_until', 'modified'], batch_size=batch_size
+        )
+        (products_removed if is_removed else products_added)(products)
+        record_events([removal_changed(product) for product in products], batch_size=batch_size)
+        invalidate_product_snapshots([product.SN for product in products])
+        return results
+
+
+#the archived products only, restore them with bulk_restore. delete() stays a soft delete, all_objects deletes for good
+class ArchivedProductManager(ProductArchiveMixin, models.Manager):
+    _queryset_class = SoftDeletableQuerySet
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_removed=True)
+
+
+#the live products, see Product.live
+class ProductManager(ProductArchiveMixin, SoftDeletableManager):
+
+    #bulk intake of a whole RMA pallet, gives the same end state as calling save() on every new product:
+    #the initial status is resolved once, and products, their first ProductStatus rows and the predefined
+    #ProductTasks are inserted with bulk_create, so the number of queries does not grow with the batch
+    #(beyond bulk_create's own batching)
+    @transaction.atomic
+    def bulk_intake(self, rows, status=None, batch_size=500):
+        products = [self.model(**row) for row in rows]
+        self._validate_intake(products)
+
+        if status is None:
+            status, created = Status.objects.get_or_create(name="RMA Sorting")
+        predefined_tasks = list(
+            status.status_tasks.filter(is_predefined=True).order_by('order').values_list('task_id', 'order')
+        )
+
+        #the first predefined task is the current task, except a closed status which has neither task nor location
+        first_task_id = predefined_tasks[0][0] if predefined_tasks and not status.is_closed else None
+        for product in products:
+            product.current_status = status
+            product.current_task_id = first_task_id
+            product.priority_rank = PRIORITY_LEVEL_RANKS[product.priority_level]
+            if status.is_closed:
+                product.location = None
+
+        self.bulk_create(products, batch_size=batch_size)
+        ProductStatus.objects.bulk_create(
+            [ProductStatus.entered(product, status) for product in products],
+            batch_size=batch_size
+        )
+        ProductTask.objects.bulk_create(
+            [
+                ProductTask(
+                    product=product, task_id=task_id, is_predefined=True, status=status, sequence=task_sequence(order)
+                )
+                for product in products
+                for task_id, order in predefined_tasks
+            ],
+            batch_size=batch_size
+        )
+        #bulk_create skips the post_save that indexes a product for search, counts it on the dashboard and takes its slot
+        from .search import index_new_products
+        from .counters import products_added
+        from .allocator import occupy_locations
+        from .events import product_saved_events, record_events
+
+        index_new_products(products, batch_size=batch_size)
+        products_added(products)
+        occupy_locations([product.location_id for product in products])
+        record_events(
+            [event for product in products for event in product_saved_events(product, is_new=True)],
+            batch_size=batch_size
+        )
+        #the trackers still hold the values from before the intake (no status), save() would take a later edit for a
+        #status change
+        for product in products:
+            product.tracker.set_saved_fields()
+        return products
+
+    def _validate_intake(self, products):
+        sn_field = self.model._meta.get_field('SN')
+        errors = {}
+        seen_sns = set()
+        for product in products:
+            try:
+                sn_field.clean(product.SN, product)
+            except ValidationError as e:
+                errors.setdefault(product.SN, []).extend(e.messages)
+            if product.priority_level not in PRIORITY_LEVEL_CHOICES:
+                errors.setdefault(product.SN, []).append(f'Unknown priority level {product.priority_level}')
+            if product.SN in seen_sns:
+                errors.setdefault(product.SN, []).append('SN appears more than once in this batch')
+            seen_sns.add(product.SN)
+
+        #SN is the primary key, so soft-removed products also block the intake
+        for sn in self.model.all_objects.filter(SN__in=seen_sns).values_list('SN', flat=True):
+            errors.setdefault(sn, []).append('Product with this SN already exists')
+
+        if errors:
+            raise ValidationError({str(sn): messages for sn, messages in errors.items()})
+
+    #moves a whole batch of products to to_status with the same end state as setting current_status and calling
+    #save() on each of them, but with bulk writes in one transaction. Every move is checked against the
+    #StatusTransition graph, returns a dict of SN -> None when the product moved, or the reason it did not.
+    #like save(), a predefined task of to_status that the product still has active is not assigned again
+    @transaction.atomic
+    def bulk_transition(self, sns, to_status, batch_size=500):
+        sns = list(dict.fromkeys(sns))
+        results = {sn: 'Product not found' for sn in sns}
+        status_graph = get_status_graph()
+        predefined_status_tasks = list(
+            to_status.status_tasks.filter(is_predefined=True).order_by('order').values_list('task_id', 'order')
+        )
+        predefined_task_ids = [task_id for task_id, order in predefined_status_tasks]
+
+        #an active task can only be assigned once to a product (unique_active_product_task), the product keeps it
+        active_tasks = set(
+            ProductTask.objects.filter(
+                product_id__in=sns, task_id__in=predefined_task_ids, is_completed=False, is_skipped=False
+            ).values_list('product_id', 'task_id')
+        )
+
+        products = []
+        for product in self.filter(SN__in=sns).select_for_update():
+            if product.current_status_id == to_status.pk:
+                results[product.SN] = f'Product is already in status {to_status.name}'
+            elif not status_graph.can_transition(product.current_status_id, to_status.pk):
+                from_status = status_graph.get_status(product.current_status_id)
+                results[product.SN] = f'No transition from {from_status} to {to_status.name}'
+            else:
+                results[product.SN] = None
+                products.append(product)
+
+        ProductStatus.objects.bulk_create(
+            [ProductStatus.entered(product, to_status) for product in products],
+            batch_size=batch_size
+        )
+        ProductTask.objects.bulk_create(
+            [
+                ProductTask(
+                    product=product, task_id=task_id, is_predefined=True, status=to_status,
+                    sequence=task_sequence(order)
+                )
+                for product in products
+                for task_id, order in predefined_status_tasks
+                if (product.SN, task_id) not in active_tasks
+            ],
+            batch_size=batch_size
+        )
+
+        #the first active task of each product's plan, as locate_current_task would find it
+        current_task_ids = {}
+        if not to_status.is_closed:
+            first_active_tasks = ProductTask.objects.filter(
+                product_id__in=[product.SN for product in products], is_completed=False, is_skipped=False
+            ).order_by('product_id', 'sequence', 'created').values_list('product_id', 'task_id')
+            for product_id, task_id in first_active_tasks:
+                current_task_ids.setdefault(product_id, task_id)
+
+        from .counters import counter_key, products_moved
+        from .allocator import free_locations, release_location
+        from .snapshots import invalidate_product_snapshots
+        from .events import location_changed, record_events, status_changed
+
+        old_counter_keys = [counter_key(product) for product in products]
+        released_location_ids = []
+        events = []
+        now = timezone.now()
+        for product in products:
+            from_status_id = product.current_status_id
+            product.current_status = to_status
+            product.current_task_id = current_task_ids.get(product.SN)
+            if to_status.is_closed:
+                released_location_ids.append(product.location_id)
+                release_location(product)
+            events.append(status_changed(product, from_status_id))
+            if to_status.is_closed and released_location_ids[-1] is not None:
+                events.append(location_changed(product, released_location_ids[-1]))
+            #a unit that moved on leaves the work queue claim of its bench
+            product.claimed_by = ''
+            product.claimed_until = None
+            product.modified = now
+        self.bulk_update(
+            products,
+            ['current_status', 'current_task', 'location', 'claimed_by', 'claimed_until', 'modified'],
+            batch_size=batch_size
+        )
+        products_moved(old_counter_keys, products)
+        free_locations(released_location_ids)
+        record_events(events, batch_size=batch_size)
+        invalidate_product_snapshots([product.SN for product in products])
+        return results
+
+    #the work queue of a status or a task: most urgent priority first, then the oldest unit
+    def work_queue(self, status=None, task=None):
+        queue = self.all()
+        if status is not None:
+            queue = queue.filter(current_status=status)
+        if task is not None:
+            queue = queue.filter(current_task=task)
+        return queue.order_by('priority_rank', 'created', 'SN')
+
+    #hands the next count unclaimed units of the queue to one bench, leased for lease_minutes.
+    #on databases with SKIP LOCKED (PostgreSQL) the candidate rows are locked and rows locked by other benches are
+    #skipped, elsewhere (SQLite) the lease columns are the lock: the UPDATE only takes rows that are still free,
+    #so a unit is never handed to two benches at once
+    @transaction.atomic
+    def claim_next(self, claimed_by, count=1, status=None, task=None, lease_minutes=WORK_QUEUE_LEASE_MINUTES):
+        now = timezone.now()
+        claimed_until = now + timedelta(minutes=lease_minutes)
+        is_free = Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+        available = self.work_queue(status, task).filter(is_free)
+
+        if connections[self.db].features.has_select_for_update_skip_locked:
+            claimed_sns = list(available.select_for_update(skip_locked=True).values_list('SN', flat=True)[:count])
+            self.filter(SN__in=claimed_sns).update(claimed_by=claimed_by, claimed_until=claimed_until, modified=now)
+        else:
+            claimed_sns = []
+            #another bench can take some of the candidates between the read and the UPDATE, so try a few times
+            for attempt in range(3):
+                candidate_sns = list(available.exclude(SN__in=claimed_sns).values_list('SN', flat=True)[:count - len(claimed_sns)])
+                if not candidate_sns:
+                    break
+                self.filter(is_free, SN__in=candidate_sns).update(
+                    claimed_by=claimed_by, claimed_until=claimed_until, modified=now
+                )
+                claimed_sns += self.filter(
+                    SN__in=candidate_sns, claimed_by=claimed_by, claimed_until=claimed_until
+                ).values_list('SN', flat=True)
+                if len(claimed_sns) >= count:
+                    break
+
+        #the claim is part of the snapshot, update() sends no post_save
+        from .snapshots import invalidate_product_snapshots
+
+        invalidate_product_snapshots(claimed_sns)
+        return list(
+            self.work_queue().filter(SN__in=claimed_sns).select_related('category', 'current_status', 'current_task', 'location')
+        )
+
+    #gives units claimed by a bench back to the queue
+    @transaction.atomic
+    def release_claims(self, sns, claimed_by):
+        from .snapshots import invalidate_product_snapshots
+
+        released = self.filter(SN__in=sns, claimed_by=claimed_by).update(claimed_by='', claimed_until=None, modified=timezone.now())
+        #after the UPDATE, and again on commit, so no reader caches the claim that is being released
+        invalidate_product_snapshots(sns)
+        return released
 
 class Product(TimeStampedModel, SoftDeletableModel):
     SN = models.CharField(
@@ -176,19 +625,56 @@ class Product(TimeStampedModel, SoftDeletableModel):
     )
     category = models.ForeignKey('Category', related_name='products', on_delete=models.CASCADE)
     priority_level = models.CharField(max_length=10, choices=PRIORITY_LEVEL_CHOICES, default='normal', help_text="Indicates if the unit is Normal, Hot, or ZFA")
+    #kept in sync with priority_level on save, so queues and lists can sort by urgency on an index
+    priority_rank = models.PositiveSmallIntegerField(default=PRIORITY_LEVEL_RANKS['normal'], editable=False, help_text="Sortable priority, 0 is the most urgent")
     description = models.TextField(blank=True, help_text="Notes or description of the product")
     
     #here the current_status map to the Status model, and the current_task map to the Task model
     #Take care of the case that we actually need productStatus and productTask instances instead
-    current_status = models.ForeignKey('Status', related_name='ALL_products', on_delete=models.CASCADE, null=True, blank=True)
-    current_task = models.ForeignKey('Task', related_name='All_products', on_delete=models.SET_NULL, null=True, blank=True)
+    #no indexes of their own, the work queue indexes lead with them. Archived products are not in those, a status or
+    #task is rarely deleted and its archived products are then found with a scan
+    current_status = models.ForeignKey('Status', related_name='ALL_products', on_delete=models.CASCADE, null=True, blank=True, db_index=False)
+    current_task = models.ForeignKey('Task', related_name='All_products', on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
     location = models.OneToOneField('Location', on_delete=models.CASCADE, related_name='product', null=True, blank=True)
+    #work queue lease: the bench that claimed the unit and until when
+    claimed_by = models.CharField(max_length=100, blank=True, default='')
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    #live products are the ones on the floor, the default (objects is the same) and what the partial indexes cover.
+    #archived products stay in the table for their history, all_objects has both
+    objects = ProductManager()
+    live = ProductManager()
+    archived = ArchivedProductManager()
+    tracker = FieldTracker(fields=['current_status', 'description', 'priority_level', 'location', 'is_removed'])
 
     class Meta:
+        #SN is the primary key and location a OneToOneField, both are unique already
         constraints = [
-            models.UniqueConstraint(fields=['SN'], name='unique_sn_constraint'),
             models.CheckConstraint(check=models.Q(SN__regex=r'^\d{13}$'), name='check_sn_digits_constraint'),
-            models.UniqueConstraint(fields=['location'], name='unique_product_location_constraint')
+        ]
+        #the indexes of lists, queues and counts only cover live products (is_removed is false, the filter of the
+        #default manager), so archived RMAs piling up in the table do not make them larger
+        indexes = [
+            #keyset pagination order of the product list
+            models.Index(
+                fields=['priority_rank', 'modified', 'SN'], condition=models.Q(is_removed=False), name='product_list_keyset_idx'
+            ),
+            #work queues by status and by task
+            models.Index(
+                fields=['current_status', 'priority_rank', 'created', 'SN'], condition=models.Q(is_removed=False),
+                name='product_status_queue_idx'
+            ),
+            models.Index(
+                fields=['current_task', 'priority_rank', 'created', 'SN'], condition=models.Q(is_removed=False),
+                name='product_task_queue_idx'
+            ),
+            #the units of a status by priority level (dashboard counters, exports)
+            models.Index(
+                fields=['current_status', 'priority_level'], condition=models.Q(is_removed=False),
+                name='product_status_priority_idx'
+            ),
+            #archived products, the latest first
+            models.Index(fields=['modified'], condition=models.Q(is_removed=True), name='product_archived_idx'),
         ]
 
     def __str__(self):
@@ -196,87 +682,182 @@ class Product(TimeStampedModel, SoftDeletableModel):
         return f'Product SN: {self.SN} | Priority: {self.priority_level} | Current Status: {self.current_status.name if self.current_status else "No status"} | Action of Task: {current_task_action}'
 
     def save(self, *args, **kwargs):
-        is_new = not self.pk
-        previous_status = None
-
-        if is_new:
-            if not self.current_status:
-                rma_sorting_status, created = Status.objects.get_or_create(name="RMA Sorting")
-                self.current_status = rma_sorting_status
-        else:
-            previous_status = Product.objects.get(pk=self.pk).current_status
-
-        super().save(*args, **kwargs)
-        
-        if is_new or previous_status != self.current_status:
-            ProductStatus.objects.create(product=self, status=self.current_status)
-            self.assign_predefined_tasks_by_status()
-            self.locate_current_task()
+        #SN is the primary key and is always set by the user, so pk cannot tell us whether the product is new
+        is_new = self._state.adding
+
+        self.priority_rank = PRIORITY_LEVEL_RANKS.get(self.priority_level, PRIORITY_LEVEL_RANKS['normal'])
+        if kwargs.get('update_fields') is not None and 'priority_level' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'priority_rank'}
+
+        if is_new and not self.current_status_id:
+            rma_sorting_status, created = Status.objects.get_or_create(name="RMA Sorting")
+            self.current_status = rma_sorting_status
+
+        from .events import product_saved_events, record_events
+
+        #the tracker compares with the status loaded from the database, so no extra read is needed to detect a change
+        if not is_new and not self.tracker.has_changed('current_status'):
+            if not self.tracker.has_changed('location') and not self.tracker.has_changed('is_removed'):
+                return super().save(*args, **kwargs)
+            #a new location, archiving and restoring are published on the change feed in the same transaction. The
+            #events are made before saving, the tracker forgets the previous values once the row is written
+            events = product_saved_events(self, is_new)
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                record_events(events)
+            return
+
+        #the status history row, the new tasks, the current task and the location release are written in one
+        #transaction, and the product row itself is written only once
+        with transaction.atomic():
+            predefined_status_tasks = self.get_predefined_status_tasks()
+            if not is_new:
+                #the active tasks of the plan as (sequence, created, task_id), read once to leave out the predefined
+                #tasks the product still has active and to find the current task among the old and new ones
+                active_tasks = []
+                if predefined_status_tasks or not self.current_status.is_closed:
+                    active_tasks = list(self.tasks_of_product.filter(is_completed=False, is_skipped=False).values_list(
+                        'sequence', 'created', 'task_id'
+                    ))
+                new_tasks = self.write_status_history(unassigned_tasks(predefined_status_tasks, active_tasks))
+                active_tasks += [(product_task.sequence, product_task.created, product_task.task_id) for product_task in new_tasks]
 
             # Check if the product is moving to a closed status
-            if self.current_status and self.current_status.is_closed:
-                # Release the location
-                self.location = None
-                # Set current_task to None
+            if self.current_status.is_closed:
+                # Release the location and set current_task to None, the allocator frees the slot once saved
+                from .allocator import release_location
+
+                release_location(self)
                 self.current_task = None
-                # Save the changes
-                self.save(update_fields=['location', 'current_task'])
+            elif is_new:
+                # A new product has no other tasks, so its first predefined task is the current one
+                self.current_task = predefined_status_tasks[0].task if predefined_status_tasks else None
+            else:
+                #the first active task of the ordered plan, as find_current_task would find it
+                self.current_task_id = min(active_tasks)[2] if active_tasks else None
+
+            # A unit that moved on leaves the work queue claim of its bench
+            self.claimed_by = ''
+            self.claimed_until = None
+
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {
+                    *kwargs['update_fields'], 'current_status', 'current_task', 'location', 'claimed_by', 'claimed_until'
+                }
+            events = product_saved_events(self, is_new)
+            super().save(*args, **kwargs)
+
+            if is_new:
+                #the history and task rows reference the product, so for a new product they follow its INSERT
+                self.write_status_history(predefined_status_tasks)
+            record_events(events)
+
+    #the history row is written before the tasks are built, so every task of a status visit is created after it began
+    def write_status_history(self, predefined_status_tasks):
+        ProductStatus.entered(self, self.current_status).save()
+        return ProductTask.objects.bulk_create(self.build_predefined_tasks(predefined_status_tasks))
+
+    #the current task is the first active task of the product's ordered plan, found with one query on producttask_active_idx
+    def find_current_task(self):
+        first_active_producttask = self.tasks_of_product.filter(
+            is_completed=False, is_skipped=False
+        ).select_related('task').order_by('sequence', 'created').first()
+        return first_active_producttask.task if first_active_producttask else None
 
-    #every time before we call this method, we need to make sure that the current_task is not None or the producttask of current_task is inactivated already.
     #return the current task of the product after locating
     def locate_current_task(self):
-        
-        first_active_producttask = self.tasks_of_product.filter(is_completed=False, is_skipped = False).select_related('task__statustask').order_by('task__statustask__order').first()
-        current_producttask = self.tasks_of_product.filter(task=self.current_task).first()
-        new_current_productTask = first_active_producttask if first_active_producttask else None
+        new_current_task = self.find_current_task()
 
-        if current_producttask != new_current_productTask:
-            self.current_task = new_current_productTask.task if new_current_productTask else None
+        if self.current_task_id != (new_current_task.pk if new_current_task else None):
+            self.current_task = new_current_task
             self.save(update_fields=['current_task'])
+        else:
+            self.current_task = new_current_task
 
         return self.current_task
 
+    def get_predefined_status_tasks(self):
+        return list(self.current_status.status_tasks.filter(is_predefined=True).select_related('task').order_by('order'))
+
+    #the unsaved product tasks for the predefined tasks of the current status, in the order of the status
+    def build_predefined_tasks(self, status_tasks_predefined):
+        return [
+            ProductTask(
+                product=self,
+                task=status_task.task,
+                is_predefined=True,
+                status_id=status_task.status_id,
+                sequence=task_sequence(status_task.order)
+            )
+            for status_task in status_tasks_predefined
+        ]
+
     def assign_predefined_tasks_by_status(self):
-        status_tasks_predefined = self.current_status.status_tasks.filter(is_predefined=True).order_by('order')
-        for status_task in status_tasks_predefined:
-            ProductTask.objects.create(product=self, task=status_task.task, is_predefined=True)
+        return ProductTask.objects.bulk_create(self.build_predefined_tasks(self.get_predefined_status_tasks()))
 
     def assign_tasks(self, task, set_as_predefined_of_status=False):
-        # Check if a StatusTask with the same status and task already exists
-        if not StatusTask.objects.filter(status=self.current_status, task=task).exists():
-            StatusTask.objects.create(
-                status=self.current_status,
-                task=task,
-                defaults={'is_predefined': set_as_predefined_of_status}
-            )
+        # Get the StatusTask of this task under the current status, or append it to the status
+        status_task, created = StatusTask.objects.get_or_create(
+            status=self.current_status,
+            task=task,
+            defaults={'is_predefined': set_as_predefined_of_status}
+        )
         # Create a ProductTask for the product
-        ProductTask.objects.create(product=self, task=task, is_predefined=set_as_predefined_of_status)
+        ProductTask.objects.create(
+            product=self,
+            task=task,
+            is_predefined=set_as_predefined_of_status,
+            status=self.current_status,
+            sequence=task_sequence(status_task.order)
+        )
 
+    #inserts task into the product's own plan of its current status at position (1 for the first). The new task takes
+    #a sequence between its neighbours, so no other row moves; only when they are adjacent is the plan renumbered,
+    #with one bulk UPDATE. The status template is left alone unless set_as_predefined_of_status, then the task is
+    #appended to it for the products that enter the status later
+    @transaction.atomic
     def insert_task_at_position(self, task, position, set_as_predefined_of_status=False):
-        # Get the number of completed tasks
-        num_inactive_tasks = self.tasks_of_product.filter(Q(is_completed=True) | Q(is_skipped = True)).count()
+        plan = list(
+            self.tasks_of_product.filter(status=self.current_status).order_by('sequence', 'created').values_list(
+                'pk', 'sequence', 'is_completed', 'is_skipped'
+            )
+        )
+        num_inactive_tasks = sum(is_completed or is_skipped for pk, sequence, is_completed, is_skipped in plan)
 
         # Check if the target position is within the range of completed tasks
         if position <= num_inactive_tasks:
             raise ValueError("Cannot insert a task at a position within the range of completed or skipped tasks.")
+        if self.tasks_of_product.filter(task=task, is_completed=False, is_skipped=False).exists():
+            raise ValueError(f"The task {task.action} is already an active task of the product.")
+
+        index = min(position, len(plan) + 1) - 1
+        before = plan[index - 1][1] if index > 0 else None
+        after = plan[index][1] if index < len(plan) else None
+        sequence = sequence_between(before, after)
+        if sequence is None:
+            #no room left between the neighbours, space the whole plan out again, leaving the gap at index
+            ProductTask.objects.bulk_update(
+                [
+                    ProductTask(pk=row[0], sequence=task_sequence(i + (i >= index)))
+                    for i, row in enumerate(plan)
+                ],
+                ['sequence']
+            )
+            sequence = task_sequence(index)
 
-        # Create the new task at the specified position
-        status_task = StatusTask.objects.create(
-            status=self.current_status,
+        ProductTask.objects.create(
+            product=self,
             task=task,
-            is_predefined=set_as_predefined_of_status
+            is_predefined=set_as_predefined_of_status,
+            status=self.current_status,
+            sequence=sequence
         )
-        
-        # Move the task to the specified position
-        status_task.to(position - 1)  # `to` method uses zero-based index
-        
-        # Assign the task to the product
-        ProductTask.objects.create(product=self, task=task, is_predefined=set_as_predefined_of_status)
+        if set_as_predefined_of_status:
+            StatusTask.objects.get_or_create(status=self.current_status, task=task, defaults={'is_predefined': True})
+        self.locate_current_task()
 
     def get_all_tasks(self, only_active=False):
-        tasks = self.tasks_of_product.select_related('task__statustask__status').order_by(
-            'task__statustask__status__created', 'task__statustask__order'
-        )
+        tasks = self.tasks_of_product.select_related('task', 'status').order_by('status__created', 'sequence')
         if only_active:
             tasks = tasks.filter(is_completed=False, is_skipped=False)
         return tasks
@@ -288,13 +869,94 @@ class Product(TimeStampedModel, SoftDeletableModel):
 
 
     def get_possible_next_statuses(self):
-        return self.current_status.get_possible_next_statuses()
+        #read from the cached workflow graph by id, so current_status does not have to be loaded
+        return get_status_graph().get_possible_next_statuses(self.current_status_id)
 
     def list_status_result_history(self):
-        all_product_statuses = self.status_history_of_product.order_by('changed_at')
-        history = [f'Product SN: {self.SN}']
-        for product_status in all_product_statuses:
-            status_result = product_status.get_product_status_result()
-            history.append(f'{status_result} at {product_status.changed_at}')
-        return "\n".join(history)
-    
\ No newline at end of file
+        from .history import build_status_histories
+
+        return build_status_histories([self]).get(self.SN).as_text()
+    
+
+#searchable text of a product (product_task is null, the description) or of one of its tasks (the result and note).
+#kept in sync by the signals in signals.py, the full-text index over body is created by migration 0006:
+#an FTS5 table on SQLite, a GIN index on to_tsvector on PostgreSQL, see search.py
+class SearchDocument(models.Model):
+    product = models.ForeignKey('Product', related_name='search_documents', on_delete=models.CASCADE)
+    product_task = models.OneToOneField('ProductTask', related_name='search_document', on_delete=models.CASCADE, null=True, blank=True)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product'],
+                condition=models.Q(product_task__isnull=True),
+                name='unique_product_search_document'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} - {self.product_task_id or "description"}'
+
+
+#live number of products per status, priority level and rack (rack_name is blank for products without a location),
+#kept current by counters.py, so the dashboard reads a handful of rows instead of counting products
+class ProductCounter(models.Model):
+    status = models.ForeignKey('Status', related_name='product_counters', on_delete=models.CASCADE)
+    priority_level = models.CharField(max_length=10, choices=PRIORITY_LEVEL_CHOICES)
+    rack_name = models.CharField(max_length=100, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'priority_level', 'rack_name'], name='unique_product_counter')
+        ]
+
+    def __str__(self):
+        return f'{self.status.name} - {self.priority_level} - {self.rack_name or "No rack"}: {self.count}'
+
+
+#append-only log of product lifecycle changes for downstream systems, see events.py. The auto-incremented id is the
+#sequence of the change feed. product_sn is a plain column, so the events of a product outlive the product
+class ProductEvent(models.Model):
+    product_sn = models.CharField(max_length=13)
+    kind = models.CharField(max_length=20, choices=EVENT_KIND_CHOICES)
+    payload = models.JSONField(default=dict, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            #compaction looks for a later event of the same product and kind
+            models.Index(fields=['product_sn', 'kind', 'id'], name='productevent_compaction_idx'),
+        ]
+
+    def __str__(self):
+        return f'#{self.pk} {self.product_sn} {self.kind}'
+
+
+#one day of one status for one category and priority level, refreshed by analytics.py: the products that entered and
+#left the status that day, those in it at the end of the day (wip, 0 for closed statuses) and the time spent in the
+#status by the products that left it that day, in seconds. Days are UTC days
+class StatusDailyRollup(models.Model):
+    day = models.DateField()
+    status = models.ForeignKey('Status', related_name='daily_rollups', on_delete=models.CASCADE)
+    category = models.ForeignKey('Category', related_name='daily_rollups', on_delete=models.CASCADE)
+    priority_level = models.CharField(max_length=10, choices=PRIORITY_LEVEL_CHOICES)
+    entered = models.PositiveIntegerField(default=0)
+    exited = models.PositiveIntegerField(default=0)
+    wip = models.IntegerField(default=0)
+    dwell_avg = models.FloatField(null=True, blank=True)
+    dwell_p50 = models.FloatField(null=True, blank=True)
+    dwell_p90 = models.FloatField(null=True, blank=True)
+    dwell_p95 = models.FloatField(null=True, blank=True)
+    dwell_max = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'status', 'category', 'priority_level'], name='unique_status_daily_rollup'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.day} - {self.status.name} - {self.category.name} - {self.priority_level}'
@@ -0,0 +1,121 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+#keyset (cursor) pagination: a page continues right after the sort key of the last row of the previous page,
+#so the database seeks through the ordering index instead of counting and skipping rows with OFFSET.
+#the ordering must be ascending and end with a unique field, so that the sort key identifies a single row
+class KeysetPaginator:
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = ordering
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self.after_filter(self.decode_cursor(cursor)))
+
+        #one extra row tells us whether there is a next page without a COUNT(*)
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = self.encode_cursor(rows[-1]) if has_next else None
+        return KeysetPage(rows, next_cursor, is_first=not cursor)
+
+    def after_filter(self, key_values):
+        #(a, b, c) > (x, y, z)  <=>  a > x  or  (a = x and b > y)  or  (a = x and b = y and c > z)
+        condition = Q()
+        for i, field_name in enumerate(self.ordering):
+            equal_prefix = {name: key_values[name] for name in self.ordering[:i]}
+            condition |= Q(**equal_prefix, **{f'{field_name}__gt': key_values[field_name]})
+        return condition
+
+    def encode_cursor(self, obj):
+        key_values = {}
+        for field_name in self.ordering:
+            field = self.queryset.model._meta.get_field(field_name)
+            key_values[field_name] = field.value_to_string(obj)
+        return base64.urlsafe_b64encode(json.dumps(key_values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            raw_values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return {
+                field_name: self.queryset.model._meta.get_field(field_name).to_python(raw_values[field_name])
+                for field_name in self.ordering
+            }
+        except (ValueError, TypeError, KeyError, ValidationError) as e:
+            raise ValueError(f'Invalid page cursor: {cursor}') from e
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, is_first):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.is_first = is_first
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+#the planner's idea of the number of rows of model's table, None when the database keeps none.
+#PostgreSQL keeps it in pg_class (refreshed by ANALYZE and autovacuum), on SQLite the largest rowid is an upper
+#bound found at the end of the table's b-tree
+def estimated_count(model, using='default'):
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'SELECT MAX(rowid) FROM {table}')
+        else:
+            return None
+        row = cursor.fetchone()
+    #reltuples is -1 for a table that was never analyzed
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+#a Paginator that never counts a whole large table: count_hint() (an estimate, or a counter kept elsewhere) is used
+#when it is over count_limit, otherwise the rows are counted up to count_limit + 1 at most. Pages past the
+#count stay reachable and are simply empty, as the count is not exact
+class EstimatedCountPaginator(Paginator):
+    count_limit = 10000
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, count_hint=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.count_hint = count_hint
+
+    @cached_property
+    def count(self):
+        if self.count_hint is not None:
+            hint = self.count_hint()
+            if hint is not None and hint > self.count_limit:
+                return hint
+        return self.object_list.order_by()[:self.count_limit + 1].count()
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
@@ -0,0 +1,88 @@
+from datetime import datetime, timezone as dt_timezone
+from django.db import connections, transaction
+from .allocator import free_slots
+from .models import Product, ProductEvent, ProductStatus, ProductTask, StatusTask, StatusTransition
+
+
+#the hot queries of the app and the index each one is meant to be answered from, checked against the plans of
+#EXPLAIN by the check_query_plans command so an index lost or changed in a migration shows up. Every query is
+#built like its counterpart in the code (named in its comment), with placeholder values: plans depend on the
+#shape of the query, not on the values. The product indexes are partial, the queries go through the managers that
+#filter on is_removed like the code does.
+#On PostgreSQL sequential scans are disabled for the EXPLAIN, a small table would always be scanned otherwise
+
+SAMPLE_SN = '0000000000000'
+SAMPLE_ID = 1
+SAMPLE_TIME = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+HOT_QUERIES = [
+    #Product.find_current_task
+    ('current_task', 'producttask_active_idx', lambda: ProductTask.objects.filter(
+        product_id=SAMPLE_SN, is_completed=False, is_skipped=False
+    ).order_by('sequence', 'created')[:1]),
+    #ProductManager.bulk_transition, the first active task of every product moved
+    ('first_active_tasks', 'producttask_active_idx', lambda: ProductTask.objects.filter(
+        product_id__in=[SAMPLE_SN], is_completed=False, is_skipped=False
+    ).order_by('product_id', 'sequence', 'created').values_list('product_id', 'task_id')),
+    #build_status_histories and the export
+    ('task_plans', 'producttask_plan_idx', lambda: ProductTask.objects.filter(
+        product_id__in=[SAMPLE_SN]
+    ).order_by('product_id', 'sequence', 'created')),
+    ('status_histories', 'productstatus_product_idx', lambda: ProductStatus.objects.filter(
+        product_id__in=[SAMPLE_SN]
+    ).order_by('product_id', 'changed_at', 'pk')),
+    #analytics.intervals_cte, the products with history since the last refresh
+    ('history_since', 'productstatus_changed_idx', lambda: ProductStatus.objects.filter(
+        changed_at__gte=SAMPLE_TIME
+    ).values_list('product_id', flat=True)),
+    #ProductListView
+    ('product_list', 'product_list_keyset_idx', lambda: Product.objects.order_by('priority_rank', 'modified', 'SN')[:50]),
+    #Product.archived
+    ('archived_products', 'product_archived_idx', lambda: Product.archived.order_by('-modified')[:50]),
+    #ProductManager.work_queue
+    ('status_queue', 'product_status_queue_idx', lambda: Product.objects.filter(
+        current_status_id=SAMPLE_ID
+    ).order_by('priority_rank', 'created', 'SN')[:10]),
+    ('task_queue', 'product_task_queue_idx', lambda: Product.objects.filter(
+        current_task_id=SAMPLE_ID
+    ).order_by('priority_rank', 'created', 'SN')[:10]),
+    #the units of a status and priority level
+    ('status_priority', 'product_status_priority_idx', lambda: Product.objects.filter(
+        current_status_id=SAMPLE_ID, priority_level='hot'
+    ).values_list('SN', flat=True)),
+    #bulk_intake, bulk_transition and Product.get_predefined_status_tasks
+    ('predefined_tasks', 'statustask_predefined_idx', lambda: StatusTask.objects.filter(
+        status_id=SAMPLE_ID, is_predefined=True
+    ).order_by('order').values_list('task_id', 'order')),
+    ('next_statuses', 'statustransition_from_idx', lambda: StatusTransition.objects.filter(
+        from_status_id=SAMPLE_ID
+    ).order_by('created')),
+    #allocator.find_free_location
+    ('free_slot', 'location_free_slot_idx', lambda: free_slots().filter(
+        rack_name='R1'
+    ).order_by('rack_name', 'layer_number', 'space_number')[:1]),
+    #events.compact_events
+    ('event_compaction', 'productevent_compaction_idx', lambda: ProductEvent.objects.filter(
+        product_sn=SAMPLE_SN, kind='status_changed', pk__gt=SAMPLE_ID
+    ).values_list('pk', flat=True)),
+]
+
+
+def explain(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.explain()
+    with transaction.atomic(using=queryset.db):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+
+#returns [(name, index, plan, uses_index)] of every hot query
+def check_query_plans():
+    results = []
+    for name, index, build_queryset in HOT_QUERIES:
+        plan = explain(build_queryset())
+        results.append((name, index, plan, index in plan))
+    return results
@@ -0,0 +1,159 @@
+import re
+from django.db import connections
+from django.db.models import Q
+from .models import Product, ProductTask, SearchDocument
+
+
+#search over products: SN prefixes are answered with a range scan on the primary key index, free text with the
+#full-text index over SearchDocument.body (product descriptions, task results and notes). The full-text index is
+#an FTS5 table on SQLite and a GIN index on to_tsvector('english', body) on PostgreSQL, both created by migration
+#0006, other databases (or SQLite builds without FTS5) fall back to a case-insensitive scan of the documents.
+
+SEARCH_LIMIT = 50
+FTS_TABLE = 'product_management_searchdocument_fts'
+FTS_CONFIG = 'english'
+SN_LENGTH = 13
+TERM_RE = re.compile(r'\w+')
+
+#the ProductTask.result placeholder of a task nobody has worked on yet, not worth indexing
+UNSET_TASK_RESULT = ProductTask._meta.get_field('result').default
+
+_fts_tables = {}
+
+
+def is_sn_prefix(query):
+    return query.isdigit() and len(query) <= SN_LENGTH
+
+
+#SN__startswith becomes a LIKE that SQLite cannot answer from the primary key index, an equivalent range can.
+#SNs are digits only, so the prefix with its last digit incremented is the exclusive upper bound
+def sn_prefix_q(prefix, field='SN'):
+    if len(prefix) == SN_LENGTH:
+        return Q(**{field: prefix})
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+    q = Q(**{f'{field}__gte': prefix})
+    if upper is not None:
+        q &= Q(**{f'{field}__lt': upper})
+    return q
+
+
+#the same for any text column with a plain index: every string that starts with prefix sorts from prefix up to
+#prefix followed by the largest code point. Like the index itself, the match is case-sensitive
+def prefix_range_q(field, prefix):
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
+
+
+def product_body(product):
+    return (product.description or '').strip()
+
+
+def product_task_body(product_task):
+    texts = [product_task.result, product_task.note]
+    return '\n'.join(text.strip() for text in texts if text and text.strip() and text != UNSET_TASK_RESULT)
+
+
+def index_product(product, created=False):
+    body = product_body(product)
+    if not body:
+        if not created:
+            SearchDocument.objects.filter(product=product, product_task=None).delete()
+        return
+    if not SearchDocument.objects.filter(product=product, product_task=None).update(body=body):
+        SearchDocument.objects.create(product=product, body=body)
+
+
+def index_product_task(product_task, created=False):
+    body = product_task_body(product_task)
+    if not body:
+        if not created:
+            SearchDocument.objects.filter(product_task=product_task).delete()
+        return
+    if not SearchDocument.objects.filter(product_task=product_task).update(body=body):
+        SearchDocument.objects.create(product_id=product_task.product_id, product_task=product_task, body=body)
+
+
+#for products inserted with bulk_create, which sends no post_save
+def index_new_products(products, batch_size=500):
+    SearchDocument.objects.bulk_create(
+        [SearchDocument(product=product, body=product_body(product)) for product in products if product_body(product)],
+        batch_size=batch_size
+    )
+
+
+def fulltext_backend(connection):
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        key = (connection.alias, connection.settings_dict['NAME'])
+        #only a found table is remembered, so the index is picked up once the migration has run
+        if not _fts_tables.get(key):
+            _fts_tables[key] = FTS_TABLE in connection.introspection.table_names(include_views=False)
+        if _fts_tables[key]:
+            return 'fts5'
+    return None
+
+
+#returns (product_id, product_task_id) of the documents matching the free text query, best match first
+def match_documents(query, limit=SEARCH_LIMIT, tasks_only=False):
+    terms = TERM_RE.findall(query)
+    if not terms:
+        return []
+    connection = connections[SearchDocument.objects.db]
+    backend = fulltext_backend(connection)
+    table = SearchDocument._meta.db_table
+    task_filter = 'AND d.product_task_id IS NOT NULL' if tasks_only else ''
+
+    if backend == 'fts5':
+        #every term is quoted, so FTS5 operators in the input are matched as text, and matched as a prefix
+        match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        sql = (
+            f'SELECT d.product_id, d.product_task_id FROM {FTS_TABLE} f JOIN {table} d ON d.id = f.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s {task_filter} ORDER BY f.rank LIMIT %s'
+        )
+        params = [match, limit]
+    elif backend == 'postgresql':
+        #the expression matches the one of the GIN index, so the index is used
+        sql = (
+            f"SELECT d.product_id, d.product_task_id FROM {table} d, websearch_to_tsquery('{FTS_CONFIG}', %s) q "
+            f"WHERE to_tsvector('{FTS_CONFIG}', d.body) @@ q {task_filter} "
+            f"ORDER BY ts_rank(to_tsvector('{FTS_CONFIG}', d.body), q) DESC LIMIT %s"
+        )
+        params = [query, limit]
+    else:
+        documents = SearchDocument.objects.filter(body__icontains=query)
+        if tasks_only:
+            documents = documents.filter(product_task__isnull=False)
+        return list(documents.values_list('product_id', 'product_task_id')[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def matching_product_sns(query, limit=SEARCH_LIMIT):
+    return list(dict.fromkeys(product_id for product_id, product_task_id in match_documents(query, limit)))
+
+
+def search_products(query, limit=SEARCH_LIMIT):
+    query = query.strip()
+    products = Product.objects.select_related('category', 'current_status', 'current_task', 'location')
+    if not query:
+        return []
+    if is_sn_prefix(query):
+        return list(products.filter(sn_prefix_q(query)).order_by('SN')[:limit])
+    sns = matching_product_sns(query, limit)
+    #removed products are left out by Product.objects, the ranking of the documents is kept
+    found = products.in_bulk(sns)
+    return [found[sn] for sn in sns if sn in found]
+
+
+def search_product_tasks(query, limit=SEARCH_LIMIT):
+    query = query.strip()
+    product_tasks = ProductTask.objects.select_related('product', 'task', 'status').filter(product__is_removed=False)
+    if not query:
+        return []
+    if is_sn_prefix(query):
+        return list(product_tasks.filter(sn_prefix_q(query, 'product_id')).order_by('product_id', 'sequence')[:limit])
+    ids = [product_task_id for product_id, product_task_id in match_documents(query, limit, tasks_only=True)]
+    found = product_tasks.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Status, StatusTransition, Product, ProductTask, ProductStatus
+from .status_graph import invalidate_status_graph
+from .search import index_product, index_product_task
+from .counters import product_saved, product_deleted
+from .allocator import product_location_saved, product_location_deleted
+from .snapshots import invalidate_product_snapshot
+
+
+@receiver([post_save, post_delete], sender=Status)
+@receiver([post_save, post_delete], sender=StatusTransition)
+def status_graph_changed(sender, **kwargs):
+    invalidate_status_graph()
+    #a worker may rebuild its graph before this change is committed, so replace the version once more after commit
+    transaction.on_commit(invalidate_status_graph)
+
+
+#the trackers still hold the values from before the save here, so unchanged text costs no query.
+#bulk_create sends no post_save, bulk_intake indexes its products itself
+@receiver(post_save, sender=Product)
+def product_search_document(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or instance.tracker.has_changed('description'):
+        index_product(instance, created=created)
+
+
+@receiver(post_save, sender=ProductTask)
+def product_task_search_document(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or instance.tracker.has_changed('result') or instance.tracker.has_changed('note'):
+        index_product_task(instance, created=created)
+
+
+#soft-delete saves the product with is_removed set, so it is counted off here too
+@receiver(post_save, sender=Product)
+def product_counters_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        product_saved(instance, created)
+
+
+@receiver(post_delete, sender=Product)
+def product_counters_deleted(sender, instance, **kwargs):
+    product_deleted(instance)
+
+
+@receiver(post_save, sender=Product)
+def product_location_slot_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        product_location_saved(instance, created)
+
+
+@receiver(post_delete, sender=Product)
+def product_location_slot_deleted(sender, instance, **kwargs):
+    product_location_deleted(instance)
+
+
+#covers Product.save, update_task and skip_task (they save the task and then the product) and every new status visit
+@receiver([post_save, post_delete], sender=Product)
+def product_snapshot_changed(sender, instance, **kwargs):
+    invalidate_product_snapshot(instance.SN)
+
+
+@receiver([post_save, post_delete], sender=ProductTask)
+@receiver([post_save, post_delete], sender=ProductStatus)
+def product_snapshot_rows_changed(sender, instance, **kwargs):
+    invalidate_product_snapshot(instance.product_id)
@@ -0,0 +1,163 @@
+import threading
+from django.core.cache import caches
+from django.db import transaction
+from .models import Product, ProductTask
+
+
+#read-through cache of product snapshots: the product with its category, status, current task, location and
+#active tasks as plain data, built with two queries on a miss and kept in the product_snapshots cache (locmem by
+#default, see CACHES in settings.py, which also sets the TTL and the maximum number of entries).
+#Writes invalidate: saving a Product, ProductTask or ProductStatus through the signals in signals.py, and the bulk
+#writes of ProductManager directly. The entry is deleted right away and once more after commit, so a reader
+#that rebuilt it from the old rows in between does not keep it.
+
+SNAPSHOT_CACHE_ALIAS = 'product_snapshots'
+SNAPSHOT_KEY_PREFIX = 'product_management:snapshot:'
+
+
+class SnapshotStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def add(self, hits=0, misses=0, invalidations=0):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+            self.invalidations += invalidations
+
+    def summary(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+snapshot_stats = SnapshotStats()
+
+
+def snapshot_cache():
+    return caches[SNAPSHOT_CACHE_ALIAS]
+
+
+def snapshot_key(sn):
+    return f'{SNAPSHOT_KEY_PREFIX}{sn}'
+
+
+def snapshot_queries(sn):
+    product = Product.objects.select_related('category', 'current_status', 'current_task', 'location').filter(SN=sn)
+    active_tasks = ProductTask.objects.filter(
+        product_id=sn, is_completed=False, is_skipped=False
+    ).select_related('task', 'status').order_by('sequence', 'created')
+    return product, active_tasks
+
+
+def snapshot_data(product, active_tasks):
+    return {
+        'SN': product.SN,
+        'category': {'id': product.category_id, 'name': product.category.name},
+        'priority_level': product.priority_level,
+        'priority_level_display': product.get_priority_level_display(),
+        'description': product.description,
+        'current_status': {
+            'id': product.current_status.pk,
+            'name': product.current_status.name,
+            'is_closed': product.current_status.is_closed,
+        } if product.current_status else None,
+        'current_task': {
+            'id': product.current_task.pk,
+            'action': product.current_task.action,
+        } if product.current_task else None,
+        'location': str(product.location) if product.location else None,
+        'claimed_by': product.claimed_by,
+        'claimed_until': product.claimed_until,
+        'created': product.created,
+        'modified': product.modified,
+        'active_tasks': [
+            {
+                'id': product_task.pk,
+                'task_id': product_task.task_id,
+                'action': product_task.task.action,
+                'description': product_task.task.description,
+                'status': product_task.status.name if product_task.status else None,
+                'sequence': product_task.sequence,
+                'result': product_task.result,
+                'note': product_task.note,
+                'is_predefined': product_task.is_predefined,
+                'modified': product_task.modified,
+            }
+            for product_task in active_tasks
+        ],
+    }
+
+
+def build_product_snapshot(sn):
+    product, active_tasks = snapshot_queries(sn)
+    product = product.first()
+    if product is None:
+        return None
+    return snapshot_data(product, active_tasks)
+
+
+async def abuild_product_snapshot(sn):
+    product, active_tasks = snapshot_queries(sn)
+    product = await product.afirst()
+    if product is None:
+        return None
+    return snapshot_data(product, [product_task async for product_task in active_tasks])
+
+
+#the snapshot dict of the product, None when there is no such product (which is not cached)
+def get_product_snapshot(sn):
+    cache = snapshot_cache()
+    snapshot = cache.get(snapshot_key(sn))
+    if snapshot is not None:
+        snapshot_stats.add(hits=1)
+        return snapshot
+    snapshot_stats.add(misses=1)
+    snapshot = build_product_snapshot(sn)
+    if snapshot is not None:
+        cache.set(snapshot_key(sn), snapshot)
+    return snapshot
+
+
+#get_product_snapshot for async views, with the async cache and ORM calls instead of a worker thread
+async def aget_product_snapshot(sn):
+    cache = snapshot_cache()
+    snapshot = await cache.aget(snapshot_key(sn))
+    if snapshot is not None:
+        snapshot_stats.add(hits=1)
+        return snapshot
+    snapshot_stats.add(misses=1)
+    snapshot = await abuild_product_snapshot(sn)
+    if snapshot is not None:
+        await cache.aset(snapshot_key(sn), snapshot)
+    return snapshot
+
+
+#the active task the product is working on, from the snapshot
+def current_task_snapshot(snapshot):
+    if snapshot['current_task'] is None:
+        return None
+    return next(
+        (task for task in snapshot['active_tasks'] if task['task_id'] == snapshot['current_task']['id']), None
+    )
+
+
+def invalidate_product_snapshots(sns):
+    keys = [snapshot_key(sn) for sn in sns]
+    if not keys:
+        return
+    snapshot_stats.add(invalidations=len(keys))
+    snapshot_cache().delete_many(keys)
+    transaction.on_commit(lambda: snapshot_cache().delete_many(keys))
+
+
+def invalidate_product_snapshot(sn):
+    invalidate_product_snapshots([sn])
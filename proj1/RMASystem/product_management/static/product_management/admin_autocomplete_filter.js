@@ -0,0 +1,16 @@
+// Applies the choice of an AutocompleteFilter (admin_filters.py): reloads the changelist with the filter
+// parameter set to the chosen row, or removed when the choice is cleared, and starts again from the first page.
+(function ($) {
+    'use strict';
+
+    $(document).on('change', 'select[data-filter-parameter]', function () {
+        var params = new URLSearchParams(window.location.search);
+        params.delete(this.dataset.filterParameter);
+        params.delete(this.dataset.filterClear);
+        params.delete('p');
+        if (this.value) {
+            params.set(this.dataset.filterParameter, this.value);
+        }
+        window.location.search = params.toString();
+    });
+})(django.jQuery);
@@ -0,0 +1,100 @@
+// Turns every <select data-autocomplete-url> into a search box over its autocomplete endpoint.
+// The endpoint answers ?q=<prefix>&cursor=<cursor> with {"results": [{"id", "text"}], "next_cursor"}, a "More"
+// button after the select fetches the next page while there is one.
+(function () {
+    'use strict';
+
+    function setOptions(select, results, keepSelected) {
+        var selected = keepSelected ? select.querySelector('option:checked') : null;
+        select.innerHTML = '';
+        var empty = document.createElement('option');
+        empty.value = '';
+        empty.textContent = '---------';
+        select.appendChild(empty);
+        if (selected && selected.value) {
+            select.appendChild(selected);
+        }
+        addOptions(select, results);
+    }
+
+    // the options of a further page, skipping the ones already listed (the kept selection)
+    function addOptions(select, results) {
+        results.forEach(function (result) {
+            if (select.querySelector('option[value="' + CSS.escape(String(result.id)) + '"]')) {
+                return;
+            }
+            var option = document.createElement('option');
+            option.value = result.id;
+            option.textContent = result.text;
+            select.appendChild(option);
+        });
+    }
+
+    function fetchPage(select, query, cursor) {
+        var url = select.dataset.autocompleteUrl + '?q=' + encodeURIComponent(query);
+        if (cursor) {
+            url += '&cursor=' + encodeURIComponent(cursor);
+        }
+        return fetch(url, {headers: {'Accept': 'application/json'}})
+            .then(function (response) { return response.json(); });
+    }
+
+    function attach(select) {
+        var input = document.createElement('input');
+        var more = document.createElement('button');
+        var timer = null;
+        var query = '';
+        var nextCursor = null;
+        input.type = 'search';
+        input.placeholder = 'Type to search';
+        select.parentNode.insertBefore(input, select);
+        more.type = 'button';
+        more.textContent = 'More';
+        more.hidden = true;
+        select.parentNode.insertBefore(more, select.nextSibling);
+
+        function setCursor(cursor) {
+            nextCursor = cursor || null;
+            more.hidden = !nextCursor;
+        }
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                query = input.value.trim();
+                var asked = query;
+                fetchPage(select, asked, null).then(function (data) {
+                    // a later search already replaced this one
+                    if (asked !== query) {
+                        return;
+                    }
+                    setOptions(select, data.results, true);
+                    setCursor(data.next_cursor);
+                });
+            }, 250);
+        });
+
+        more.addEventListener('click', function () {
+            var asked = query;
+            var cursor = nextCursor;
+            if (!cursor) {
+                return;
+            }
+            more.disabled = true;
+            fetchPage(select, asked, cursor).then(function (data) {
+                more.disabled = false;
+                if (asked !== query || cursor !== nextCursor) {
+                    return;
+                }
+                addOptions(select, data.results);
+                setCursor(data.next_cursor);
+            }, function () {
+                more.disabled = false;
+            });
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-autocomplete-url]').forEach(attach);
+    });
+})();
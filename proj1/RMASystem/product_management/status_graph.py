@@ -0,0 +1,97 @@
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Tags, Warning, register
+
+
+#the workflow graph (every Status and the StatusTransitions between them) changes rarely but is read on every
+#transition form, so each process keeps a copy in memory. The copy is tagged with a version token stored in the
+#status_graph cache: saving or deleting a Status or StatusTransition replaces the token, and every worker sharing
+#that cache rebuilds its copy on the next lookup. The cache must be shared by the workers (Redis, Memcached), a
+#LocMemCache is per process and only fits a single process, check --deploy warns about it. MAX_AGE bounds how
+#stale a copy can get when a change bypasses the signals (queryset.update, bulk_create, raw SQL).
+VERSION_CACHE_ALIAS = 'status_graph'
+VERSION_CACHE_KEY = 'product_management:status_graph_version'
+MAX_AGE = 300
+PROCESS_LOCAL_BACKENDS = ('LocMemCache', 'DummyCache')
+
+_lock = threading.Lock()
+_graph = None
+
+
+class StatusGraph:
+    def __init__(self, version, statuses, transitions):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.statuses = {status.pk: status for status in statuses}
+        #adjacency lists keep the order in which the transitions were created
+        self.next_status_ids = {}
+        for from_status_id, to_status_id in transitions:
+            self.next_status_ids.setdefault(from_status_id, []).append(to_status_id)
+
+    def is_current(self, version):
+        return self.version == version and time.monotonic() - self.loaded_at < MAX_AGE
+
+    def get_status(self, status_id):
+        return self.statuses.get(status_id)
+
+    def get_possible_next_statuses(self, status_id):
+        return [self.statuses[to_status_id] for to_status_id in self.next_status_ids.get(status_id, [])]
+
+    def can_transition(self, from_status_id, to_status_id):
+        return to_status_id in self.next_status_ids.get(from_status_id, [])
+
+
+def version_cache():
+    return caches[VERSION_CACHE_ALIAS]
+
+
+def get_current_version():
+    cache = version_cache()
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        #first process to look, or the cache was flushed: agree on a fresh token
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def load_status_graph(version):
+    from .models import Status, StatusTransition
+
+    statuses = list(Status.objects.all())
+    transitions = StatusTransition.objects.order_by('created', 'pk').values_list('from_status_id', 'to_status_id')
+    return StatusGraph(version, statuses, list(transitions))
+
+
+def get_status_graph():
+    global _graph
+    version = get_current_version()
+    graph = _graph
+    if graph is None or not graph.is_current(version):
+        with _lock:
+            graph = _graph
+            if graph is None or not graph.is_current(version):
+                graph = _graph = load_status_graph(version)
+    return graph
+
+
+def invalidate_status_graph():
+    global _graph
+    _graph = None
+    version_cache().set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+
+@register(Tags.caches, deploy=True)
+def check_version_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get(VERSION_CACHE_ALIAS, {}).get('BACKEND', '')
+    if backend.rsplit('.', 1)[-1] in PROCESS_LOCAL_BACKENDS:
+        return [Warning(
+            f'The {VERSION_CACHE_ALIAS} cache uses {backend}, which is not shared between processes: a workflow edit '
+            f'in one worker reaches the others only after {MAX_AGE} seconds.',
+            hint='Set RMA_SHARED_CACHE_BACKEND and RMA_SHARED_CACHE_LOCATION to a Redis or Memcached server.',
+            id='product_management.W001',
+        )]
+    return []
@@ -1,3 +1,1120 @@
-from django.test import TestCase
+import csv
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.contrib.auth.models import User
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.utils import timezone
+from .allocator import find_free_location, free_slots, reserve_location
+from .analytics import range_report, refresh_rollups
+from .benchmarks import IDLE_PRODUCTS_PER_REPEAT, compare_with_baseline, run_benchmarks
+from .history import build_status_histories
+from .middleware import UNRESOLVED_URL_NAME, request_stats
+from .forms import LocationForm
+from .pagination import EstimatedCountPaginator, KeysetPaginator
+from .search import fulltext_backend, search_product_tasks, search_products
+from .views import ProductListView
+from .counters import counted_total, counter_drift, reconcile_counters
+from .export import csv_lines, export_products
+from .events import FEED_SETTLE_SECONDS, compact_events, read_feed
+from .models import (
+    Category, Location, Product, ProductEvent, ProductStatus, ProductTask, SearchDocument, Status, StatusDailyRollup,
+    StatusTask, StatusTransition, Task
+)
+from .snapshots import get_product_snapshot, snapshot_stats
+from .utilhelpers import TASK_SEQUENCE_GAP
+from .status_graph import VERSION_CACHE_KEY, check_version_cache, get_status_graph, version_cache
 
-# Create your tests here.
+
+#starts every test from empty caches, the status graph and the product snapshots outlive the rolled back database
+class RMATestCase(TestCase):
+    def setUp(self):
+        for alias in ('default', 'product_snapshots', 'status_graph'):
+            caches[alias].clear()
+        self.category = Category.objects.create(name='GPU')
+        self.sorting = Status.objects.create(name='RMA Sorting')
+        self.testing = Status.objects.create(name='Testing')
+        self.shipped = Status.objects.create(name='Shipped', is_closed=True)
+        StatusTransition.objects.create(from_status=self.sorting, to_status=self.testing)
+        StatusTransition.objects.create(from_status=self.testing, to_status=self.shipped)
+
+    def sn(self, number):
+        return str(1000000000000 + number)
+
+
+#a client of the JSON write endpoints, with CSRF checks on like a real one
+@override_settings(RMA_API_TOKENS=['bench-token'])
+class ApiTestCase(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        self.api = Client(enforce_csrf_checks=True, HTTP_AUTHORIZATION='Token bench-token')
+
+    def post_json(self, url, payload, client=None):
+        return (client or self.api).post(url, json.dumps(payload), content_type='application/json')
+
+
+def at(day, hour=0):
+    return datetime(2024, 1, day, hour, tzinfo=dt_timezone.utc)
+
+
+#the clock of a test, history rows are stamped with it
+def clock(moment):
+    return mock.patch('django.utils.timezone.now', return_value=moment)
+
+
+class StatusRollupTests(RMATestCase):
+    def rollup_rows(self):
+        return sorted(StatusDailyRollup.objects.values_list(
+            'day', 'status_id', 'category_id', 'priority_level', 'entered', 'exited', 'wip',
+            'dwell_avg', 'dwell_p50', 'dwell_p90', 'dwell_p95', 'dwell_max'
+        ))
+
+    def test_incremental_refresh_matches_full_rebuild(self):
+        with clock(at(1, 8)):
+            Product.objects.bulk_intake([{'SN': self.sn(i), 'category': self.category} for i in range(3)])
+        with clock(at(1, 10)):
+            Product.objects.bulk_transition([self.sn(0), self.sn(1)], self.testing)
+            refresh_rollups()
+        #escalated while in Testing, then moved on
+        with clock(at(2, 9)):
+            product = Product.objects.get(SN=self.sn(0))
+            product.priority_level = 'hot'
+            product.save()
+            refresh_rollups()
+        with clock(at(3, 12)):
+            Product.objects.bulk_transition([self.sn(0)], self.shipped)
+            refresh_rollups()
+        with clock(at(5, 12)):
+            refresh_rollups()
+            incremental = self.rollup_rows()
+            refresh_rollups(full=True)
+            self.assertEqual(incremental, self.rollup_rows())
+
+        last_day = StatusDailyRollup.objects.filter(day=at(5).date())
+        self.assertEqual(
+            dict(last_day.filter(wip__gt=0).values_list('status_id', 'wip')),
+            {self.sorting.pk: 1, self.testing.pk: 1}
+        )
+        self.assertFalse(StatusDailyRollup.objects.filter(status=self.testing, priority_level='hot').exists())
+        left_testing = StatusDailyRollup.objects.get(day=at(3).date(), status=self.testing)
+        self.assertEqual((left_testing.priority_level, left_testing.exited), ('normal', 1))
+        self.assertEqual(left_testing.dwell_max, 2 * 86400 + 2 * 3600)
+
+    def test_range_report_percentiles_span_days(self):
+        with clock(at(1)):
+            Product.objects.bulk_intake([{'SN': self.sn(i), 'category': self.category} for i in range(10)])
+        #unit i leaves sorting after 4 * (i + 1) hours, half of them on day 1 and half on day 2
+        for i in range(10):
+            with clock(at(1) + timedelta(hours=(i + 1) * 4)):
+                Product.objects.bulk_transition([self.sn(i)], self.testing)
+        with clock(at(3)):
+            refresh_rollups()
+            report = range_report(at(1).date(), at(2).date(), status='RMA Sorting')
+
+        self.assertEqual(len(report), 1)
+        row = report[0]
+        self.assertEqual((row['entered'], row['exited']), (10, 10))
+        self.assertEqual((row['dwell_hours']['p50'], row['dwell_hours']['p90'], row['dwell_hours']['max']), (20, 36, 40))
+        #no single day has those percentiles
+        self.assertEqual(StatusDailyRollup.objects.filter(status=self.sorting, exited__gt=0).count(), 2)
+
+    def test_report_view_renders_errors(self):
+        response = self.client.get('/analytics/status/?start=x&priority=q')
+        self.assertEqual(response.status_code, 400)
+        self.assertTemplateUsed(response, 'status_analytics.html')
+        self.assertContains(response, 'x is not a date', status_code=400)
+
+
+#the bulk paths are checked against save() on a twin product: same rows, same counters, same events
+class BulkParityTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        self.inspect = Task.objects.create(action='Inspect')
+        self.stress = Task.objects.create(action='Stress Test')
+        self.report = Task.objects.create(action='Report')
+        StatusTask.objects.create(status=self.sorting, task=self.inspect)
+        StatusTask.objects.create(status=self.testing, task=self.stress)
+        StatusTask.objects.create(status=self.testing, task=self.report)
+        Location.create_rack_with_layers_and_spaces('R1', 1, 4)
+        self.slots = list(Location.objects.order_by('space_number'))
+
+    #everything about a product that does not depend on its SN or its slot
+    def state(self, sn):
+        product = Product.all_objects.get(SN=sn)
+        return {
+            'product': (
+                product.current_status_id, product.current_task_id, product.priority_rank, product.claimed_by,
+                product.location_id is None
+            ),
+            'history': list(ProductStatus.objects.filter(product_id=sn).order_by('changed_at', 'pk').values_list(
+                'status_id', 'category_id', 'priority_level'
+            )),
+            'tasks': list(ProductTask.objects.filter(product_id=sn).order_by('sequence', 'created').values_list(
+                'task_id', 'status_id', 'sequence', 'is_predefined', 'is_completed', 'is_skipped'
+            )),
+            'events': [
+                (event.kind, event.payload.get('to_status'), event.payload.get('current_task'))
+                for event in ProductEvent.objects.filter(product_sn=sn).order_by('pk')
+            ],
+        }
+
+    def test_intake_and_transitions_match_save(self):
+        saved = Product(SN=self.sn(0), category=self.category, location=self.slots[0])
+        saved.save()
+        Product.objects.bulk_intake([{'SN': self.sn(1), 'category': self.category, 'location': self.slots[1]}])
+        self.assertEqual(self.state(self.sn(0)), self.state(self.sn(1)))
+        self.assertFalse(Location.objects.filter(pk__in=[self.slots[0].pk, self.slots[1].pk], is_free=True).exists())
+
+        for to_status in (self.testing, self.shipped):
+            saved.current_status = to_status
+            saved.save()
+            self.assertEqual(Product.objects.bulk_transition([self.sn(1)], to_status), {self.sn(1): None})
+            self.assertEqual(self.state(self.sn(0)), self.state(self.sn(1)))
+
+        #a closed status gives the slot back
+        self.assertEqual(Location.objects.filter(is_free=True).count(), 4)
+        self.assertEqual(counter_drift(), {})
+        self.assertEqual(
+            ProductEvent.objects.filter(product_sn=self.sn(1), kind='location_changed').count(),
+            2
+        )
+
+    def test_bulk_transition_reports_refused_moves(self):
+        Product.objects.bulk_intake([{'SN': self.sn(i), 'category': self.category} for i in range(2)])
+        Product.objects.bulk_transition([self.sn(0)], self.testing)
+        results = Product.objects.bulk_transition([self.sn(0), self.sn(1), self.sn(9)], self.testing)
+        self.assertEqual(results, {
+            self.sn(0): 'Product is already in status Testing',
+            self.sn(1): None,
+            self.sn(9): 'Product not found',
+        })
+        results = Product.objects.bulk_transition([self.sn(0)], self.sorting)
+        self.assertEqual(results, {self.sn(0): 'No transition from Testing to RMA Sorting'})
+        self.assertEqual(counter_drift(), {})
+
+    def test_intake_returns_products_ready_to_save(self):
+        product = Product.objects.bulk_intake([{'SN': self.sn(0), 'category': self.category}])[0]
+        product.priority_level = 'hot'
+        product.save()
+        self.assertEqual(ProductStatus.objects.filter(product=product).count(), 1)
+        self.assertEqual(ProductEvent.objects.filter(product_sn=product.SN).count(), 1)
+        self.assertEqual(counter_drift(), {})
+
+
+class WorkQueueTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        Product.objects.bulk_intake([
+            {'SN': self.sn(i), 'category': self.category, 'priority_level': 'hot' if i == 2 else 'normal'}
+            for i in range(3)
+        ])
+
+    def test_claims_are_handed_out_once_by_priority(self):
+        first = Product.objects.claim_next('bench-1', count=2, status=self.sorting)
+        self.assertEqual([product.SN for product in first], [self.sn(2), self.sn(0)])
+        second = Product.objects.claim_next('bench-2', count=2, status=self.sorting)
+        self.assertEqual([product.SN for product in second], [self.sn(1)])
+        self.assertEqual(Product.objects.claim_next('bench-3', status=self.sorting), [])
+
+    def test_expired_claims_go_back_to_the_queue(self):
+        now = timezone.now()
+        with clock(now):
+            Product.objects.claim_next('bench-1', count=3, lease_minutes=1)
+        with clock(now + timedelta(minutes=2)):
+            claimed = Product.objects.claim_next('bench-2')
+        self.assertEqual([product.SN for product in claimed], [self.sn(2)])
+
+    def test_claims_and_releases_reach_the_snapshot(self):
+        self.assertEqual(get_product_snapshot(self.sn(2))['claimed_by'], '')
+        Product.objects.claim_next('bench-1')
+        self.assertEqual(get_product_snapshot(self.sn(2))['claimed_by'], 'bench-1')
+
+        #only the claims of the bench itself are released
+        self.assertEqual(Product.objects.release_claims([self.sn(2)], 'bench-2'), 0)
+        self.assertEqual(Product.objects.release_claims([self.sn(2), self.sn(0)], 'bench-1'), 1)
+        self.assertEqual(get_product_snapshot(self.sn(2))['claimed_by'], '')
+        self.assertEqual(Product.objects.claim_next('bench-2')[0].SN, self.sn(2))
+
+
+class CounterTests(RMATestCase):
+    def test_reconcile_fixes_writes_that_skip_the_counters(self):
+        Product.objects.bulk_intake([{'SN': self.sn(i), 'category': self.category} for i in range(3)])
+        Product(SN=self.sn(3), category=self.category).save()
+        self.assertEqual(counter_drift(), {})
+        self.assertEqual(counted_total(), 4)
+
+        Product.objects.filter(SN=self.sn(0)).update(priority_level='hot')
+        drift = {
+            (self.sorting.pk, 'normal', ''): (4, 3),
+            (self.sorting.pk, 'hot', ''): (0, 1),
+        }
+        self.assertEqual(counter_drift(), drift)
+        self.assertEqual(reconcile_counters(), drift)
+        self.assertEqual(counter_drift(), {})
+        self.assertEqual(counted_total(), 4)
+
+
+class ChangeFeedTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        Product.objects.bulk_intake([{'SN': self.sn(i), 'category': self.category} for i in range(4)])
+        self.events = list(ProductEvent.objects.order_by('pk'))
+        #sequences are not reused after a rollback, so the feed of a test starts after the events before it
+        self.start = self.events[0].pk - 1
+
+    def test_feed_pages_through_events_in_order(self):
+        feed, cursor, has_more = read_feed(self.start, limit=3)
+        self.assertEqual([event.product_sn for event in feed], [self.sn(i) for i in range(3)])
+        self.assertTrue(has_more)
+        feed, cursor, has_more = read_feed(cursor, limit=3)
+        self.assertEqual([event.product_sn for event in feed], [self.sn(3)])
+        self.assertEqual((cursor, has_more), (self.events[-1].pk, False))
+        self.assertEqual(read_feed(cursor), ([], cursor, False))
+
+    def test_feed_waits_at_a_recent_gap(self):
+        #an event still held by an open transaction looks like a missing sequence
+        self.events[1].delete()
+        feed, cursor, has_more = read_feed(self.start)
+        self.assertEqual(([event.pk for event in feed], cursor), ([self.events[0].pk], self.events[0].pk))
+        self.assertTrue(has_more)
+
+        with clock(timezone.now() + timedelta(seconds=FEED_SETTLE_SECONDS + 1)):
+            feed, cursor, has_more = read_feed(cursor)
+        self.assertEqual([event.pk for event in feed], [event.pk for event in self.events[2:]])
+        self.assertFalse(has_more)
+
+
+class EventCompactionTests(RMATestCase):
+    def log(self, *events):
+        return [ProductEvent.objects.create(product_sn=sn, kind=kind, created=created) for sn, kind, created in events]
+
+    def test_compaction_keeps_the_newest_event_of_each_product_and_kind(self):
+        events = self.log(
+            (self.sn(0), 'status_changed', at(1)),
+            (self.sn(0), 'status_changed', at(2)),
+            (self.sn(0), 'task_completed', at(2)),
+            #committed late, with a sequence below older events
+            (self.sn(0), 'status_changed', at(6)),
+            (self.sn(1), 'status_changed', at(3)),
+            (self.sn(0), 'status_changed', at(10)),
+        )
+        self.assertEqual(compact_events(at(5), batch_size=2), 2)
+        self.assertEqual(
+            list(ProductEvent.objects.order_by('pk').values_list('pk', flat=True)),
+            [event.pk for event in events[2:]]
+        )
+        self.assertEqual(compact_events(at(5)), 0)
+
+    def test_compaction_leaves_recent_events_to_gap_settling(self):
+        now = timezone.now()
+        events = self.log(
+            (self.sn(0), 'status_changed', at(1)),
+            (self.sn(0), 'status_changed', at(2)),
+            (self.sn(1), 'status_changed', now),
+            (self.sn(1), 'status_changed', now),
+        )
+        self.assertEqual(compact_events(now + timedelta(days=1)), 1)
+
+        #the old gap is passed at once, the recent events are all still there to read
+        feed, cursor, has_more = read_feed(events[0].pk - 1)
+        self.assertEqual([event.pk for event in feed], [event.pk for event in events[1:]])
+        self.assertEqual((cursor, has_more), (events[-1].pk, False))
+
+
+class ArchiveTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        Location.create_rack_with_layers_and_spaces('R1', 1, 3)
+        Product.objects.bulk_intake([
+            {'SN': self.sn(i), 'category': self.category, 'location': location}
+            for i, location in enumerate(Location.objects.order_by('space_number'))
+        ])
+
+    def test_archive_and_restore(self):
+        Product.objects.claim_next('bench-1', count=3)
+        results = Product.objects.bulk_archive([self.sn(0), self.sn(1), self.sn(9)])
+        self.assertEqual(results, {self.sn(0): None, self.sn(1): None, self.sn(9): 'Product not found'})
+        self.assertEqual(Product.objects.bulk_archive([self.sn(0)]), {self.sn(0): 'Product is already archived'})
+
+        self.assertEqual(list(Product.objects.values_list('SN', flat=True)), [self.sn(2)])
+        self.assertEqual(sorted(Product.archived.values_list('SN', flat=True)), [self.sn(0), self.sn(1)])
+        self.assertEqual(Product.all_objects.count(), 3)
+        self.assertEqual(Product.archived.filter(claimed_by='bench-1').count(), 0)
+        #an archived product keeps its slot
+        self.assertFalse(Location.objects.filter(is_free=True).exists())
+        self.assertEqual((counter_drift(), counted_total()), ({}, 1))
+
+        self.assertEqual(Product.archived.bulk_restore([self.sn(0), self.sn(2)]), {
+            self.sn(0): None, self.sn(2): 'Product is not archived',
+        })
+        self.assertEqual((counter_drift(), counted_total()), ({}, 2))
+        self.assertEqual(
+            list(ProductEvent.objects.filter(product_sn=self.sn(0)).order_by('pk').values_list('kind', flat=True)),
+            ['status_changed', 'location_changed', 'archived', 'restored']
+        )
+
+    def test_bulk_archive_matches_soft_delete(self):
+        Product.objects.get(SN=self.sn(0)).delete()
+        Product.objects.bulk_archive([self.sn(1)])
+        self.assertEqual((counter_drift(), counted_total()), ({}, 1))
+        events = [
+            list(ProductEvent.objects.filter(product_sn=sn, kind='archived').values_list('payload', flat=True))
+            for sn in (self.sn(0), self.sn(1))
+        ]
+        self.assertEqual(len(events[0]), 1)
+        self.assertEqual(events[0][0]['current_status'], events[1][0]['current_status'])
+
+
+#check_query_plans fails when a migration loses the index of a hot query, the suite runs it on the migrated test
+#database
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_their_indexes(self):
+        call_command('check_query_plans', stdout=StringIO())
+
+
+class ApiTokenTests(ApiTestCase):
+    def intake(self, client):
+        return self.post_json('/products/intake/', [{'SN': self.sn(0), 'category': 'GPU'}], client)
+
+    def test_intake_with_token_passes_the_csrf_check(self):
+        response = self.intake(self.api)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['SNs'], [self.sn(0)])
+
+    def test_requests_without_a_valid_token_are_refused(self):
+        for client in (Client(enforce_csrf_checks=True), Client(enforce_csrf_checks=True, HTTP_AUTHORIZATION='Token guess')):
+            self.assertEqual(self.intake(client).status_code, 401)
+        #a session is no substitute, a forged request would carry it too
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        session = Client(enforce_csrf_checks=True)
+        session.force_login(staff)
+        self.assertEqual(self.intake(session).status_code, 401)
+        self.assertFalse(Product.all_objects.exists())
+
+    @override_settings(RMA_API_TOKENS=[])
+    def test_no_tokens_configured_closes_the_api(self):
+        self.assertEqual(self.intake(self.api).status_code, 401)
+
+
+class RackProvisioningTests(TestCase):
+    def test_provisioning_skips_existing_slots(self):
+        self.assertEqual(Location.create_rack_with_layers_and_spaces('R1', 2, 3), (6, 0))
+        results = Location.provision_racks([('R1', 3, 3), ('R2', 1, 2)])
+        self.assertEqual(results, {'R1': (3, 6), 'R2': (2, 0)})
+        self.assertEqual(
+            list(Location.objects.filter(rack_name='R2').values_list('layer_number', 'space_number')),
+            [(1, 1), (1, 2)]
+        )
+
+    def test_command_reads_a_spec_file(self):
+        Location.create_rack_with_layers_and_spaces('R1', 1, 2)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as spec:
+            spec.write('rack_name,num_layers,num_spaces_per_layer\nR1,2,2\nR2,1,4\n')
+        self.addCleanup(os.remove, spec.name)
+        out = StringIO()
+        call_command('provision_racks', spec.name, stdout=out)
+        self.assertIn('R1: created 2 slots, skipped 2 existing slots', out.getvalue())
+        self.assertEqual(Location.objects.count(), 8)
+
+    def test_form_provisions_a_rack_over_existing_slots(self):
+        Location.create_rack_with_layers_and_spaces('R1', 1, 2)
+        #the typed slot already exists, it is not what a provisioning form saves
+        form = LocationForm({
+            'rack_name': 'R1', 'layer_number': 1, 'space_number': 1, 'num_layers': 2, 'num_spaces_per_layer': 2
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        first_slot = form.save()
+        self.assertEqual((form.created_count, form.skipped_count), (2, 2))
+        self.assertEqual((first_slot.layer_number, first_slot.space_number), (1, 1))
+        self.assertTrue(LocationForm({'rack_name': 'R3', 'num_layers': 1, 'num_spaces_per_layer': 1}).is_valid())
+
+    def test_form_validates_a_single_slot(self):
+        Location.create_rack_with_layers_and_spaces('R1', 1, 1)
+        form = LocationForm({'rack_name': 'R1', 'layer_number': 1, 'space_number': 1})
+        self.assertFalse(form.is_valid())
+        self.assertIn('__all__', form.errors)
+        form = LocationForm({'rack_name': 'R1', 'layer_number': 1})
+        self.assertFalse(form.is_valid())
+        self.assertIn('space_number', form.errors)
+        form = LocationForm({'rack_name': 'R1', 'num_layers': 2})
+        self.assertFalse(form.is_valid())
+        form = LocationForm({'rack_name': 'R1', 'layer_number': 1, 'space_number': 2})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(str(form.save()), 'R1 - Layer 1 - Space 2')
+
+
+class KeysetPaginationTests(RMATestCase):
+    ordering = ('priority_rank', 'modified', 'SN')
+
+    def setUp(self):
+        super().setUp()
+        Product.objects.bulk_intake([
+            {'SN': self.sn(i), 'category': self.category, 'priority_level': 'hot' if i % 3 == 0 else 'normal'}
+            for i in range(7)
+        ])
+        #the same modified for every product, so only SN breaks the ties
+        Product.objects.update(modified=at(1))
+        self.expected = list(Product.objects.order_by(*self.ordering).values_list('SN', flat=True))
+
+    def test_cursors_walk_every_row_once(self):
+        paginator = KeysetPaginator(Product.objects.all(), self.ordering, 3)
+        sns = []
+        page = paginator.page()
+        self.assertTrue(page.is_first)
+        while True:
+            sns += [product.SN for product in page]
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_cursor)
+            self.assertFalse(page.is_first)
+        self.assertEqual(sns, self.expected)
+        self.assertEqual(self.expected[:3], [self.sn(0), self.sn(3), self.sn(6)])
+
+    def test_list_view_follows_its_next_link(self):
+        sns = []
+        url = '/products/'
+        with mock.patch.object(ProductListView, 'paginate_by', 3):
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                page = response.context['page_obj']
+                sns += [product.SN for product in page]
+                url = f'/products/?cursor={page.next_cursor}' if page.has_next() else None
+        self.assertEqual(sns, self.expected)
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/products/?cursor=not-a-cursor').status_code, 404)
+
+
+class StatusGraphTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        self.repair = Status.objects.create(name='Repair')
+        StatusTransition.objects.create(from_status=self.testing, to_status=self.repair)
+
+    def next_names(self, status):
+        return [next_status.name for next_status in get_status_graph().get_possible_next_statuses(status.pk)]
+
+    def test_lookups_take_no_queries(self):
+        get_status_graph()
+        with self.assertNumQueries(0):
+            #in the order the transitions were created
+            self.assertEqual(self.next_names(self.testing), ['Shipped', 'Repair'])
+            self.assertEqual(self.testing.get_possible_next_statuses(), [self.shipped, self.repair])
+            self.assertTrue(get_status_graph().can_transition(self.sorting.pk, self.testing.pk))
+            self.assertFalse(get_status_graph().can_transition(self.sorting.pk, self.shipped.pk))
+
+    def test_edits_rebuild_the_graph(self):
+        get_status_graph()
+        StatusTransition.objects.create(from_status=self.repair, to_status=self.testing)
+        self.assertEqual(self.next_names(self.repair), ['Testing'])
+        self.repair.name = 'Bench Repair'
+        self.repair.save()
+        self.assertEqual(self.next_names(self.testing), ['Shipped', 'Bench Repair'])
+        StatusTransition.objects.filter(from_status=self.testing, to_status=self.shipped).get().delete()
+        self.assertEqual(self.next_names(self.testing), ['Bench Repair'])
+
+    def test_version_key_of_another_worker_rebuilds_the_graph(self):
+        graph = get_status_graph()
+        #bulk_create sends no signal, like an edit made in another process
+        StatusTransition.objects.bulk_create([StatusTransition(from_status=self.repair, to_status=self.shipped)])
+        self.assertIs(get_status_graph(), graph)
+        version_cache().set(VERSION_CACHE_KEY, 'set-by-another-worker', timeout=None)
+        self.assertEqual(self.next_names(self.repair), ['Shipped'])
+        self.assertEqual(get_status_graph().version, 'set-by-another-worker')
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        self.assertEqual([warning.id for warning in check_version_cache(None)], ['product_management.W001'])
+        shared = {'status_graph': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_version_cache(None), [])
+
+
+class StatusHistoryTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        self.inspect = Task.objects.create(action='Inspect')
+        StatusTask.objects.create(status=self.sorting, task=self.inspect)
+        StatusTransition.objects.create(from_status=self.testing, to_status=self.sorting)
+
+    def finish_inspection(self, product, result):
+        product.tasks_of_product.get(task=self.inspect, is_completed=False).update_task(is_now_completed=True, result=result)
+
+    #the task rows are stamped by model_utils, which the clock of the tests does not reach, so this runs in real time
+    def test_tasks_are_grouped_by_the_visit_they_were_done_in(self):
+        product = Product(SN=self.sn(0), category=self.category)
+        product.save()
+        Product(SN=self.sn(1), category=self.category).save()
+        self.finish_inspection(product, 'scratched')
+        for status in (self.testing, self.sorting):
+            product.current_status = status
+            product.save()
+        self.finish_inspection(product, 'clean')
+
+        with self.assertNumQueries(2):
+            histories = build_status_histories([self.sn(0), self.sn(1)])
+        visits = histories[self.sn(0)].visits
+        self.assertEqual(
+            [(visit.status.name, [task.result for task in visit.tasks]) for visit in visits],
+            [('RMA Sorting', ['scratched']), ('Testing', []), ('RMA Sorting', ['clean'])]
+        )
+        self.assertEqual([visit.status.name for visit in histories[self.sn(1)].visits], ['RMA Sorting'])
+        self.assertEqual(histories[self.sn(0)].as_text().splitlines(), [
+            f'Product SN: {self.sn(0)}',
+            f'RMA Sorting: Inspect - scratched |  at {visits[0].changed_at}',
+            f'Testing:  at {visits[1].changed_at}',
+            f'RMA Sorting: Inspect - clean |  at {visits[2].changed_at}',
+        ])
+        self.assertEqual(product.list_status_result_history(), histories[self.sn(0)].as_text())
+
+
+class BatchTransitionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clean = Task.objects.create(action='Clean')
+        self.stress = Task.objects.create(action='Stress Test')
+        StatusTask.objects.create(status=self.sorting, task=self.clean)
+        StatusTask.objects.create(status=self.testing, task=self.clean)
+        StatusTask.objects.create(status=self.testing, task=self.stress)
+
+    def active_tasks(self, sn):
+        return list(ProductTask.objects.filter(product_id=sn, is_completed=False, is_skipped=False).order_by(
+            'sequence', 'created'
+        ).values_list('task_id', 'status_id'))
+
+    def test_a_task_still_active_is_kept_on_both_paths(self):
+        saved = Product(SN=self.sn(0), category=self.category)
+        saved.save()
+        Product.objects.bulk_intake([{'SN': self.sn(1), 'category': self.category}])
+        saved.current_status = self.testing
+        saved.save()
+        response = self.post_json('/products/transition/', {'SNs': [self.sn(1)], 'to_status': 'Testing'})
+        self.assertEqual(response.json()['results'], {self.sn(1): {'success': True}})
+
+        #Clean of Sorting stays the current task, only Stress Test is added
+        expected = [(self.clean.pk, self.sorting.pk), (self.stress.pk, self.testing.pk)]
+        for sn in (self.sn(0), self.sn(1)):
+            self.assertEqual(self.active_tasks(sn), expected)
+            self.assertEqual(Product.objects.get(SN=sn).current_task_id, self.clean.pk)
+
+    def test_sns_must_be_a_list(self):
+        Product.objects.bulk_intake([{'SN': self.sn(0), 'category': self.category}])
+        requests = [
+            ('/products/transition/', {'SNs': self.sn(0), 'to_status': 'Testing'}),
+            ('/products/transition/', {'SNs': [{'SN': self.sn(0)}], 'to_status': 'Testing'}),
+            ('/products/archive/', {'SNs': self.sn(0)}),
+            ('/queue/release/', {'bench': 'bench-1', 'SNs': self.sn(0)}),
+        ]
+        for url, payload in requests:
+            response = self.post_json(url, payload)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn('SNs must be a list', response.json()['errors']['__all__'][0])
+        self.assertEqual(Product.objects.get(SN=self.sn(0)).current_status, self.sorting)
+
+
+class BenchmarkTests(TestCase):
+    config = {'products': 2 * IDLE_PRODUCTS_PER_REPEAT - 1, 'repeat': 1, 'statuses': 4, 'history_depth': 2}
+
+    def setUp(self):
+        for alias in ('default', 'product_snapshots', 'status_graph'):
+            caches[alias].clear()
+
+    #runs the benchmarks on a dataset that is rolled back afterwards
+    def run_rolled_back(self, config):
+        with transaction.atomic():
+            results = run_benchmarks(config)
+            transaction.set_rollback(True)
+        self.setUp()
+        return results
+
+    def test_bulk_queries_do_not_grow_with_the_batch(self):
+        small = self.run_rolled_back({**self.config, 'intake_batch': 2})
+        self.assertEqual(
+            set(small['results']),
+            {'intake_bulk', 'intake_save', 'task_complete', 'task_skip', 'status_transition', 'batch_transition',
+             'history_render', 'detail_view', 'detail_view_cached', 'list_view', 'admin_changelist',
+             'admin_task_changelist', 'admin_status_changelist'}
+        )
+        #small enough for every bulk_create to be a single INSERT on SQLite too
+        large = self.run_rolled_back({**self.config, 'intake_batch': 20})
+        self.assertEqual(small['results']['intake_bulk']['queries'], large['results']['intake_bulk']['queries'])
+        #the second view of a product is answered from its snapshot
+        self.assertLess(small['results']['detail_view_cached']['queries'], small['results']['detail_view']['queries'])
+
+    def test_too_few_products_for_the_repetitions(self):
+        with self.assertRaisesMessage(ValueError, f'products must be at least {4 * IDLE_PRODUCTS_PER_REPEAT - 1}'):
+            run_benchmarks({**self.config, 'repeat': 2})
+
+    def test_regressions_against_the_baseline(self):
+        baseline = {'config': {'repeat': 1}, 'results': {'intake_bulk': {'queries': 8, 'seconds': 0.01}}}
+        results = {'config': {'repeat': 1}, 'results': {'intake_bulk': {'queries': 9, 'seconds': 0.05}}}
+        self.assertEqual(compare_with_baseline(results, baseline, query_tolerance=1), [])
+        self.assertEqual(compare_with_baseline(results, baseline), ['intake_bulk: 9 queries, baseline 8'])
+        self.assertEqual(
+            compare_with_baseline(results, baseline, query_tolerance=1, time_ratio=2),
+            ['intake_bulk: 0.0500s, baseline 0.0100s']
+        )
+        self.assertEqual(
+            compare_with_baseline({**results, 'config': {'repeat': 2}}, baseline),
+            ['config differs from the baseline, results are not comparable']
+        )
+
+
+@override_settings(MIDDLEWARE=['product_management.middleware.RequestInstrumentationMiddleware', *settings.MIDDLEWARE])
+class RequestInstrumentationTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        request_stats.samples.clear()
+        self.addCleanup(request_stats.samples.clear)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+    def stats(self):
+        with self.assertLogs('product_management.requests'):
+            response = self.client.get('/instrumentation/requests/')
+        return response.json()['views']
+
+    def test_render_time_is_only_reported_for_template_responses(self):
+        with self.assertLogs('product_management.requests') as logs:
+            self.client.get('/products/')
+            self.client.get('/events/')
+        records = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual([record['url_name'] for record in records], ['products', 'product_event_feed'])
+        self.assertIsNotNone(records[0]['template_render_ms'])
+        self.assertIsNone(records[1]['template_render_ms'])
+
+        views = self.stats()
+        self.assertEqual(views['products']['template_responses'], 1)
+        self.assertIsNotNone(views['products']['template_render_ms_avg'])
+        self.assertEqual(
+            (views['product_event_feed']['template_responses'], views['product_event_feed']['template_render_ms_avg']),
+            (0, None)
+        )
+
+    def test_unresolved_paths_share_one_key(self):
+        with self.assertLogs('product_management.requests'):
+            for path in ('/nope/', '/wp-login.php', '/products/x/y/z/'):
+                self.assertEqual(self.client.get(path).status_code, 404)
+        views = self.stats()
+        self.assertEqual(list(views), [UNRESOLVED_URL_NAME])
+        self.assertEqual(views[UNRESOLVED_URL_NAME]['requests'], 3)
+
+
+class ProductEditTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_category = Category.objects.create(name='CPU')
+        Product.objects.bulk_intake([{'SN': self.sn(0), 'category': self.category}])
+        self.product = Product.objects.get(SN=self.sn(0))
+
+    def test_edit_page_renders_the_form_and_history(self):
+        response = self.client.get(f'/products/{self.product.SN}/edit/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'data-autocomplete-url', count=3)
+        self.assertContains(response, 'name="category"', count=1)
+        self.assertContains(response, 'Status: RMA Sorting')
+
+    def test_edit_page_saves_the_form_fields(self):
+        response = self.client.post(f'/products/{self.product.SN}/edit/', {
+            'SN': self.product.SN,
+            'category': self.other_category.pk,
+            'priority_level': 'hot',
+            'description': 'Fan noise',
+            'current_status': self.product.current_status_id,
+            'current_task': '',
+            'location': '',
+        })
+        self.assertRedirects(response, f'/products/{self.product.SN}/')
+        self.product.refresh_from_db()
+        self.assertEqual(
+            (self.product.category, self.product.priority_level, self.product.description),
+            (self.other_category, 'hot', 'Fan noise')
+        )
+
+
+class AutocompleteTests(RMATestCase):
+    def pages(self, url, params):
+        pages = []
+        cursor = None
+        while True:
+            response = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            pages.append([result['text'] for result in page['results']])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_next_cursor_walks_every_match_once(self):
+        Task.objects.bulk_create([Task(action=f'Check fan {i:02}') for i in range(45)] + [Task(action='Clean heatsink')])
+        pages = self.pages('/autocomplete/tasks/', {'q': 'Check'})
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), [f'Check fan {i:02}' for i in range(45)])
+
+    def test_locations_page_through_free_slots_only(self):
+        Location.create_rack_with_layers_and_spaces('R1', 3, 10)
+        Location.objects.filter(rack_name='R1', layer_number=1).update(is_free=False)
+        pages = self.pages('/autocomplete/locations/', {'q': 'R1'})
+        self.assertEqual([len(page) for page in pages], [20])
+        self.assertNotIn('R1 - Layer 1 - Space 1', sum(pages, []))
+
+    def test_invalid_cursor_is_a_400(self):
+        response = self.client.get('/autocomplete/statuses/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json()['errors'])
+
+
+class BenchApiTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        StatusTask.objects.create(status=self.sorting, task=Task.objects.create(action='Visual check'))
+        Product.objects.bulk_intake([{'SN': self.sn(0), 'category': self.category}])
+        self.terminal = AsyncClient()
+
+    async def poll(self, path, etag=None):
+        return await self.terminal.get(path, headers={'If-None-Match': etag} if etag else {})
+
+    async def test_unchanged_product_is_not_modified(self):
+        path = f'/api/bench/products/{self.sn(0)}/'
+        response = await self.poll(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['current_task'], 'Visual check')
+
+        hits = snapshot_stats.hits
+        not_modified = await self.poll(path, response['ETag'])
+        self.assertEqual((not_modified.status_code, not_modified.content), (304, b''))
+        self.assertEqual(snapshot_stats.hits, hits + 1)
+
+        product = await Product.objects.aget(SN=self.sn(0))
+        product.description = 'Fan noise'
+        await product.asave()
+        changed = await self.poll(path, response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['description'], 'Fan noise')
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    async def test_task_result_changes_the_current_task_etag(self):
+        path = f'/api/bench/products/{self.sn(0)}/current-task/'
+        response = await self.poll(path)
+        self.assertEqual(response.json()['current_task']['action'], 'Visual check')
+
+        product_task = await ProductTask.objects.aget(product_id=self.sn(0))
+        product_task.note = 'Scratched bracket'
+        await product_task.asave()
+        changed = await self.poll(path, response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['current_task']['note'], 'Scratched bracket')
+        self.assertEqual((await self.poll(path, changed['ETag'])).status_code, 304)
+
+    async def test_unknown_product_is_a_404(self):
+        self.assertEqual((await self.poll(f'/api/bench/products/{self.sn(9)}/')).status_code, 404)
+
+
+class SearchIndexTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        StatusTask.objects.create(status=self.sorting, task=Task.objects.create(action='Visual check'))
+        Product.objects.bulk_intake([
+            {'SN': self.sn(0), 'category': self.category, 'description': 'Fan noise at idle'},
+            {'SN': self.sn(1), 'category': self.category},
+        ])
+
+    def found(self, query):
+        return [product.SN for product in search_products(query)]
+
+    def test_documents_follow_the_description(self):
+        #the sync is what the full-text index is built from, not the fallback scan
+        self.assertEqual(fulltext_backend(connection), 'fts5')
+        self.assertEqual(self.found('fan'), [self.sn(0)])
+
+        product = Product.objects.get(SN=self.sn(1))
+        product.description = 'Artifacts under load'
+        product.save()
+        self.assertEqual(self.found('artifact'), [self.sn(1)])
+
+        product = Product.objects.get(SN=self.sn(0))
+        product.description = 'Coil whine'
+        product.save()
+        self.assertEqual(self.found('fan'), [])
+        self.assertEqual(self.found('coil whine'), [self.sn(0)])
+
+        product.description = ''
+        product.save()
+        self.assertEqual(self.found('coil'), [])
+        self.assertFalse(SearchDocument.objects.filter(product=product, product_task=None).exists())
+
+    def test_documents_follow_task_results_and_notes(self):
+        product_task = ProductTask.objects.get(product_id=self.sn(1))
+        #the placeholder result of an untouched task is not indexed
+        self.assertFalse(SearchDocument.objects.filter(product_task=product_task).exists())
+
+        product_task.update_task(result='Scratched bracket', note='Replace the shroud')
+        self.assertEqual([found.pk for found in search_product_tasks('scratch')], [product_task.pk])
+        self.assertEqual([found.pk for found in search_product_tasks('shroud')], [product_task.pk])
+        self.assertEqual(self.found('bracket'), [self.sn(1)])
+
+        Product.objects.bulk_archive([self.sn(1)])
+        self.assertEqual(search_product_tasks('scratch'), [])
+        self.assertEqual(self.found('bracket'), [])
+
+    def test_sn_prefix_is_a_range_on_the_key(self):
+        self.assertEqual(self.found(self.sn(0)[:12]), [self.sn(0), self.sn(1)])
+        self.assertEqual(self.found(self.sn(1)), [self.sn(1)])
+
+
+class ExportTests(RMATestCase):
+    def setUp(self):
+        super().setUp()
+        StatusTask.objects.create(status=self.sorting, task=Task.objects.create(action='Visual check'))
+        Product.objects.bulk_intake([
+            {'SN': self.sn(0), 'category': self.category},
+            {'SN': self.sn(1), 'category': self.category, 'priority_level': 'hot'},
+            {'SN': self.sn(2), 'category': self.category},
+        ])
+        ProductTask.objects.get(product_id=self.sn(0)).update_task(is_now_completed=True, result='No damage')
+        Product.objects.bulk_transition([self.sn(0)], self.testing)
+
+    def export(self, params):
+        response = self.client.get('/products/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_has_a_row_per_task_and_per_empty_visit(self):
+        rows = list(csv.DictReader(self.export({}).splitlines()))
+        self.assertEqual(
+            [(row['SN'], row['visit_status'], row['task'], row['task_result']) for row in rows[:2]],
+            [(self.sn(0), 'RMA Sorting', 'Visual check', 'No damage'), (self.sn(0), 'Testing', '', '')]
+        )
+        self.assertEqual([row['SN'] for row in rows[2:]], [self.sn(1), self.sn(2)])
+
+    def test_chunks_do_not_change_the_export(self):
+        self.assertEqual(
+            list(csv_lines(export_products(), chunk_size=1)),
+            list(csv_lines(export_products()))
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'products.csv')
+            call_command('export_products', output=path, chunk_size=2, stderr=StringIO())
+            with open(path, newline='', encoding='utf-8') as exported:
+                self.assertEqual(exported.read(), ''.join(csv_lines(export_products())))
+
+    def test_ndjson_filters(self):
+        records = [json.loads(line) for line in self.export({'format': 'ndjson', 'status': 'Testing'}).splitlines()]
+        self.assertEqual([record['SN'] for record in records], [self.sn(0)])
+        self.assertEqual(
+            [(visit['status'], len(visit['tasks'])) for visit in records[0]['history']],
+            [('RMA Sorting', 1), ('Testing', 0)]
+        )
+        records = [json.loads(line) for line in self.export({'format': 'ndjson', 'priority': 'hot'}).splitlines()]
+        self.assertEqual([record['SN'] for record in records], [self.sn(1)])
+
+    def test_bad_parameters_are_a_400(self):
+        for params in ({'format': 'xlsx'}, {'priority': 'urgent'}, {'created_from': '2024-13-01'}, {'created_to': 'May'}):
+            response = self.client.get('/products/export/', params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()['errors']), list(params))
+
+
+class AllocatorTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        Location.create_rack_with_layers_and_spaces('R1', 3, 5)
+        Location.create_rack_with_layers_and_spaces('R2', 1, 2)
+        Product.objects.bulk_intake([{'SN': self.sn(i), 'category': self.category} for i in range(2)])
+
+    def slot(self, rack_name, layer_number, space_number):
+        return Location.objects.get(rack_name=rack_name, layer_number=layer_number, space_number=space_number)
+
+    def taken(self, *slots):
+        Location.objects.filter(pk__in=[slot.pk for slot in slots]).update(is_free=False)
+
+    def test_nearest_space_then_nearest_layer(self):
+        near = self.slot('R1', 2, 3)
+        self.taken(near, self.slot('R1', 2, 4))
+        self.assertEqual(find_free_location(near=near), self.slot('R1', 2, 2))
+
+        self.taken(*Location.objects.filter(rack_name='R1', layer_number=2))
+        self.assertEqual(find_free_location(near=near), self.slot('R1', 3, 1))
+        self.taken(*Location.objects.filter(rack_name='R1', layer_number=3))
+        self.assertEqual(find_free_location(near=near), self.slot('R1', 1, 1))
+
+    def test_full_rack_falls_back_to_rack_name_then_any_rack(self):
+        near = self.slot('R1', 1, 1)
+        self.taken(*Location.objects.filter(rack_name='R1'))
+        self.assertEqual(find_free_location(rack_name='R2', near=near), self.slot('R2', 1, 1))
+        self.assertEqual(find_free_location(near=near), self.slot('R2', 1, 1))
+        self.assertIsNone(find_free_location(rack_name='R1'))
+
+    def test_reserve_never_hands_out_a_slot_twice(self):
+        reserved = [reserve_location(rack_name='R2') for i in range(3)]
+        self.assertEqual(reserved[:2], [self.slot('R2', 1, 1), self.slot('R2', 1, 2)])
+        self.assertIsNone(reserved[2])
+        self.assertFalse(free_slots().filter(rack_name='R2').exists())
+
+    def test_reserve_moves_on_when_another_bench_wins_the_slot(self):
+        def find_then_lose(*args, **kwargs):
+            slot = find_free_location(*args, **kwargs)
+            #another bench reserves it between the read and the UPDATE
+            if not kwargs['exclude']:
+                self.taken(slot)
+            return slot
+
+        with mock.patch('product_management.allocator.find_free_location', side_effect=find_then_lose):
+            self.assertEqual(reserve_location(rack_name='R2'), self.slot('R2', 1, 2))
+
+    def test_assign_endpoint(self):
+        near = self.slot('R1', 1, 3)
+        response = self.post_json(f'/products/{self.sn(0)}/location/', {'near': near.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['location'], str(near))
+        self.assertFalse(Location.objects.get(pk=near.pk).is_free)
+
+        #a new slot frees the old one
+        response = self.post_json(f'/products/{self.sn(0)}/location/', {'rack_name': 'R2'})
+        self.assertEqual(response.json()['location'], str(self.slot('R2', 1, 1)))
+        self.assertTrue(Location.objects.get(pk=near.pk).is_free)
+
+        self.assertEqual(self.post_json(f'/products/{self.sn(1)}/location/', {'near': 'abc'}).status_code, 400)
+        self.assertEqual(self.post_json(f'/products/{self.sn(1)}/location/', {'near': 10 ** 6}).status_code, 400)
+        self.taken(*Location.objects.all())
+        self.assertEqual(self.post_json(f'/products/{self.sn(1)}/location/', {}).status_code, 409)
+
+
+class TaskPlanTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c, self.d, self.x = Task.objects.bulk_create(
+            [Task(action=action) for action in ('Visual check', 'Power on', 'Burn-in', 'Repaste', 'Reflash BIOS')]
+        )
+        for task in (self.a, self.b, self.c):
+            StatusTask.objects.create(status=self.sorting, task=task)
+        Product.objects.bulk_intake([{'SN': self.sn(0), 'category': self.category}])
+        self.product = Product.objects.get(SN=self.sn(0))
+
+    def template(self, status):
+        return list(StatusTask.objects.filter(status=status).order_by('order').values_list('task', 'order', 'is_predefined'))
+
+    def plan(self):
+        return list(self.product.tasks_of_product.order_by('sequence').values_list('task', 'sequence'))
+
+    def test_apply_template_reorders_keeps_and_replaces(self):
+        kept_pks = dict(StatusTask.objects.filter(status=self.sorting).values_list('task', 'pk'))
+        status_tasks = StatusTask.objects.apply_template(
+            self.sorting, [(self.c.pk, True), (self.a.pk, False), (self.d.pk, True)]
+        )
+        self.assertEqual([status_task.task for status_task in status_tasks], [self.c, self.a, self.d])
+        self.assertEqual(
+            self.template(self.sorting),
+            [(self.c.pk, 0, True), (self.a.pk, 1, False), (self.d.pk, 2, True)]
+        )
+        #the rows of the tasks that stay are updated in place
+        self.assertEqual(status_tasks[0].pk, kept_pks[self.c.pk])
+        self.assertEqual(status_tasks[1].pk, kept_pks[self.a.pk])
+        #a product already in the status keeps its plan
+        self.assertEqual([task for task, sequence in self.plan()], [self.a.pk, self.b.pk, self.c.pk])
+
+    def test_apply_template_refuses_bad_entries_without_changes(self):
+        before = self.template(self.sorting)
+        for entries in ([(self.a.pk, True), (self.a.pk, True)], [(self.a.pk, True), (10 ** 6, True)]):
+            with self.assertRaises(ValidationError):
+                StatusTask.objects.apply_template(self.sorting, entries)
+        self.assertEqual(self.template(self.sorting), before)
+
+        response = self.post_json(f'/statuses/{self.testing.pk}/tasks/', {'tasks': [{'task': self.d.pk}]})
+        self.assertEqual(response.json()['tasks'], [{'task': self.d.pk, 'action': 'Repaste', 'is_predefined': True}])
+        self.assertEqual(self.post_json(f'/statuses/{self.testing.pk}/tasks/', {'tasks': [{}]}).status_code, 400)
+
+    def test_insert_takes_a_sequence_between_its_neighbours(self):
+        before = self.plan()
+        self.product.insert_task_at_position(self.x, 2)
+        self.assertEqual(
+            self.plan(),
+            [before[0], (self.x.pk, (before[0][1] + before[1][1]) // 2), *before[1:]]
+        )
+
+        self.product.insert_task_at_position(self.d, 99)
+        self.assertEqual(self.plan()[-1], (self.d.pk, before[-1][1] + TASK_SEQUENCE_GAP))
+
+    def test_insert_renumbers_the_plan_when_the_neighbours_are_adjacent(self):
+        for sequence, task in enumerate((self.a, self.b, self.c), 1):
+            self.product.tasks_of_product.filter(task=task).update(sequence=sequence)
+        self.product.insert_task_at_position(self.x, 2)
+        self.assertEqual(self.plan(), [
+            (self.a.pk, TASK_SEQUENCE_GAP),
+            (self.x.pk, 2 * TASK_SEQUENCE_GAP),
+            (self.b.pk, 3 * TASK_SEQUENCE_GAP),
+            (self.c.pk, 4 * TASK_SEQUENCE_GAP),
+        ])
+
+    def test_insert_first_becomes_the_current_task(self):
+        response = self.post_json(f'/products/{self.sn(0)}/tasks/insert/', {'task': self.x.pk, 'position': 1})
+        self.assertEqual(response.json()['current_task'], 'Reflash BIOS')
+
+    def test_insert_refusals(self):
+        self.product.tasks_of_product.get(task=self.a).update_task(is_now_completed=True, result='ok')
+        self.product.refresh_from_db()
+        with self.assertRaises(ValueError):
+            self.product.insert_task_at_position(self.x, 1)
+        with self.assertRaises(ValueError):
+            self.product.insert_task_at_position(self.b, 3)
+
+        response = self.post_json(f'/products/{self.sn(0)}/tasks/insert/', {'task': self.x.pk, 'position': 1})
+        self.assertEqual(list(response.json()['errors']), ['position'])
+        self.assertEqual(self.product.tasks_of_product.count(), 3)
+
+
+class AdminChangelistTests(RMATestCase):
+    urls = (
+        '/admin/product_management/product/',
+        '/admin/product_management/product/?priority_level=hot',
+        '/admin/product_management/product/?q=1000000000',
+        '/admin/product_management/producttask/',
+        '/admin/product_management/producttask/?is_completed__exact=0',
+        '/admin/product_management/productstatus/',
+    )
+
+    def setUp(self):
+        super().setUp()
+        StatusTask.objects.create(status=self.sorting, task=Task.objects.create(action='Visual check'))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def intake(self, start, count):
+        Product.objects.bulk_intake([
+            {'SN': self.sn(i), 'category': self.category, 'priority_level': 'hot' if i % 2 else 'normal'}
+            for i in range(start, start + count)
+        ])
+
+    def changelist_queries(self):
+        counts = {}
+        for url in self.urls:
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            counts[url] = len(context.captured_queries)
+        return counts
+
+    def test_queries_do_not_grow_with_the_tables(self):
+        self.intake(0, 4)
+        small = self.changelist_queries()
+        self.intake(4, 250)
+        Product.objects.bulk_transition([self.sn(i) for i in range(0, 254, 2)], self.testing)
+        self.assertEqual(self.changelist_queries(), small)
+
+    def test_large_unfiltered_product_count_comes_from_the_counters(self):
+        self.intake(0, 4)
+        #beyond count_limit rows the hint is used instead of a capped COUNT
+        with mock.patch.object(EstimatedCountPaginator, 'count_limit', 3), CaptureQueriesContext(connection) as context:
+            response = self.client.get('/admin/product_management/product/')
+        self.assertContains(response, '4 products')
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'COUNT(' in query['sql'] and 'FROM "product_management_product"' in query['sql']
+        ])
@@ -1,14 +1,41 @@
 from django.urls import path
-from .views import ProductListView, ProductDetailView, ProductUpdateView, ProductTaskView, AddTaskView, StatusTransitionView
+from .views import ProductListView, ProductDetailView, ProductUpdateView, ProductTaskView, AddTaskView, StatusTransitionView, ProductBulkIntakeView, ProductBatchTransitionView
+from .views import ProductAutocompleteView, LocationAutocompleteView, TaskAutocompleteView, StatusAutocompleteView
+from .api import BenchProductView, BenchCurrentTaskView, BenchNextStatusesView, BenchQueueView
+from .views import WorkQueueClaimView, WorkQueueReleaseView, RequestStatsView, ProductSearchView, HomeView, ProductExportView, ProductLocationAssignView
+from .views import StatusTemplateView, ProductTaskInsertView, ProductEventFeedView, StatusAnalyticsView, ProductArchiveView
 
 urlpatterns = [
+    path('', HomeView.as_view(), name='home'),
     path('products/', ProductListView.as_view(), name='products'),
+    path('products/intake/', ProductBulkIntakeView.as_view(), name='product_bulk_intake'),
+    path('products/search/', ProductSearchView.as_view(), name='product_search'),
+    path('products/export/', ProductExportView.as_view(), name='product_export'),
+    path('products/transition/', ProductBatchTransitionView.as_view(), name='batch_transition_status'),
+    path('products/archive/', ProductArchiveView.as_view(archive=True), name='product_archive'),
+    path('products/restore/', ProductArchiveView.as_view(archive=False), name='product_restore'),
+    path('queue/claim/', WorkQueueClaimView.as_view(), name='work_queue_claim'),
+    path('queue/release/', WorkQueueReleaseView.as_view(), name='work_queue_release'),
     path('products/<str:sn>/', ProductDetailView.as_view(), name='product_detail'),
     path('products/<str:sn>/edit/', ProductUpdateView.as_view(), name='edit_product'),
+    path('products/<str:sn>/location/', ProductLocationAssignView.as_view(), name='assign_location'),
     path('products/<str:sn>/task/', ProductTaskView.as_view(), name='product_task'),
     path('task/<int:task_id>/edit/', ProductTaskView.as_view(), name='edit_task'),
     path('task/<int:task_id>/skip/', ProductTaskView.as_view(), name='skip_task'),
     path('products/<str:sn>/add_task/', AddTaskView.as_view(), name='add_task'),
+    path('products/<str:sn>/tasks/insert/', ProductTaskInsertView.as_view(), name='insert_task'),
+    path('statuses/<int:status_id>/tasks/', StatusTemplateView.as_view(), name='status_template'),
     path('products/<int:product_id>/transition/', StatusTransitionView.as_view(), name='transition_status'),
+    path('autocomplete/products/', ProductAutocompleteView.as_view(), name='product_autocomplete'),
+    path('autocomplete/locations/', LocationAutocompleteView.as_view(), name='location_autocomplete'),
+    path('autocomplete/tasks/', TaskAutocompleteView.as_view(), name='task_autocomplete'),
+    path('autocomplete/statuses/', StatusAutocompleteView.as_view(), name='status_autocomplete'),
+    path('api/bench/products/<str:sn>/', BenchProductView.as_view(), name='bench_product'),
+    path('api/bench/products/<str:sn>/current-task/', BenchCurrentTaskView.as_view(), name='bench_current_task'),
+    path('api/bench/products/<str:sn>/next-statuses/', BenchNextStatusesView.as_view(), name='bench_next_statuses'),
+    path('api/bench/queue/', BenchQueueView.as_view(), name='bench_queue'),
+    path('events/', ProductEventFeedView.as_view(), name='product_event_feed'),
+    path('analytics/status/', StatusAnalyticsView.as_view(), name='status_analytics'),
+    path('instrumentation/requests/', RequestStatsView.as_view(), name='request_stats'),
     # Other URL patterns
 ]
@@ -9,6 +9,30 @@ PRIORITY_LEVEL_CHOICES = Choices(
     ('zfa', 'ZFA')
 )
 
+#sortable ordinal of each priority level, the most urgent first (zfa > hot > normal)
+PRIORITY_LEVEL_RANKS = {
+    PRIORITY_LEVEL_CHOICES.zfa: 0,
+    PRIORITY_LEVEL_CHOICES.hot: 1,
+    PRIORITY_LEVEL_CHOICES.normal: 2,
+}
+
+#how long a bench keeps the units it claimed from the work queue before they are offered to others again
+WORK_QUEUE_LEASE_MINUTES = 30
+
+#spacing of ProductTask.sequence in a product's plan, a task inserted later takes a number between its neighbours
+TASK_SEQUENCE_GAP = 1024
+
+#kinds of ProductEvent, the product lifecycle changes published on the change feed
+EVENT_KIND_CHOICES = Choices(
+    ('status_changed', 'Status changed'),
+    ('location_changed', 'Location changed'),
+    ('task_completed', 'Task completed'),
+    ('task_skipped', 'Task skipped'),
+    ('task_updated', 'Task updated'),
+    ('archived', 'Archived'),
+    ('restored', 'Restored'),
+)
+
 STATUS_CHOICES = Choices(
     ('new', 'New'),
     ('in_progress', 'In Progress'),
@@ -1,15 +1,59 @@
+import csv
+import hmac
+import io
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render, get_object_or_404, redirect
-from django.views.generic import View, DetailView, ListView, UpdateView, CreateView, FormView
+from django.views.generic import View, DetailView, ListView, UpdateView, CreateView, FormView, TemplateView
 from django.urls import reverse_lazy
 from .models import Product, ProductTask, Category, Task, Location
 from .forms import ProductForm, ProductTaskForm, TaskForm, LocationForm
-from .models import Product, Status, StatusTransition
+from .models import Product, Status, StatusTransition, StatusTask
 from .forms import StatusTransitionForm
+from .pagination import KeysetPaginator
+from .history import build_status_histories
+from .middleware import request_stats
+from .search import search_products, search_product_tasks, is_sn_prefix, sn_prefix_q, prefix_range_q
+from .counters import dashboard_counts
+from .allocator import assign_location, free_slots
+from .snapshots import get_product_snapshot, current_task_snapshot, snapshot_stats
+from .export import EXPORT_FORMATS, EXPORT_WRITERS, export_products, parse_export_filters
+from .events import FEED_BATCH_SIZE, FEED_MAX_BATCH_SIZE, event_data, read_feed
+from .analytics import parse_report_filters, range_report, rollup_report, rollup_data
+from .utilhelpers import PRIORITY_LEVEL_CHOICES
+
+#floor dashboard, read from the materialized counters instead of counting products
+class HomeView(TemplateView):
+    template_name = 'home.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['dashboard'] = dashboard_counts()
+        return context
 
 class ProductListView(ListView):
     model = Product
     template_name = 'products.html'
     context_object_name = 'products'
+    paginate_by = 50
+    ordering = ('priority_rank', 'modified', 'SN')
+
+    def get_queryset(self):
+        return Product.objects.select_related('category', 'current_status', 'current_task', 'location')
+
+    #keyset pagination keeps deep pages as cheap as the first one, the cursor comes from the previous page
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.ordering, page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except ValueError as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_next()
 
 class ProductDetailView(DetailView):
     model = Product
@@ -18,6 +62,29 @@ class ProductDetailView(DetailView):
     slug_field = 'SN'
     slug_url_kwarg = 'sn'
 
+    #the product comes from the snapshot cache, see snapshots.py
+    def get_object(self, queryset=None):
+        snapshot = get_product_snapshot(self.kwargs[self.slug_url_kwarg])
+        if snapshot is None:
+            raise Http404(f'No product with SN {self.kwargs[self.slug_url_kwarg]}')
+        return snapshot
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['history'] = build_status_histories([self.object['SN']])[self.object['SN']]
+        return context
+
+#one search box for SN prefixes and the text of descriptions, task results and notes
+class ProductSearchView(View):
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        context = {
+            'query': query,
+            'products': search_products(query) if query else [],
+            'product_tasks': search_product_tasks(query) if query else [],
+        }
+        return render(request, 'product_search.html', context)
+
 class ProductUpdateView(UpdateView):
     model = Product
     form_class = ProductForm
@@ -27,8 +94,8 @@ class ProductUpdateView(UpdateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
-        context['status_results'] = ResultOfStatus.objects.filter(product=self.object).prefetch_related('tasks').order_by('-created_at')
+        #the visits of the product with their tasks, grouped like on the detail page
+        context['history'] = build_status_histories([self.object])[self.object.SN]
         return context
 
     def get_success_url(self):
@@ -36,8 +103,12 @@ class ProductUpdateView(UpdateView):
 
 class ProductTaskView(View):
     def get(self, request, sn):
-        product = get_object_or_404(Product, SN=sn)
-        ongoing_task = ProductTask.objects.filter(product=product, is_completed=False).first()
+        product = get_product_snapshot(sn)
+        if product is None:
+            raise Http404(f'No product with SN {sn}')
+        #the form edits the task row itself, the snapshot tells which one without searching the plan
+        ongoing = current_task_snapshot(product) or next(iter(product['active_tasks']), None)
+        ongoing_task = ProductTask.objects.filter(pk=ongoing['id']).first() if ongoing else None
         form = ProductTaskForm(instance=ongoing_task)
         return render(request, 'product_task.html', {'form': form, 'product': product, 'ongoing_task': ongoing_task})
 
@@ -101,4 +172,402 @@ class StatusTransitionView(FormView):
         self.product.current_status = new_status
         self.product.save()
 
-        return redirect('product_detail', pk=self.product.pk)
\ No newline at end of file
+        return redirect('product_detail', pk=self.product.pk)
+
+
+def has_api_token(request):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme == 'Token' and any(
+        hmac.compare_digest(token.encode(), api_token.encode()) for api_token in settings.RMA_API_TOKENS
+    )
+
+
+#the JSON write endpoints are called by scripts and bench terminals, no page of the app posts to them, so there is
+#no form to take a CSRF token from: they are exempt from CSRF and take an API token instead,
+#"Authorization: Token <token>" with one of settings.RMA_API_TOKENS. A browser never adds that header by itself,
+#so a request forged from another site gets a 401 like any other request without it
+@method_decorator(csrf_exempt, name='dispatch')
+class ApiView(View):
+    def dispatch(self, request, *args, **kwargs):
+        if not has_api_token(request):
+            return JsonResponse(
+                {'errors': {'__all__': ['A valid API token is required (Authorization: Token <token>)']}}, status=401
+            )
+        return super().dispatch(request, *args, **kwargs)
+
+
+#the SNs of a JSON body: a list of serial numbers, a string would be read one character at a time
+def read_sns(payload):
+    sns = payload['SNs']
+    if not isinstance(sns, list) or not all(isinstance(sn, (str, int)) and not isinstance(sn, bool) for sn in sns):
+        raise TypeError('SNs must be a list of serial numbers')
+    return [str(sn).strip() for sn in sns]
+
+
+class ProductBulkIntakeView(ApiView):
+    #accepts a CSV upload in the 'file' field, or a JSON list of products as the request body
+    #every row needs SN and category (by name), priority_level and description are optional
+    intake_fields = ('SN', 'category', 'priority_level', 'description')
+
+    def post(self, request):
+        try:
+            rows = self.parse_rows(request)
+        except (ValueError, KeyError, TypeError, AttributeError, csv.Error) as e:
+            return JsonResponse({'errors': {'__all__': [f'Could not read the uploaded products: {e}']}}, status=400)
+
+        category_names = {row['category'] for row in rows}
+        categories = {category.name: category for category in Category.objects.filter(name__in=category_names)}
+        unknown_categories = category_names - categories.keys()
+        if unknown_categories:
+            return JsonResponse({'errors': {'category': [f'Unknown category {name}' for name in sorted(unknown_categories)]}}, status=400)
+        for row in rows:
+            row['category'] = categories[row['category']]
+
+        try:
+            products = Product.objects.bulk_intake(rows)
+        except ValidationError as e:
+            return JsonResponse({'errors': e.message_dict}, status=400)
+
+        return JsonResponse({
+            'created': len(products),
+            'status': products[0].current_status.name if products else None,
+            'SNs': [product.SN for product in products],
+        }, status=201)
+
+    def parse_rows(self, request):
+        upload = request.FILES.get('file')
+        if upload is not None:
+            records = list(csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig')))
+        else:
+            records = json.loads(request.body)
+            if isinstance(records, dict):
+                records = records['products']
+
+        rows = []
+        for record in records:
+            row = {field: str(record[field]).strip() for field in self.intake_fields if record.get(field)}
+            if 'SN' not in row or 'category' not in row:
+                raise ValueError('every row needs an SN and a category')
+            rows.append(row)
+        return rows
+
+
+class ProductBatchTransitionView(ApiView):
+    #moves a pallet of products at once, the JSON body is {"SNs": [...], "to_status": "<status name>"}
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+            sns = read_sns(payload)
+            to_status_name = payload['to_status']
+        except (ValueError, KeyError, TypeError) as e:
+            return JsonResponse({'errors': {'__all__': [f'Could not read the batch transition: {e}']}}, status=400)
+
+        to_status = Status.objects.filter(name=to_status_name).first()
+        if to_status is None:
+            return JsonResponse({'errors': {'to_status': [f'Unknown status {to_status_name}']}}, status=400)
+
+        results = Product.objects.bulk_transition(sns, to_status)
+        return JsonResponse({
+            'to_status': to_status.name,
+            'moved': sum(error is None for error in results.values()),
+            'results': {
+                sn: {'success': True} if error is None else {'success': False, 'error': error}
+                for sn, error in results.items()
+            },
+        })
+
+
+class ProductArchiveView(ApiView):
+    #archives (archive=True) or restores a batch of products, the JSON body is {"SNs": [...]}, see ProductArchiveMixin
+    archive = True
+
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+            sns = read_sns(payload)
+        except (ValueError, KeyError, TypeError) as e:
+            return JsonResponse({'errors': {'__all__': [f'Could not read the batch: {e}']}}, status=400)
+
+        if self.archive:
+            results = Product.live.bulk_archive(sns)
+        else:
+            results = Product.archived.bulk_restore(sns)
+        return JsonResponse({
+            'archived' if self.archive else 'restored': sum(error is None for error in results.values()),
+            'results': {
+                sn: {'success': True} if error is None else {'success': False, 'error': error}
+                for sn, error in results.items()
+            },
+        })
+
+
+def product_summary(product):
+    return {
+        'SN': product.SN,
+        'category': product.category.name,
+        'priority_level': product.priority_level,
+        'current_status': product.current_status.name if product.current_status else None,
+        'current_task': product.current_task.action if product.current_task else None,
+        'location': str(product.location) if product.location else None,
+        'claimed_by': product.claimed_by,
+        'claimed_until': product.claimed_until,
+    }
+
+
+class WorkQueueClaimView(ApiView):
+    #a bench pulls its next units, the JSON body is {"bench": "...", "count": 1, "status": "<name>", "task": <id>}
+    #status and task are optional filters of the queue
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+            bench = str(payload['bench']).strip()
+            count = int(payload.get('count', 1))
+            task_id = int(payload['task']) if payload.get('task') else None
+        except (ValueError, KeyError, TypeError) as e:
+            return JsonResponse({'errors': {'__all__': [f'Could not read the queue request: {e}']}}, status=400)
+        if not bench or not 1 <= count <= 100:
+            return JsonResponse({'errors': {'__all__': ['bench is required and count must be between 1 and 100']}}, status=400)
+
+        status = task = None
+        if payload.get('status'):
+            status = Status.objects.filter(name=payload['status']).first()
+            if status is None:
+                return JsonResponse({'errors': {'status': [f'Unknown status {payload["status"]}']}}, status=400)
+        if task_id is not None:
+            task = Task.objects.filter(pk=task_id).first()
+            if task is None:
+                return JsonResponse({'errors': {'task': [f'Unknown task {task_id}']}}, status=400)
+
+        products = Product.objects.claim_next(bench, count=count, status=status, task=task)
+        return JsonResponse({'bench': bench, 'products': [product_summary(product) for product in products]})
+
+
+class ProductLocationAssignView(ApiView):
+    #gives the product the nearest free slot, the JSON body is {"rack_name": "<name>", "near": <location id>},
+    #both optional: near picks the slot closest to that one, rack_name the first free slot of that rack (also when
+    #the rack of near is full), else the first free slot of any rack
+    def post(self, request, sn):
+        product = get_object_or_404(Product.objects.select_related('current_status'), SN=sn)
+        try:
+            payload = json.loads(request.body or '{}')
+            rack_name = payload.get('rack_name') or None
+            near_id = int(payload['near']) if payload.get('near') is not None else None
+        except (ValueError, AttributeError, TypeError) as e:
+            return JsonResponse({'errors': {'__all__': [f'Could not read the location request: {e}']}}, status=400)
+        if product.current_status and product.current_status.is_closed:
+            return JsonResponse({'errors': {'__all__': ['A product in a closed status has no location']}}, status=400)
+
+        near = None
+        if near_id is not None:
+            near = Location.objects.filter(pk=near_id).first()
+            if near is None:
+                return JsonResponse({'errors': {'near': [f'Unknown location {near_id}']}}, status=400)
+
+        location = assign_location(product, rack_name=rack_name, near=near)
+        if location is None:
+            return JsonResponse({'errors': {'__all__': ['No free location left']}}, status=409)
+        return JsonResponse(product_summary(product))
+
+
+class WorkQueueReleaseView(ApiView):
+    #a bench gives units back to the queue, the JSON body is {"bench": "...", "SNs": [...]}
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+            bench = str(payload['bench']).strip()
+            sns = read_sns(payload)
+        except (ValueError, KeyError, TypeError) as e:
+            return JsonResponse({'errors': {'__all__': [f'Could not read the release request: {e}']}}, status=400)
+
+        released = Product.objects.release_claims(sns, bench)
+        return JsonResponse({'bench': bench, 'released': released})
+
+
+def status_template_summary(status, status_tasks):
+    return {
+        'status': status.name,
+        'tasks': [
+            {'task': status_task.task_id, 'action': status_task.task.action, 'is_predefined': status_task.is_predefined}
+            for status_task in status_tasks
+        ],
+    }
+
+
+#the workflow template editor: GET gives the ordered tasks of the status, POST replaces them in one go, the JSON
+#body is {"tasks": [{"task": <id>, "is_predefined": true}, ...]} in the new order (is_predefined defaults to true)
+class StatusTemplateView(ApiView):
+    def get(self, request, status_id):
+        status = get_object_or_404(Status, pk=status_id)
+        status_tasks = status.status_tasks.select_related('task').order_by('order')
+        return JsonResponse(status_template_summary(status, status_tasks))
+
+    def post(self, request, status_id):
+        status = get_object_or_404(Status, pk=status_id)
+        try:
+            payload = json.loads(request.body)
+            entries = [(int(entry['task']), bool(entry.get('is_predefined', True))) for entry in payload['tasks']]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return JsonResponse({'errors': {'__all__': [f'Could not read the task template: {e}']}}, status=400)
+
+        try:
+            status_tasks = StatusTask.objects.apply_template(status, entries)
+        except ValidationError as e:
+            return JsonResponse({'errors': e.message_dict}, status=400)
+        return JsonResponse(status_template_summary(status, status_tasks))
+
+
+class ProductTaskInsertView(ApiView):
+    #adds a task to this product's plan only, the JSON body is {"task": <id>, "position": <n>}, position 1 is the
+    #first task of the current status and a position past the end appends
+    def post(self, request, sn):
+        product = get_object_or_404(Product.objects.select_related('current_status'), SN=sn)
+        try:
+            payload = json.loads(request.body)
+            task_id = int(payload['task'])
+            position = int(payload['position'])
+        except (ValueError, KeyError, TypeError) as e:
+            return JsonResponse({'errors': {'__all__': [f'Could not read the task insertion: {e}']}}, status=400)
+
+        task = Task.objects.filter(pk=task_id).first()
+        if task is None:
+            return JsonResponse({'errors': {'task': [f'Unknown task {task_id}']}}, status=400)
+        try:
+            product.insert_task_at_position(task, position)
+        except ValueError as e:
+            return JsonResponse({'errors': {'position': [str(e)]}}, status=400)
+        return JsonResponse(product_summary(product))
+
+
+#the change feed of product events for downstream systems: events/?after=<sequence>&limit=<n> gives the events after
+#that sequence in order, and the cursor to send as after for the next batch, see events.py
+class ProductEventFeedView(View):
+    def get(self, request):
+        try:
+            after = int(request.GET.get('after', 0))
+            limit = int(request.GET.get('limit', FEED_BATCH_SIZE))
+        except ValueError:
+            return JsonResponse({'errors': {'__all__': ['after and limit must be integers']}}, status=400)
+        if after < 0 or not 1 <= limit <= FEED_MAX_BATCH_SIZE:
+            return JsonResponse(
+                {'errors': {'__all__': [f'after must be 0 or more and limit between 1 and {FEED_MAX_BATCH_SIZE}']}},
+                status=400
+            )
+
+        events, cursor, has_more = read_feed(after, limit)
+        return JsonResponse({'events': [event_data(event) for event in events], 'cursor': cursor, 'has_more': has_more})
+
+
+#time spent in each status over a date range and per day, from analytics.py (refresh_status_rollups keeps the daily
+#rollups current), e.g. analytics/status/?status=Testing&priority=hot&start=2024-01-01&end=2024-01-31
+class StatusAnalyticsView(View):
+    def get(self, request):
+        context = {
+            'form': {name: request.GET.get(name, '') for name in ('start', 'end', 'status', 'category', 'priority')},
+            'statuses': Status.objects.order_by('name').values_list('name', flat=True),
+            'categories': Category.objects.order_by('name').values_list('name', flat=True),
+            'priority_levels': PRIORITY_LEVEL_CHOICES,
+        }
+        try:
+            filters = parse_report_filters(request.GET)
+        except ValidationError as e:
+            context['errors'] = e.message_dict
+            return render(request, 'status_analytics.html', context, status=400)
+
+        context['form'].update(start=filters['start'].isoformat(), end=filters['end'].isoformat())
+        context['summary'] = range_report(**filters)
+        context['rollups'] = [rollup_data(rollup) for rollup in rollup_report(**filters)]
+        return render(request, 'status_analytics.html', context)
+
+
+#streams every matching product with its status history and tasks, as CSV (one row per task) or NDJSON
+#(one product per line), e.g. products/export/?format=ndjson&status=Testing&created_from=2024-01-01
+class ProductExportView(View):
+    content_types = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+    def get(self, request):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'errors': {'format': [f'Unknown export format {export_format}']}}, status=400)
+        try:
+            filters = parse_export_filters(request.GET)
+        except ValidationError as e:
+            return JsonResponse({'errors': e.message_dict}, status=400)
+
+        lines = EXPORT_WRITERS[export_format](export_products(**filters))
+        response = StreamingHttpResponse(lines, content_type=self.content_types[export_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{export_format}"'
+        return response
+
+
+#JSON autocomplete of the form widgets: ?q=<prefix> filters on an indexed column with a range, results come in
+#small keyset pages, ?cursor=<next_cursor> continues. Answers {"results": [{"id", "text"}], "next_cursor"}
+class AutocompleteView(View):
+    page_size = 20
+    ordering = ()
+
+    def get_queryset(self, term):
+        raise NotImplementedError
+
+    def label(self, obj):
+        return str(obj)
+
+    def get(self, request):
+        term = request.GET.get('q', '').strip()
+        paginator = KeysetPaginator(self.get_queryset(term), self.ordering, self.page_size)
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except ValueError as e:
+            return JsonResponse({'errors': {'cursor': [str(e)]}}, status=400)
+        return JsonResponse({
+            'results': [{'id': obj.pk, 'text': self.label(obj)} for obj in page],
+            'next_cursor': page.next_cursor,
+        })
+
+class ProductAutocompleteView(AutocompleteView):
+    ordering = ('SN',)
+
+    def get_queryset(self, term):
+        #no only() here, the FieldTracker of Product cannot load deferred fields
+        products = Product.objects.all()
+        if not term:
+            return products
+        return products.filter(sn_prefix_q(term)) if is_sn_prefix(term) else products.none()
+
+    def label(self, product):
+        return product.SN
+
+class LocationAutocompleteView(AutocompleteView):
+    #in the order of location_free_slot_idx
+    ordering = ('rack_name', 'layer_number', 'space_number')
+
+    def get_queryset(self, term):
+        slots = free_slots()
+        return slots.filter(prefix_range_q('rack_name', term)) if term else slots
+
+class TaskAutocompleteView(AutocompleteView):
+    ordering = ('action', 'id')
+
+    def get_queryset(self, term):
+        tasks = Task.objects.only('id', 'action')
+        return tasks.filter(prefix_range_q('action', term)) if term else tasks
+
+    def label(self, task):
+        return task.action
+
+class StatusAutocompleteView(AutocompleteView):
+    ordering = ('name',)
+
+    def get_queryset(self, term):
+        statuses = Status.objects.only('id', 'name')
+        return statuses.filter(prefix_range_q('name', term)) if term else statuses
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class RequestStatsView(View):
+    #rolling per-URL-name latency and query statistics of RequestInstrumentationMiddleware
+    def get(self, request):
+        return JsonResponse({
+            'instrumentation_enabled': settings.RMA_REQUEST_INSTRUMENTATION,
+            'views': request_stats.summary(),
+            'product_snapshots': snapshot_stats.summary(),
+        })
@@ -0,0 +1,37 @@
+from django import forms
+from django.urls import reverse
+
+
+#a select that renders only its selected option and fills the rest from a JSON autocomplete endpoint
+#(see AutocompleteView), so rendering a form costs the same however many rows the field's model has.
+#autocomplete.js turns it into a search box: typing fetches ?q=<prefix> and lists the small page of matches, "More"
+#fetches the next page with the cursor of the last one
+class AutocompleteSelect(forms.Select):
+    def __init__(self, url_name, attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+
+    class Media:
+        js = ['product_management/autocomplete.js']
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-autocomplete-url'] = reverse(self.url_name)
+        return attrs
+
+    #the default asks the first choice, which would run the field's query
+    def use_required_attribute(self, initial):
+        return not self.is_hidden
+
+    #only the selected objects are loaded, with one query on their primary keys
+    def optgroups(self, name, value, attrs=None):
+        selected_values = {str(v) for v in value if v not in ('', None)}
+        options = [self.create_option(name, '', '---------', not selected_values, 0)]
+        if selected_values:
+            field_choices = self.choices
+            for index, obj in enumerate(field_choices.queryset.filter(pk__in=selected_values), start=1):
+                choice_value = field_choices.field.prepare_value(obj)
+                options.append(self.create_option(
+                    name, choice_value, field_choices.field.label_from_instance(obj), True, index, attrs=attrs
+                ))
+        return [(None, options, 0)]